@@ -1,138 +1,543 @@
 import os
 import json
+import time
+import asyncio
+import contextvars
+import httpx
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
-from logger import get_logger
-from token_utils import log_token_usage
-from rag_engine import get_rag_context
+from logger import get_logger, payload_summary
+from token_utils import log_token_usage, usage_from_response, count_tokens
+from code_chunker import iter_code_units
+from sse import iter_sse_events, aiter_sse_events
+from single_flight import SingleFlight, AsyncSingleFlight, StreamFanout, AsyncStreamFanout, flight_stats
+from rag_engine import get_rag_context, embed_text, embed_text_async
+from response_cache import ResponseCache, make_cache_key
+from semantic_cache import SemanticCache
+from euriai_client import (
+    EuriaiClient, EURIAI_MAX_CONNECTIONS, EURIAI_CONNECT_TIMEOUT, EURIAI_READ_TIMEOUT
+)
+from resilience import AdaptiveLimiter, CircuitBreaker, UpstreamGuard
+from metrics import LLM_TTFT, observe_upstream
+from tracing import span, propagation_headers
 
 load_dotenv()
 logger = get_logger("ai_engine", "logs/backend.log")
 
 EURIAI_API_KEY = os.getenv("EURIAI_API_KEY")
-EURIAI_API_URL = "https://api.euron.one/api/v1/euri/alpha/chat/completions"
+EURIAI_API_URL = os.getenv("EURIAI_API_URL", "https://api.euron.one/api/v1/euri/alpha/chat/completions")
+DEFAULT_MODEL = "gpt-4.1-nano"
+
+# Files above MAP_REDUCE_TOKENS are documented/modularized unit by unit, in parallel
+MAP_REDUCE_TOKENS = int(os.getenv("MAP_REDUCE_TOKENS", "3000"))
+MAP_REDUCE_UNIT_TOKENS = int(os.getenv("MAP_REDUCE_UNIT_TOKENS", "1500"))
+MAP_REDUCE_CONCURRENCY = int(os.getenv("MAP_REDUCE_CONCURRENCY", "8"))
 
 HEADERS = {
     "Authorization": f"Bearer {EURIAI_API_KEY}",
     "Content-Type": "application/json"
 }
 
-def call_euriai_api(model: str, messages: list, temperature: float = 0.7, stream: bool = False):
+# One concurrency limit and circuit breaker for every upstream call, sync or async
+upstream_limiter = AdaptiveLimiter()
+upstream_breaker = CircuitBreaker()
+sync_guard = UpstreamGuard(upstream_limiter, upstream_breaker, (requests.ConnectionError, requests.Timeout))
+async_guard = UpstreamGuard(upstream_limiter, upstream_breaker, (httpx.TransportError,))
+sync_guard.observers.append(observe_upstream)
+async_guard.observers.append(observe_upstream)
+
+def upstream_stats() -> dict:
+    return {
+        "sync": sync_guard.counters,
+        "async": async_guard.counters,
+        "limiter": upstream_limiter.stats(),
+        "breaker": upstream_breaker.stats()
+    }
+
+# Keep-alive session for the sync path, pooled client for the async path
+session = requests.Session()
+session.headers.update(HEADERS)
+adapter = HTTPAdapter(pool_connections=1, pool_maxsize=EURIAI_MAX_CONNECTIONS)
+session.mount("https://", adapter)
+session.mount("http://", adapter)
+async_client = EuriaiClient(EURIAI_API_URL, HEADERS, guard=async_guard)
+response_cache = ResponseCache()
+semantic_cache = SemanticCache()
+
+# Identical requests already in flight share one upstream call (or stream)
+SINGLE_FLIGHT = os.getenv("SINGLE_FLIGHT", "true").lower() in ("1", "true", "yes")
+inflight = SingleFlight()
+inflight_async = AsyncSingleFlight()
+stream_fanout = StreamFanout()
+stream_fanout_async = AsyncStreamFanout()
+
+def single_flight_stats() -> dict:
+    return flight_stats(inflight, inflight_async, stream_fanout, stream_fanout_async)
+
+def _payload(model: str, messages: list, temperature: float, stream: bool) -> dict:
     payload = {
         "model": model,
         "messages": messages,
         "temperature": temperature,
         "stream": stream
     }
-    logger.info(f"📡 Sending to Euriai API: {payload}")
-    response = requests.post(EURIAI_API_URL, headers=HEADERS, json=payload, stream=stream)
-    response.raise_for_status()
-    return response
+    if stream:
+        # Ask for a final usage chunk so streamed calls are billed on real counts
+        payload["stream_options"] = {"include_usage": True}
+    return payload
 
-def explain_code(language: str, topic: str, level: str) -> str:
+def _user_messages(prompt: str) -> list:
+    return [{"role": "user", "content": prompt}]
+
+def _message_content(data: dict) -> str:
+    return data["choices"][0]["message"]["content"].strip()
+
+STREAM_DONE = object()
+
+def _stream_event(data: str):
+    """Parse one SSE event payload into (token, usage, model); STREAM_DONE at the end of the stream"""
+    if data.strip() == "[DONE]":
+        return STREAM_DONE
+    token, usage, model = None, None, None
     try:
-        log_token_usage("euriai")
-        prompt = f"You are a coding instructor. Explain the concept '{topic}' in {language} for a {level} level developer. Use markdown with headings, paragraphs, code blocks, and tables."
-        messages = [{"role": "user", "content": prompt}]
-        res = call_euriai_api("gpt-4.1-nano", messages)
-        return res.json()["choices"][0]["message"]["content"].strip()
+        parsed = json.loads(data)
+        usage = parsed.get("usage")
+        model = parsed.get("model")
+        choices = parsed.get("choices") or []
+        delta = choices[0].get("delta") if choices else None
+        if delta and "content" in delta:
+            token = delta["content"]
+    except Exception:
+        logger.warning(f"⚠️ Could not parse stream event: {data[:200]}")
+    return token, usage, model
+
+@span("log_token_usage")
+def _log_usage(task: str, messages: list, data: dict = None, completion: str = ""):
+    prompt_text = "\n".join(m["content"] for m in messages)
+    prompt_tokens, completion_tokens = usage_from_response(data, prompt_text, completion)
+    # Bill the model that answered, which may differ from the one requested
+    model = (data or {}).get("model") or DEFAULT_MODEL
+    log_token_usage(model, prompt_tokens, completion_tokens, endpoint=task)
+
+def _log_payload(action: str, payload: dict):
+    # Payloads carry whole uploaded files; log a bounded summary instead
+    summary = payload_summary(payload)
+    logger.info(f"📡 {action} Euriai API ({summary['model']}, {summary['messages']} messages, "
+                f"{summary['chars']} chars, sha256:{summary['sha256']})", extra={"payload": summary})
+
+@span("llm_call")
+def call_euriai_api(model: str, messages: list, temperature: float = 0.7, stream: bool = False):
+    payload = _payload(model, messages, temperature, stream)
+    _log_payload("Sending to", payload)
+    headers = propagation_headers()
+    return sync_guard.call(
+        lambda: session.post(
+            EURIAI_API_URL, json=payload, stream=stream, headers=headers,
+            timeout=(EURIAI_CONNECT_TIMEOUT, EURIAI_READ_TIMEOUT)
+        ),
+        lambda r: r.close(),
+        # Streams return at the headers; a full completion's duration is mostly generation time
+        latency_signal=stream
+    )
+
+async def call_euriai_api_async(model: str, messages: list, temperature: float = 0.7) -> dict:
+    payload = _payload(model, messages, temperature, False)
+    _log_payload("Sending to", payload)
+    with span("llm_call", model=model):
+        return await async_client.post(payload, propagation_headers())
+
+async def stream_euriai_api_async(model: str, messages: list, temperature: float = 0.7):
+    payload = _payload(model, messages, temperature, True)
+    _log_payload("Streaming from", payload)
+    async for line in async_client.stream_lines(payload, propagation_headers()):
+        yield line
+
+# ---------- Prompts ----------
+def _explain_prompt(language: str, topic: str, level: str) -> str:
+    return f"You are a coding instructor. Explain the concept '{topic}' in {language} for a {level} level developer. Use markdown with headings, paragraphs, code blocks, and tables."
+
+def _explain_stream_prompt(language: str, topic: str, level: str) -> str:
+    return f"Explain '{topic}' in {language} for a {level} level developer. Use markdown formatting: # Headings, ```python code blocks```, tables, and visuals."
+
+def _debug_prompt(language: str, topic: str) -> str:
+    return f"You're a senior developer. Help debug this {language} code issue: {topic}"
+
+def _generate_prompt(language: str, topic: str, level: str) -> str:
+    return f"Generate {level} {language} code for topic: {topic} with best practices and comments."
+
+def _document_prompt(code: str) -> str:
+    return f"Document this code clearly:\n\n{code}"
+
+def _modularize_prompt(code: str) -> str:
+    return f"Refactor this code into modular functions with clear docstrings:\n\n{code}"
+
+def _rag_prompt(context: str, question: str) -> str:
+    return f"Use this context to answer:\n\n{context}\n\nQuestion: {question}"
+
+def _unit_prompt(prompt_fn, unit, number: int, total: int) -> str:
+    meta = unit.metadata
+    return (f"This is part {number} of {total} of a larger file (lines {meta['start_line']}-{meta['end_line']}: "
+            f"{meta['qualname']}). Only handle this part.\n\n" + prompt_fn(unit.text))
+
+# ---------- Map-reduce over large files ----------
+def _map_units(code: str):
+    """AST-level units of a large file, or None when it fits in a single prompt"""
+    if count_tokens(code) <= MAP_REDUCE_TOKENS:
+        return None
+    units = list(iter_code_units(code, MAP_REDUCE_UNIT_TOKENS))
+    return units if len(units) > 1 else None
+
+def _unit_section(number: int, unit, result: str) -> str:
+    meta = unit.metadata
+    return f"### Part {number} — `{meta['qualname']}` (lines {meta['start_line']}-{meta['end_line']})\n\n{result}"
+
+def _stitch(units: list, results: list) -> str:
+    """Per-unit answers in source order, each under a heading naming its lines"""
+    return "\n\n".join(_unit_section(i, unit, result) for i, (unit, result) in enumerate(zip(units, results), 1))
+
+def _map_reduce(task: str, prompt_fn, code: str) -> str:
+    units = _map_units(code)
+    if units is None:
+        return _complete(task, prompt_fn(code))
+    logger.info(f"🗺️ {task}: {len(units)} units, up to {MAP_REDUCE_CONCURRENCY} at a time")
+    # Each unit runs in a copy of the caller's context so its spans join the request's trace
+    context = contextvars.copy_context()
+    with ThreadPoolExecutor(max_workers=MAP_REDUCE_CONCURRENCY) as pool:
+        results = list(pool.map(
+            lambda numbered: context.copy().run(
+                _complete, task, _unit_prompt(prompt_fn, numbered[1], numbered[0], len(units))
+            ),
+            enumerate(units, 1)
+        ))
+    return _stitch(units, results)
+
+async def _map_reduce_async(task: str, prompt_fn, code: str) -> str:
+    units = _map_units(code)
+    if units is None:
+        return await _complete_async(task, prompt_fn(code))
+    logger.info(f"🗺️ {task}: {len(units)} units, up to {MAP_REDUCE_CONCURRENCY} at a time")
+    limit = asyncio.Semaphore(MAP_REDUCE_CONCURRENCY)
+
+    async def run(number: int, unit) -> str:
+        async with limit:
+            return await _complete_async(task, _unit_prompt(prompt_fn, unit, number, len(units)))
+
+    results = await asyncio.gather(*(run(i, unit) for i, unit in enumerate(units, 1)))
+    return _stitch(units, results)
+
+async def _map_reduce_stream_async(task: str, prompt_fn, code: str):
+    """Stream small files token by token; large files yield each unit's section in order as soon as it is ready"""
+    units = _map_units(code)
+    if units is None:
+        async for token in _stream_async(task, prompt_fn(code)):
+            yield token
+        return
+    limit = asyncio.Semaphore(MAP_REDUCE_CONCURRENCY)
+
+    async def run(number: int, unit) -> str:
+        async with limit:
+            return await _complete_async(task, _unit_prompt(prompt_fn, unit, number, len(units)))
+
+    tasks = [asyncio.create_task(run(i, unit)) for i, unit in enumerate(units, 1)]
+    try:
+        for i, (unit, unit_task) in enumerate(zip(units, tasks), 1):
+            yield ("\n\n" if i > 1 else "") + _unit_section(i, unit, await unit_task)
+    finally:
+        for unit_task in tasks:
+            unit_task.cancel()
+
+# ---------- Completion helpers ----------
+def _semantic_match(task: str, semantic, embedding):
+    """Look an embedded request up in the semantic cache; returns (answer, embedding)"""
+    if embedding is None:
+        return None, None
+    endpoint, scope, _ = semantic
+    answer, score = semantic_cache.lookup(endpoint, embedding, scope)
+    if answer is not None:
+        logger.info(f"🧲 Semantic cache hit for {task} (similarity {score:.3f})")
+    return answer, embedding
+
+def _semantic_lookup(task: str, semantic):
+    """Embed the free-text part of a request and look it up; returns (answer, embedding)"""
+    if semantic is None or not semantic_cache.enabled:
+        return None, None
+    try:
+        # Never wait for a cold model on the request path; the cache just misses until it is warm
+        embedding = embed_text(semantic[2], wait=False)
     except Exception as e:
-        logger.exception("❌ Error in explain_code")
-        return f"Error: {e}"
+        logger.warning(f"⚠️ Semantic cache embedding failed: {e}")
+        return None, None
+    return _semantic_match(task, semantic, embedding)
 
-def explain_code_stream(language: str, topic: str, level: str):
+async def _semantic_lookup_async(task: str, semantic):
+    if semantic is None or not semantic_cache.enabled:
+        return None, None
     try:
-        log_token_usage("euriai")
-        prompt = f"Explain '{topic}' in {language} for a {level} level developer. Use markdown formatting: # Headings, ```python code blocks```, tables, and visuals."
-        messages = [{"role": "user", "content": prompt}]
-        res = call_euriai_api("gpt-4.1-nano", messages, stream=True)
-
-        buffer = ""
-        yield "💬 Typing...\n\n"
-        for line in res.iter_lines():
-            if line:
-                decoded = line.decode("utf-8")
-                if decoded.strip().startswith("data: "):
-                    decoded = decoded[6:]
-                if decoded.strip() == "[DONE]":
-                    break
-                try:
-                    parsed = json.loads(decoded)
-                    delta = parsed["choices"][0].get("delta")
-                    if delta and "content" in delta:
-                        token = delta["content"]
-                        buffer += token
-                        yield token
-                except Exception as parse_err:
-                    logger.warning(f"⚠️ Could not parse line: {decoded}")
-                    continue
-        logger.info("✅ Full stream complete")
+        embedding = await embed_text_async(semantic[2])
     except Exception as e:
-        logger.exception("❌ Streaming Explanation Failed")
-        yield f"❌ Error: {e}"
+        logger.warning(f"⚠️ Semantic cache embedding failed: {e}")
+        return None, None
+    return _semantic_match(task, semantic, embedding)
 
-def debug_code(language: str, topic: str) -> str:
+def _remember(key, semantic, embedding, content: str):
+    if key:
+        response_cache.set(key, content)
+    if embedding is not None:
+        endpoint, scope, _ = semantic
+        semantic_cache.store(endpoint, embedding, content, scope)
+
+async def _remember_async(key, semantic, embedding, content: str):
+    if key:
+        await response_cache.set_async(key, content)
+    if embedding is not None:
+        endpoint, scope, _ = semantic
+        semantic_cache.store(endpoint, embedding, content, scope)
+
+# ---------- Upstream calls (coalesced) ----------
+def _flight_key(messages: list, temperature: float) -> str:
+    return make_cache_key(DEFAULT_MODEL, messages, temperature)
+
+def _fetch(task: str, messages: list, temperature: float) -> str:
+    """Completion content from upstream, usage logged once; identical concurrent requests share the call"""
+    def call():
+        data = call_euriai_api(DEFAULT_MODEL, messages, temperature).json()
+        content = _message_content(data)
+        _log_usage(task, messages, data, content)
+        return content
+    if not SINGLE_FLIGHT:
+        return call()
+    return inflight.do(_flight_key(messages, temperature), call)
+
+async def _fetch_async(task: str, messages: list, temperature: float) -> str:
+    async def call():
+        data = await call_euriai_api_async(DEFAULT_MODEL, messages, temperature)
+        content = _message_content(data)
+        _log_usage(task, messages, data, content)
+        return content
+    if not SINGLE_FLIGHT:
+        return await call()
+    return await inflight_async.do(_flight_key(messages, temperature), call)
+
+def _upstream_tokens(task: str, messages: list, temperature: float):
+    """Tokens of one upstream stream; usage is logged when it ends"""
+    parts, usage, model = [], None, None
+    with span("llm_stream", task=task) as streamed:
+        res = call_euriai_api(DEFAULT_MODEL, messages, temperature, stream=True)
+        for data in iter_sse_events(line.decode("utf-8") for line in res.iter_lines()):
+            event = _stream_event(data)
+            if event is STREAM_DONE:
+                break
+            token, usage, model = event[0], event[1] or usage, event[2] or model
+            if token:
+                parts.append(token)
+                yield token
+        streamed.attrs["tokens"] = len(parts)
+    _log_usage(task, messages, {"usage": usage, "model": model}, "".join(parts))
+    logger.info(f"✅ {task} stream complete")
+
+async def _upstream_tokens_async(task: str, messages: list, temperature: float):
+    parts, usage, model = [], None, None
+    with span("llm_stream", task=task) as streamed:
+        async for data in aiter_sse_events(stream_euriai_api_async(DEFAULT_MODEL, messages, temperature)):
+            event = _stream_event(data)
+            if event is STREAM_DONE:
+                break
+            token, usage, model = event[0], event[1] or usage, event[2] or model
+            if token:
+                parts.append(token)
+                yield token
+        streamed.attrs["tokens"] = len(parts)
+    _log_usage(task, messages, {"usage": usage, "model": model}, "".join(parts))
+    logger.info(f"✅ {task} stream complete")
+
+def _complete(task: str, prompt: str, cache: bool = False, semantic=None, temperature: float = 0.7) -> str:
+    """Run one completion, consulting the exact cache and then, if given
+    (endpoint, scope, text), the semantic cache before calling upstream"""
+    messages = _user_messages(prompt)
+    key = make_cache_key(DEFAULT_MODEL, messages, temperature) if cache else None
+    if key:
+        cached = response_cache.get(key)
+        if cached is not None:
+            logger.info(f"⚡ Cache hit for {task}")
+            return cached
+    cached, embedding = _semantic_lookup(task, semantic)
+    if cached is not None:
+        return cached
     try:
-        log_token_usage("euriai")
-        prompt = f"You're a senior developer. Help debug this {language} code issue: {topic}"
-        messages = [{"role": "user", "content": prompt}]
-        res = call_euriai_api("gpt-4.1-nano", messages)
-        return res.json()["choices"][0]["message"]["content"].strip()
+        content = _fetch(task, messages, temperature)
     except Exception as e:
-        logger.exception("❌ Error in debug_code")
+        logger.exception(f"❌ Error in {task}")
         return f"Error: {e}"
+    _remember(key, semantic, embedding, content)
+    return content
 
-def generate_code(language: str, topic: str, level: str) -> str:
+async def _complete_async(task: str, prompt: str, cache: bool = False, semantic=None, temperature: float = 0.7) -> str:
+    messages = _user_messages(prompt)
+    key = make_cache_key(DEFAULT_MODEL, messages, temperature) if cache else None
+    if key:
+        cached = await response_cache.get_async(key)
+        if cached is not None:
+            logger.info(f"⚡ Cache hit for {task}")
+            return cached
+    cached, embedding = await _semantic_lookup_async(task, semantic)
+    if cached is not None:
+        return cached
     try:
-        log_token_usage("euriai")
-        prompt = f"Generate {level} {language} code for topic: {topic} with best practices and comments."
-        messages = [{"role": "user", "content": prompt}]
-        res = call_euriai_api("gpt-4.1-nano", messages)
-        return res.json()["choices"][0]["message"]["content"].strip()
+        content = await _fetch_async(task, messages, temperature)
     except Exception as e:
-        logger.exception("❌ Error in generate_code")
+        logger.exception(f"❌ Error in {task}")
         return f"Error: {e}"
+    await _remember_async(key, semantic, embedding, content)
+    return content
 
-def ask_generic_question(question: str) -> str:
+def _stream(task: str, prompt: str, cache: bool = False, temperature: float = 0.7):
+    """Yield a completion token by token (identical live streams share one upstream stream);
+    the joined text is cached at the end"""
+    messages = _user_messages(prompt)
+    key = make_cache_key(DEFAULT_MODEL, messages, temperature) if cache else None
+    cached = response_cache.get(key) if key else None
+    if cached is not None:
+        logger.info(f"⚡ Cache hit for {task}")
+        yield cached
+        return
+    if SINGLE_FLIGHT:
+        tokens = stream_fanout.subscribe(
+            _flight_key(messages, temperature), lambda: _upstream_tokens(task, messages, temperature)
+        )
+    else:
+        tokens = _upstream_tokens(task, messages, temperature)
+    started = time.perf_counter()
+    parts = []
     try:
-        log_token_usage("euriai")
-        messages = [{"role": "user", "content": question}]
-        res = call_euriai_api("gpt-4.1-nano", messages)
-        return res.json()["choices"][0]["message"]["content"].strip()
+        for token in tokens:
+            if not parts:
+                LLM_TTFT.observe(time.perf_counter() - started, task=task)
+            parts.append(token)
+            yield token
     except Exception as e:
-        logger.exception("❌ Error in ask_generic_question")
-        return f"Error: {e}"
+        logger.exception(f"❌ Streaming {task} failed")
+        yield f"❌ Error: {e}"
+        return
+    content = "".join(parts)
+    if key and content:
+        response_cache.set(key, content)
 
-def document_code(code: str) -> str:
+async def _stream_async(task: str, prompt: str, cache: bool = False, temperature: float = 0.7):
+    messages = _user_messages(prompt)
+    key = make_cache_key(DEFAULT_MODEL, messages, temperature) if cache else None
+    cached = await response_cache.get_async(key) if key else None
+    if cached is not None:
+        logger.info(f"⚡ Cache hit for {task}")
+        yield cached
+        return
+    if SINGLE_FLIGHT:
+        tokens = stream_fanout_async.subscribe(
+            _flight_key(messages, temperature), lambda: _upstream_tokens_async(task, messages, temperature)
+        )
+    else:
+        tokens = _upstream_tokens_async(task, messages, temperature)
+    started = time.perf_counter()
+    parts = []
     try:
-        log_token_usage("euriai")
-        prompt = f"Document this code clearly:\n\n{code}"
-        messages = [{"role": "user", "content": prompt}]
-        res = call_euriai_api("gpt-4.1-nano", messages)
-        return res.json()["choices"][0]["message"]["content"].strip()
+        async for token in tokens:
+            if not parts:
+                LLM_TTFT.observe(time.perf_counter() - started, task=task)
+            parts.append(token)
+            yield token
     except Exception as e:
-        logger.exception("❌ Error in document_code")
-        return f"Error: {e}"
+        logger.exception(f"❌ Streaming {task} failed")
+        yield f"❌ Error: {e}"
+        return
+    content = "".join(parts)
+    if key and content:
+        await response_cache.set_async(key, content)
+
+# ---------- Sync API ----------
+def explain_code(language: str, topic: str, level: str) -> str:
+    return _complete(
+        "explain_code", _explain_prompt(language, topic, level), cache=True,
+        semantic=("explain", f"{language}|{level}", topic)
+    )
+
+def explain_code_stream(language: str, topic: str, level: str):
+    yield "💬 Typing...\n\n"
+    yield from _stream("explain_code_stream", _explain_stream_prompt(language, topic, level), cache=True)
+
+def debug_code(language: str, topic: str) -> str:
+    return _complete("debug_code", _debug_prompt(language, topic), cache=True)
+
+def generate_code(language: str, topic: str, level: str) -> str:
+    return _complete("generate_code", _generate_prompt(language, topic, level), cache=True)
+
+def ask_generic_question(question: str, use_semantic_cache: bool = True) -> str:
+    semantic = ("ask", "", question) if use_semantic_cache else None
+    return _complete("ask_generic_question", question, cache=True, semantic=semantic)
+
+def document_code(code: str) -> str:
+    return _map_reduce("document_code", _document_prompt, code)
 
 def modularize_code(code: str) -> str:
+    return _map_reduce("modularize_code", _modularize_prompt, code)
+
+def explain_with_rag(document_text: str, question: str) -> str:
     try:
-        log_token_usage("euriai")
-        prompt = f"Refactor this code into modular functions with clear docstrings:\n\n{code}"
-        messages = [{"role": "user", "content": prompt}]
-        res = call_euriai_api("gpt-4.1-nano", messages)
-        return res.json()["choices"][0]["message"]["content"].strip()
+        context = get_rag_context(document_text, question)
     except Exception as e:
-        logger.exception("❌ Error in modularize_code")
+        logger.exception("❌ Error in RAG explanation")
         return f"Error: {e}"
+    return _complete("RAG explanation", _rag_prompt(context, question))
 
-def explain_with_rag(document_text: str, question: str) -> str:
+# ---------- Async API ----------
+async def explain_code_async(language: str, topic: str, level: str) -> str:
+    return await _complete_async(
+        "explain_code", _explain_prompt(language, topic, level), cache=True,
+        semantic=("explain", f"{language}|{level}", topic)
+    )
+
+async def explain_code_stream_async(language: str, topic: str, level: str):
+    yield "💬 Typing...\n\n"
+    async for token in _stream_async("explain_code_stream", _explain_stream_prompt(language, topic, level),
+                                    cache=True):
+        yield token
+
+async def debug_code_async(language: str, topic: str) -> str:
+    return await _complete_async("debug_code", _debug_prompt(language, topic), cache=True)
+
+async def generate_code_async(language: str, topic: str, level: str) -> str:
+    return await _complete_async("generate_code", _generate_prompt(language, topic, level), cache=True)
+
+async def ask_generic_question_async(question: str, use_semantic_cache: bool = True) -> str:
+    semantic = ("ask", "", question) if use_semantic_cache else None
+    return await _complete_async("ask_generic_question", question, cache=True, semantic=semantic)
+
+async def document_code_async(code: str) -> str:
+    return await _map_reduce_async("document_code", _document_prompt, code)
+
+async def modularize_code_async(code: str) -> str:
+    return await _map_reduce_async("modularize_code", _modularize_prompt, code)
+
+async def explain_with_rag_async(document_text: str, question: str) -> str:
     try:
-        log_token_usage("euriai")
-        context = get_rag_context(document_text, question)
-        prompt = f"Use this context to answer:\n\n{context}\n\nQuestion: {question}"
-        messages = [{"role": "user", "content": prompt}]
-        res = call_euriai_api("gpt-4.1-nano", messages)
-        return res.json()["choices"][0]["message"]["content"].strip()
+        context = await asyncio.to_thread(get_rag_context, document_text, question)
     except Exception as e:
         logger.exception("❌ Error in RAG explanation")
         return f"Error: {e}"
+    return await _complete_async("RAG explanation", _rag_prompt(context, question))
+
+# ---------- Async streaming API ----------
+def debug_code_stream_async(language: str, topic: str):
+    return _stream_async("debug_code", _debug_prompt(language, topic), cache=True)
+
+def generate_code_stream_async(language: str, topic: str, level: str):
+    return _stream_async("generate_code", _generate_prompt(language, topic, level), cache=True)
+
+def ask_generic_question_stream_async(question: str):
+    return _stream_async("ask_generic_question", question, cache=True)
+
+def document_code_stream_async(code: str):
+    return _map_reduce_stream_async("document_code", _document_prompt, code)
+
+def modularize_code_stream_async(code: str):
+    return _map_reduce_stream_async("modularize_code", _modularize_prompt, code)
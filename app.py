@@ -5,9 +5,11 @@ import pandas as pd
 import json
 import io
 import os
+import time
 from datetime import datetime
 from logger import get_logger
 from token_utils import summarize_token_usage
+import tracing
 
 # Create logs directory if it doesn't exist
 os.makedirs("logs", exist_ok=True)
@@ -32,6 +34,7 @@ def initialize_session_state():
         "document_loaded": False,
         "document_name": "",
         "document_content": "",
+        "document_id": "",
         "rag_active": False,
         "chat_session_active": False,
         "show_dashboard": False,
@@ -105,11 +108,13 @@ def make_api_request(endpoint, payload):
         # Update usage stats first
         cost = update_usage_stats()
         
-        # Make the request
-        response = requests.post(f"{API_URL}/{endpoint}", json=payload, timeout=30)
-        response.raise_for_status()
+        # Make the request; the trace id ties this call to the backend's spans and logs
+        with tracing.trace(f"frontend /{endpoint}", service="frontend") as root:
+            response = requests.post(f"{API_URL}/{endpoint}", json=payload, timeout=30,
+                                     headers={tracing.TRACE_HEADER: root.trace_id})
+            response.raise_for_status()
         
-        logger.info(f"✅ API call successful: {endpoint}")
+        logger.info(f"✅ API call successful: {endpoint} (trace {root.trace_id})")
         return response
         
     except requests.exceptions.RequestException as e:
@@ -121,6 +126,51 @@ def make_api_request(endpoint, payload):
         st.error(f"🚨 Unexpected Error: {str(e)}")
         return None
 
+def stream_api_request(endpoint, payload, placeholder, render=None):
+    """Render a streaming endpoint into a placeholder as tokens arrive; returns the full text"""
+    render = render or (lambda target, text: target.markdown(text))
+    try:
+        update_usage_stats()
+        parts = []
+        with tracing.trace(f"frontend /{endpoint}", service="frontend") as root, requests.post(
+            f"{API_URL}/{endpoint}", json=payload, stream=True, timeout=(10, 300),
+            headers={tracing.TRACE_HEADER: root.trace_id}
+        ) as response:
+            response.raise_for_status()
+            for piece in response.iter_content(chunk_size=None, decode_unicode=True):
+                if piece:
+                    parts.append(piece)
+                    render(placeholder, "".join(parts) + " ▌")
+        text = "".join(parts)
+        render(placeholder, text)
+        logger.info(f"✅ Streamed API call successful: {endpoint} (trace {root.trace_id})")
+        return text
+
+    except requests.exceptions.RequestException as e:
+        logger.error(f"❌ Streaming API request failed: {e}")
+        st.error(f"🚨 API Request Failed: {str(e)}")
+        return None
+
+def wait_for_ingestion(job_id, timeout=600):
+    """Poll an indexing job until it finishes, showing its progress"""
+    progress = st.progress(0.0, text="⏳ Indexing document...")
+    deadline = time.time() + timeout
+    try:
+        while time.time() < deadline:
+            job = requests.get(f"{API_URL}/jobs/{job_id}", timeout=10).json()
+            progress.progress(min(float(job.get("progress") or 0.0), 1.0),
+                              text=job.get("message") or "⏳ Indexing document...")
+            if job.get("status") == "done":
+                return {"response": job.get("message", ""), **(job.get("result") or {})}
+            if job.get("status") == "failed":
+                return {"error": job.get("error") or "Indexing failed"}
+            if job.get("status") == "cancelled":
+                return {"error": "Indexing was cancelled"}
+            time.sleep(1)
+        return {"error": f"Indexing is still running after {timeout}s"}
+    finally:
+        progress.empty()
+
 def process_document_for_rag(file_content, filename):
     """Process document for RAG and start chat session"""
     try:
@@ -131,11 +181,14 @@ def process_document_for_rag(file_content, filename):
         
         if response.status_code == 200:
             result = response.json()
+            if "job_id" in result:
+                result = wait_for_ingestion(result["job_id"])
             if "response" in result:
                 # Set up persistent chat session
                 st.session_state.document_loaded = True
                 st.session_state.document_name = filename
                 st.session_state.document_content = file_content
+                st.session_state.document_id = result.get("document_id", "")
                 st.session_state.rag_active = True
                 st.session_state.chat_session_active = True
                 
@@ -159,23 +212,27 @@ def process_document_for_rag(file_content, filename):
         st.error(f"❌ Error processing document: {str(e)}")
         return False
 
-def send_rag_question(question):
-    """Send question to RAG system"""
+def send_rag_question(question, placeholder):
+    """Send question to RAG system, rendering the answer into placeholder as it streams"""
     try:
-        response = requests.post(
-            f"{API_URL}/rag_chat",
-            json={"question": question},
-            timeout=60
-        )
-        
-        if response.status_code == 200:
-            result = response.json()
-            if "response" in result:
-                return result["response"]
-            else:
-                return f"❌ Error: {result.get('error', 'Unknown error')}"
-        else:
-            return f"❌ Server error: {response.status_code}"
+        parts = []
+        with tracing.trace("frontend /rag_chat_stream", service="frontend") as root, requests.post(
+            f"{API_URL}/rag_chat_stream",
+            json={"question": question, "document_id": st.session_state.document_id},
+            stream=True,
+            timeout=(10, 300),
+            headers={tracing.TRACE_HEADER: root.trace_id}
+        ) as response:
+            if response.status_code != 200:
+                try:
+                    return f"❌ Error: {response.json().get('error', 'Unknown error')}"
+                except ValueError:
+                    return f"❌ Server error: {response.status_code}"
+            for piece in response.iter_content(chunk_size=None, decode_unicode=True):
+                if piece:
+                    parts.append(piece)
+                    placeholder.markdown("".join(parts) + " ▌")
+        return "".join(parts)
             
     except Exception as e:
         logger.error(f"RAG question failed: {e}")
@@ -336,8 +393,9 @@ elif st.session_state.chat_session_active:
             with st.chat_message("assistant"):
                 with st.spinner("🤖 Thinking..."):
                     # Send to RAG system
-                    ai_response = send_rag_question(prompt)
-                    st.markdown(ai_response)
+                    placeholder = st.empty()
+                    ai_response = send_rag_question(prompt, placeholder)
+                    placeholder.markdown(ai_response)
                     
                     # Add to chat history
                     st.session_state.messages.append({"role": "assistant", "content": ai_response})
@@ -483,11 +541,8 @@ else:
                             "level": level
                         }
                         
-                        response = make_api_request("explain", payload)
-                        if response:
-                            result = response.json()
-                            st.markdown("### 📝 Explanation")
-                            st.markdown(result.get("response", "No response received"))
+                        st.markdown("### 📝 Explanation")
+                        stream_api_request("explain_stream", payload, st.empty())
                 else:
                     st.warning("⚠️ Please enter a topic to explain")
         
@@ -516,11 +571,8 @@ else:
                             "level": "Intermediate"
                         }
                         
-                        response = make_api_request("debug", payload)
-                        if response:
-                            result = response.json()
-                            st.markdown("### 🔧 Debug Analysis")
-                            st.markdown(result.get("response", "No response received"))
+                        st.markdown("### 🔧 Debug Analysis")
+                        stream_api_request("debug_stream", payload, st.empty())
                 else:
                     st.warning("⚠️ Please provide code or describe the issue")
         
@@ -562,11 +614,11 @@ else:
                             "level": gen_complexity
                         }
                         
-                        response = make_api_request("generate", payload)
-                        if response:
-                            result = response.json()
-                            st.markdown("### ⚡ Generated Code")
-                            st.code(result.get("response", "No code generated"), language=gen_language.lower())
+                        st.markdown("### ⚡ Generated Code")
+                        stream_api_request(
+                            "generate_stream", payload, st.empty(),
+                            render=lambda target, text: target.code(text, language=gen_language.lower())
+                        )
                 else:
                     st.warning("⚠️ Please describe what you want to build")
     
@@ -593,11 +645,8 @@ else:
             # Get AI response
             with st.chat_message("assistant"):
                 with st.spinner("🤖 Thinking..."):
-                    response = make_api_request("ask", {"question": prompt})
-                    if response:
-                        result = response.json()
-                        ai_response = result.get("response", "Sorry, I couldn't process your question.")
-                        st.markdown(ai_response)
+                    ai_response = stream_api_request("ask_stream", {"question": prompt}, st.empty())
+                    if ai_response:
                         st.session_state.quick_messages.append({"role": "assistant", "content": ai_response})
                     else:
                         error_msg = "❌ Sorry, I'm having trouble connecting right now. Please try again."
@@ -0,0 +1,92 @@
+# batch_writer.py - Background batching writer shared by usage, traffic and trace output
+import time
+import queue
+import threading
+from logger import get_logger
+
+logger = get_logger("batch_writer", "logs/backend.log")
+
+class BatchWriter:
+    """Background thread that batches records and flushes them to a sink.
+
+    Request handlers only enqueue; the sink runs every flush_interval seconds or
+    whenever batch_size records are waiting. A full queue drops records rather
+    than blocking the caller.
+    """
+
+    _STOP = object()
+
+    def __init__(self, sink, flush_interval: float = 2.0, batch_size: int = 200, max_queue: int = 10000,
+                 name: str = "batch", log=None):
+        self.sink = sink
+        self.name = name
+        self.logger = log or logger
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.dropped = 0
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name=f"{self.name}-writer", daemon=True)
+                    self._thread.start()
+
+    def submit(self, record: dict):
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            self.logger.warning(f"⚠️ {self.name} queue full, dropped record ({self.dropped} dropped so far)")
+
+    def _write(self, batch: list):
+        if not batch:
+            return
+        try:
+            self.sink(batch)
+            self.logger.info(f"Flushed {len(batch)} {self.name} records")
+        except Exception as e:
+            self.logger.exception(f"❌ Failed to write {self.name} records: {e}")
+        batch.clear()
+
+    def _run(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            timeout = max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is self._STOP:
+                self._write(batch)
+                return
+            if isinstance(item, threading.Event):
+                self._write(batch)
+                item.set()
+            elif item is not None:
+                batch.append(item)
+
+            if len(batch) >= self.batch_size or time.monotonic() >= deadline:
+                self._write(batch)
+                deadline = time.monotonic() + self.flush_interval
+
+    def flush(self, timeout: float = 5.0):
+        """Block until everything queued so far has been written"""
+        if self._thread is None:
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def close(self, timeout: float = 5.0):
+        if self._thread is None:
+            return
+        self._queue.put(self._STOP)
+        self._thread.join(timeout)
+        self._thread = None
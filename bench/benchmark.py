@@ -0,0 +1,252 @@
+# benchmark.py - End-to-end load test for the FastAPI backend
+#
+#   python bench/mock_euriai.py --port 9100 &
+#   EURIAI_API_URL=http://127.0.0.1:9100/v1/chat/completions uvicorn main:app --port 8000 &
+#   python bench/benchmark.py --concurrency 1,10,50 --requests 200 --output logs/bench.json
+import sys
+import math
+import json
+import time
+import uuid
+import asyncio
+import argparse
+import httpx
+
+SCENARIOS = ("ask", "explain_stream", "rag_chat", "analyze_file")
+
+# Status lines the backend streams before the first real token
+STREAM_PREFIXES = ("💬 Typing...\n\n",)
+
+SAMPLE_CODE = '''
+def load_orders(path):
+    with open(path) as f:
+        rows = [line.split(",") for line in f]
+    return [{"id": r[0], "total": float(r[1])} for r in rows]
+
+def top_customers(orders, n=5):
+    totals = {}
+    for order in orders:
+        totals[order["id"]] = totals.get(order["id"], 0) + order["total"]
+    return sorted(totals.items(), key=lambda kv: kv[1], reverse=True)[:n]
+'''
+
+SAMPLE_DOCUMENT = "\n\n".join(
+    f"Section {i}. The order service stores invoices in region {i % 7} and retries failed "
+    f"payments {i % 4 + 1} times before notifying the customer by email. Refunds for "
+    f"category {i % 11} are processed within {i % 5 + 2} business days."
+    for i in range(200)
+)
+
+def percentile(values: list, pct: float) -> float:
+    """Nearest-rank percentile"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+def body_failed(data) -> bool:
+    """True for JSON bodies the backend uses to report errors with a 200 status"""
+    if not isinstance(data, dict):
+        return False
+    response = data.get("response")
+    return "error" in data or (isinstance(response, str) and response.startswith(("Error:", "❌")))
+
+def stream_failed(text: str) -> bool:
+    """True for streamed answers that ended in the backend's error message"""
+    return "❌ Error:" in text
+
+class Runner:
+    """Issues one request per scenario call and returns (ok, latency, ttft)"""
+
+    def __init__(self, client: httpx.AsyncClient, unique: bool, analyze_action: str, code: str):
+        self.client = client
+        self.unique = unique
+        self.analyze_action = analyze_action
+        self.code = code
+        self.document_id = None
+
+    def _topic(self, base: str) -> str:
+        # Unique prompts bypass the response and semantic caches; --repeat measures them instead
+        return f"{base} #{uuid.uuid4().hex[:8]}" if self.unique else base
+
+    async def prepare(self, scenarios: list, document: str):
+        if "rag_chat" not in scenarios:
+            return
+        files = {"file": ("bench_document.txt", document.encode("utf-8"), "text/plain")}
+        res = await self.client.post("/analyze_file", data={"action": "rag"}, files=files)
+        job_id = res.json().get("job_id")
+        if not job_id:
+            raise RuntimeError(f"RAG upload did not return a job id: {res.text[:200]}")
+        while True:
+            res = await self.client.get(f"/jobs/{job_id}/result")
+            if res.status_code == 200:
+                self.document_id = res.json()["document_id"]
+                return
+            if res.status_code != 202:
+                raise RuntimeError(f"RAG indexing failed: {res.text[:200]}")
+            await asyncio.sleep(0.5)
+
+    async def _json(self, method: str, path: str, **kwargs):
+        started = time.perf_counter()
+        res = await self.client.request(method, path, **kwargs)
+        latency = time.perf_counter() - started
+        ok = res.status_code < 400 and not body_failed(res.json())
+        return ok, latency, latency
+
+    async def _stream(self, path: str, payload: dict):
+        started = time.perf_counter()
+        ttft, text = None, ""
+        async with self.client.stream("POST", path, json=payload) as res:
+            async for chunk in res.aiter_text():
+                text += chunk
+                if ttft is None and text not in STREAM_PREFIXES and not any(
+                        p.startswith(text) for p in STREAM_PREFIXES):
+                    ttft = time.perf_counter() - started
+            status = res.status_code
+        latency = time.perf_counter() - started
+        ok = status < 400 and not stream_failed(text)
+        return ok, latency, ttft if ttft is not None else latency
+
+    async def ask(self, i: int):
+        return await self._json("POST", "/ask", json={"question": self._topic("What is a Python decorator?")})
+
+    async def explain_stream(self, i: int):
+        return await self._stream("/explain_stream", {
+            "language": "Python", "topic": self._topic("list comprehensions"), "level": "Beginner"
+        })
+
+    async def rag_chat(self, i: int):
+        question = self._topic("How many times are failed payments retried?")
+        return await self._json("POST", "/rag_chat", json={"question": question, "document_id": self.document_id})
+
+    async def analyze_file(self, i: int):
+        code = self.code + (f"\n# run {uuid.uuid4().hex}\n" if self.unique else "")
+        files = {"file": ("bench.py", code.encode("utf-8"), "text/x-python")}
+        started = time.perf_counter()
+        res = await self.client.post("/analyze_file", data={"action": self.analyze_action}, files=files)
+        # debug/document/modularize come back as a job id: time the job to its result
+        job_id = res.json().get("job_id") if res.status_code < 400 else None
+        while job_id:
+            res = await self.client.get(f"/jobs/{job_id}/result")
+            if res.status_code != 202:
+                break
+            await asyncio.sleep(0.05)
+        latency = time.perf_counter() - started
+        ok = res.status_code < 400 and not body_failed(res.json())
+        return ok, latency, latency
+
+async def run_scenario(runner: Runner, scenario: str, concurrency: int, total: int) -> dict:
+    call = getattr(runner, scenario)
+    latencies, ttfts, errors = [], [], 0
+    counter = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            try:
+                ok, latency, ttft = await call(i)
+            except Exception:
+                ok, latency, ttft = False, None, None
+            if ok:
+                latencies.append(latency)
+                ttfts.append(ttft)
+            else:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    ms = lambda values, pct: round(percentile(values, pct) * 1000, 1)
+    return {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "seconds": round(elapsed, 2),
+        "rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": ms(latencies, 50),
+        "p95_ms": ms(latencies, 95),
+        "p99_ms": ms(latencies, 99),
+        "ttft_p50_ms": ms(ttfts, 50),
+        "ttft_p95_ms": ms(ttfts, 95)
+    }
+
+def print_table(results: list):
+    columns = ("scenario", "concurrency", "requests", "errors", "rps",
+               "p50_ms", "p95_ms", "p99_ms", "ttft_p50_ms", "ttft_p95_ms")
+    widths = [max(len(c), *(len(str(r[c])) for r in results)) for c in columns]
+    print("  ".join(c.ljust(w) for c, w in zip(columns, widths)))
+    for r in results:
+        print("  ".join(str(r[c]).ljust(w) for c, w in zip(columns, widths)))
+
+def compare(results: list, baseline_path: str, tolerance: float) -> list:
+    """Regressions against a saved run: p95 latency or RPS worse than tolerance allows"""
+    with open(baseline_path) as f:
+        baseline = {(r["scenario"], r["concurrency"]): r for r in json.load(f)["results"]}
+    regressions = []
+    for r in results:
+        old = baseline.get((r["scenario"], r["concurrency"]))
+        if old is None:
+            continue
+        if old["p95_ms"] and r["p95_ms"] > old["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{r['scenario']}@{r['concurrency']}: p95 {old['p95_ms']}ms -> {r['p95_ms']}ms")
+        if old["rps"] and r["rps"] < old["rps"] * (1 - tolerance):
+            regressions.append(f"{r['scenario']}@{r['concurrency']}: rps {old['rps']} -> {r['rps']}")
+        if r["errors"] > old["errors"]:
+            regressions.append(f"{r['scenario']}@{r['concurrency']}: errors {old['errors']} -> {r['errors']}")
+    return regressions
+
+async def main_async(args) -> int:
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        print(f"Unknown scenarios {sorted(unknown)}, expected some of {list(SCENARIOS)}")
+        return 2
+    levels = [int(c) for c in args.concurrency.split(",")]
+    code = open(args.code_file).read() if args.code_file else SAMPLE_CODE
+    document = open(args.document).read() if args.document else SAMPLE_DOCUMENT
+
+    limits = httpx.Limits(max_connections=max(levels) + 5, max_keepalive_connections=max(levels) + 5)
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+        runner = Runner(client, not args.repeat, args.analyze_action, code)
+        await runner.prepare(scenarios, document)
+        results = []
+        for scenario in scenarios:
+            for concurrency in levels:
+                if args.warmup:
+                    await run_scenario(runner, scenario, concurrency, min(args.warmup, args.requests))
+                result = await run_scenario(runner, scenario, concurrency, args.requests)
+                results.append(result)
+                print(f"✅ {scenario} @ {concurrency}: {result['rps']} rps, p95 {result['p95_ms']}ms")
+
+    print()
+    print_table(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"url": args.url, "created_at": time.time(), "results": results}, f, indent=2)
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.tolerance)
+        for line in regressions:
+            print(f"❌ Regression: {line}")
+        return 1 if regressions else 0
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the backend endpoints end to end")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--concurrency", default="1,10", help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=50, help="requests per scenario and level")
+    parser.add_argument("--warmup", type=int, default=5, help="unmeasured requests before each run")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--repeat", action="store_true", help="reuse identical prompts (measures the caches)")
+    parser.add_argument("--analyze-action", default="debug", choices=("debug", "document", "modularize", "explain"))
+    parser.add_argument("--code-file", help="Python file to send to /analyze_file")
+    parser.add_argument("--document", help="text file to index for /rag_chat")
+    parser.add_argument("--output", help="write results as JSON (usable as a later --baseline)")
+    parser.add_argument("--baseline", help="fail with exit code 1 if this saved run was faster")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    sys.exit(asyncio.run(main_async(parser.parse_args())))
+
+if __name__ == "__main__":
+    main()
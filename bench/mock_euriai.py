@@ -0,0 +1,166 @@
+# mock_euriai.py - Local stand-in for the Euriai chat-completions endpoint
+#
+#   python bench/mock_euriai.py --port 9100 --latency-ms 300 --tokens-per-sec 80
+#   EURIAI_API_URL=http://127.0.0.1:9100/v1/chat/completions uvicorn main:app
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# Every knob can also be changed at runtime with POST /mock/config
+CONFIG = {
+    "latency_ms": float(os.getenv("MOCK_LATENCY_MS", "200")),          # before the first byte
+    "jitter_ms": float(os.getenv("MOCK_JITTER_MS", "50")),
+    "tokens_per_sec": float(os.getenv("MOCK_TOKENS_PER_SEC", "100")),  # 0 = no generation delay
+    "completion_tokens": int(os.getenv("MOCK_COMPLETION_TOKENS", "120")),
+    "error_rate": float(os.getenv("MOCK_ERROR_RATE", "0")),            # share of requests answered with 500
+    "rate_limit_rate": float(os.getenv("MOCK_RATE_LIMIT_RATE", "0")),  # share answered with 429
+    "bad_request_rate": float(os.getenv("MOCK_BAD_REQUEST_RATE", "0")),  # share answered with 400
+    "retry_after": float(os.getenv("MOCK_RETRY_AFTER", "1")),
+    "drop_rate": float(os.getenv("MOCK_DROP_RATE", "0"))               # share of streams cut off midway
+}
+
+WORDS = ("the", "function", "returns", "a", "value", "for", "each", "item", "in", "list",
+         "python", "code", "should", "handle", "errors", "and", "edge", "cases", "carefully", "data")
+
+stats = {"requests": 0, "streams": 0, "errors": 0, "rate_limited": 0, "bad_requests": 0, "dropped": 0,
+         "in_flight": 0, "peak_in_flight": 0}
+
+app = FastAPI(title="Mock Euriai API")
+
+def _prompt_tokens(messages: list) -> int:
+    # Roughly four characters per token, like the real tokenizers on English text
+    return max(1, sum(len(m.get("content", "")) for m in messages) // 4)
+
+def _completion(rng: random.Random) -> list:
+    return [rng.choice(WORDS) + " " for _ in range(CONFIG["completion_tokens"])]
+
+async def _first_byte_delay():
+    jitter = random.uniform(-CONFIG["jitter_ms"], CONFIG["jitter_ms"])
+    await asyncio.sleep(max(0.0, CONFIG["latency_ms"] + jitter) / 1000)
+
+def _injected_error():
+    roll = random.random()
+    if roll < CONFIG["rate_limit_rate"]:
+        stats["rate_limited"] += 1
+        return JSONResponse(status_code=429, content={"error": "rate limited"},
+                            headers={"Retry-After": str(CONFIG["retry_after"])})
+    if roll < CONFIG["rate_limit_rate"] + CONFIG["error_rate"]:
+        stats["errors"] += 1
+        return JSONResponse(status_code=500, content={"error": "injected failure"})
+    if roll < CONFIG["rate_limit_rate"] + CONFIG["error_rate"] + CONFIG["bad_request_rate"]:
+        stats["bad_requests"] += 1
+        return JSONResponse(status_code=400, content={"error": "injected bad request"})
+    return None
+
+def _usage(prompt_tokens: int, completion_tokens: int) -> dict:
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens}
+
+def _chunk(model: str, delta: dict = None, usage: dict = None) -> str:
+    body = {"object": "chat.completion.chunk", "model": model,
+            "choices": [{"index": 0, "delta": delta}] if delta is not None else []}
+    if usage is not None:
+        body["usage"] = usage
+    return f"data: {json.dumps(body)}\n\n"
+
+async def _stream(model: str, tokens: list, prompt_tokens: int, include_usage: bool):
+    stats["streams"] += 1
+    delay = 1 / CONFIG["tokens_per_sec"] if CONFIG["tokens_per_sec"] > 0 else 0
+    drop_at = len(tokens) // 2 if random.random() < CONFIG["drop_rate"] else None
+    try:
+        yield _chunk(model, {"role": "assistant", "content": ""})
+        for i, token in enumerate(tokens):
+            if i == drop_at:
+                stats["dropped"] += 1
+                raise ConnectionResetError("injected stream drop")
+            await asyncio.sleep(delay)
+            yield _chunk(model, {"content": token})
+        if include_usage:
+            yield _chunk(model, usage=_usage(prompt_tokens, len(tokens)))
+        yield "data: [DONE]\n\n"
+    finally:
+        stats["in_flight"] -= 1
+
+@app.post("/v1/chat/completions")
+@app.post("/api/v1/euri/alpha/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    stats["requests"] += 1
+    stats["in_flight"] += 1
+    stats["peak_in_flight"] = max(stats["peak_in_flight"], stats["in_flight"])
+
+    await _first_byte_delay()
+    error = _injected_error()
+    if error is not None:
+        stats["in_flight"] -= 1
+        return error
+
+    model = body.get("model", "mock")
+    messages = body.get("messages", [])
+    prompt_tokens = _prompt_tokens(messages)
+    # Same prompt, same answer: keeps response caches meaningful during benchmarks
+    tokens = _completion(random.Random(json.dumps(messages, sort_keys=True)))
+
+    if body.get("stream"):
+        include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+        return StreamingResponse(_stream(model, tokens, prompt_tokens, include_usage),
+                                 media_type="text/event-stream")
+
+    try:
+        if CONFIG["tokens_per_sec"] > 0:
+            await asyncio.sleep(len(tokens) / CONFIG["tokens_per_sec"])
+    finally:
+        stats["in_flight"] -= 1
+    return {
+        "id": f"mock-{stats['requests']}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens).strip()},
+                     "finish_reason": "stop"}],
+        "usage": _usage(prompt_tokens, len(tokens))
+    }
+
+@app.get("/mock/config")
+def get_config():
+    return CONFIG
+
+@app.post("/mock/config")
+async def set_config(request: Request):
+    updates = await request.json()
+    unknown = set(updates) - set(CONFIG)
+    if unknown:
+        return JSONResponse(status_code=400, content={"error": f"Unknown settings: {sorted(unknown)}"})
+    for key, value in updates.items():
+        CONFIG[key] = type(CONFIG[key])(value)
+    return CONFIG
+
+@app.get("/mock/stats")
+def get_stats():
+    return stats
+
+@app.post("/mock/reset")
+def reset_stats():
+    for key in stats:
+        stats[key] = 0
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local mock of the Euriai chat-completions API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    for key, value in CONFIG.items():
+        parser.add_argument(f"--{key.replace('_', '-')}", type=type(value), default=value)
+    args = parser.parse_args()
+    for key in CONFIG:
+        CONFIG[key] = getattr(args, key)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
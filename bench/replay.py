@@ -0,0 +1,204 @@
+# replay.py - Re-drive traffic captured by traffic_recorder against a server
+#
+#   RECORD_TRAFFIC=true uvicorn main:app                  # capture to logs/requests.jsonl
+#   python bench/mock_euriai.py --port 9100 &
+#   EURIAI_API_URL=http://127.0.0.1:9100/v1/chat/completions uvicorn main:app --port 8000 &
+#   python bench/replay.py logs/requests.jsonl --speed 2 --rag-file docs/sample.md
+#
+# Recorded document ids do not exist on a fresh target: --rag-file indexes a stand-in
+# document first (or --document-id names one) and every RAG request is pointed at it.
+import sys
+import json
+import time
+import base64
+import asyncio
+import argparse
+from collections import defaultdict
+import httpx
+from benchmark import percentile, body_failed, stream_failed
+
+RAG_PATHS = ("/rag_chat", "/rag_chat_stream")
+FILLER_LINE = b"value = transform(value)  # replayed upload filler\n"
+# Response bodies kept for error checks; larger ones are only timed
+MAX_CHECKED_BYTES = 1024 * 1024
+
+def load_records(paths: list, endpoints: list = None, limit: int = None) -> list:
+    """Captured records from one or more JSONL files (rotated files included), in time order"""
+    records = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                record = json.loads(line)
+                if endpoints and record["path"] not in endpoints:
+                    continue
+                records.append(record)
+    records.sort(key=lambda r: r["ts"])
+    return records[:limit] if limit else records
+
+def _filler(size: int) -> bytes:
+    return (FILLER_LINE * (size // len(FILLER_LINE) + 1))[:size]
+
+def request_args(record: dict, document_id: str = None):
+    """httpx arguments that rebuild the recorded body, or None when it cannot be rebuilt.
+
+    Size-only uploads come back as a fresh multipart body with the recorded form fields
+    and same-size filler files; other size-only bodies cannot be reconstructed.
+    """
+    if "body" in record:
+        body = record["body"]
+        if document_id and record["path"] in RAG_PATHS and isinstance(body, dict) and "document_id" in body:
+            body = {**body, "document_id": document_id}
+        return {"json": body}
+    if "body_b64" in record:
+        headers = {"Content-Type": record["content_type"]} if record.get("content_type") else {}
+        return {"content": base64.b64decode(record["body_b64"]), "headers": headers}
+    if "files" in record or "form" in record:
+        files = [(f["field"], (f["filename"], _filler(f["bytes"]), "text/plain")) for f in record.get("files", [])]
+        return {"data": record.get("form", {}), "files": files}
+    if record.get("body_bytes"):
+        return None
+    return {}
+
+async def index_document(client: httpx.AsyncClient, path: str, timeout: float) -> str:
+    """Index a stand-in document on the target through /analyze_file and return its document_id"""
+    with open(path, "rb") as f:
+        res = await client.post("/analyze_file", data={"action": "rag"}, files={"file": (path, f.read(), "text/plain")})
+    job_id = res.json().get("job_id")
+    if not job_id:
+        raise RuntimeError(f"Indexing {path} failed: {res.text[:200]}")
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = (await client.get(f"/jobs/{job_id}")).json()
+        if job.get("status") == "done":
+            return job["result"]["document_id"]
+        if job.get("status") in ("failed", "cancelled"):
+            raise RuntimeError(f"Indexing {path} {job['status']}: {job.get('error')}")
+        await asyncio.sleep(0.5)
+    raise RuntimeError(f"Indexing {path} did not finish within {timeout:.0f}s")
+
+def _failed(status, content_type: str, body: bytes, complete: bool) -> bool:
+    if status is None or status >= 400:
+        return True
+    if not complete:
+        return False
+    text = body.decode("utf-8", "replace")
+    if content_type.startswith("application/json"):
+        try:
+            return body_failed(json.loads(text))
+        except ValueError:
+            return False
+    return stream_failed(text)
+
+async def send(client: httpx.AsyncClient, record: dict, args: dict) -> dict:
+    url = record["path"] + (f"?{record['query']}" if record.get("query") else "")
+    started = time.perf_counter()
+    ttfb, status, content_type, body = None, None, "", bytearray()
+    try:
+        async with client.stream(record["method"], url, **args) as res:
+            status = res.status_code
+            content_type = res.headers.get("content-type", "")
+            async for chunk in res.aiter_bytes():
+                if ttfb is None:
+                    ttfb = time.perf_counter() - started
+                if len(body) <= MAX_CHECKED_BYTES:
+                    body += chunk
+    except httpx.HTTPError:
+        pass
+    latency = time.perf_counter() - started
+    # 200 responses carrying {"error": ...} (e.g. unknown document ids) count as failures
+    failed = _failed(status, content_type, bytes(body), len(body) <= MAX_CHECKED_BYTES)
+    return {"path": record["path"], "status": status, "failed": failed, "latency": latency,
+            "ttfb": ttfb if ttfb is not None else latency}
+
+async def replay(args) -> list:
+    records = load_records(args.files, args.endpoints.split(",") if args.endpoints else None, args.limit)
+    if not records:
+        print("No records to replay")
+        return []
+    limit = asyncio.Semaphore(args.max_in_flight)
+    results = []
+
+    async def fire(client: httpx.AsyncClient, record: dict, request: dict, delay: float):
+        await asyncio.sleep(delay)
+        async with limit:
+            results.append(await send(client, record, request))
+
+    limits = httpx.Limits(max_connections=args.max_in_flight, max_keepalive_connections=args.max_in_flight)
+    async with httpx.AsyncClient(base_url=args.target, timeout=args.timeout, limits=limits) as client:
+        document_id = args.document_id
+        if args.rag_file:
+            document_id = await index_document(client, args.rag_file, args.timeout)
+            print(f"📚 Indexed {args.rag_file} as document {document_id}")
+        if not document_id and any(r["path"] in RAG_PATHS for r in records):
+            print("⚠️ RAG requests keep their recorded document ids; use --rag-file or --document-id")
+
+        planned, skipped = [], defaultdict(int)
+        for record in records:
+            request = request_args(record, document_id)
+            if request is None:
+                skipped[record["path"]] += 1
+            else:
+                planned.append((record, request))
+        for path, count in sorted(skipped.items()):
+            print(f"⏭️ Skipping {count} {path} requests recorded without a rebuildable body")
+        if not planned:
+            return []
+
+        first = planned[0][0]["ts"]
+        print(f"▶️ Replaying {len(planned)} requests spanning {planned[-1][0]['ts'] - first:.1f}s at {args.speed}x")
+        started = time.perf_counter()
+        # speed 0 fires everything at once, bounded only by --max-in-flight
+        await asyncio.gather(*(
+            fire(client, record, request, (record["ts"] - first) / args.speed if args.speed > 0 else 0.0)
+            for record, request in planned
+        ))
+        elapsed = time.perf_counter() - started
+
+    report([record for record, _ in planned], results, elapsed)
+    return results
+
+def report(records: list, results: list, elapsed: float):
+    recorded = defaultdict(list)
+    for r in records:
+        recorded[r["path"]].append(r["duration_ms"])
+    replayed = defaultdict(list)
+    errors = defaultdict(int)
+    for r in results:
+        replayed[r["path"]].append(r["latency"] * 1000)
+        if r["failed"]:
+            errors[r["path"]] += 1
+
+    print(f"\n{len(results)} requests in {elapsed:.1f}s ({len(results) / elapsed:.2f} rps)\n")
+    header = f"{'endpoint':<40}{'count':>7}{'errors':>8}{'rec p50':>10}{'rec p95':>10}{'p50':>10}{'p95':>10}{'p99':>10}"
+    print(header)
+    for path in sorted(replayed):
+        ms = replayed[path]
+        print(f"{path:<40}{len(ms):>7}{errors[path]:>8}"
+              f"{percentile(recorded[path], 50):>10.1f}{percentile(recorded[path], 95):>10.1f}"
+              f"{percentile(ms, 50):>10.1f}{percentile(ms, 95):>10.1f}{percentile(ms, 99):>10.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay captured requests against a target server")
+    parser.add_argument("files", nargs="+", help="capture files, e.g. logs/requests.jsonl logs/requests.jsonl.1")
+    parser.add_argument("--target", default="http://127.0.0.1:8000")
+    parser.add_argument("--speed", type=float, default=1.0, help="1 = original pacing, 2 = twice as fast, 0 = no pacing")
+    parser.add_argument("--endpoints", help="comma-separated paths to replay (default: all)")
+    parser.add_argument("--limit", type=int, help="replay only the first N requests")
+    parser.add_argument("--max-in-flight", type=int, default=200)
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--rag-file", help="index this file on the target and send every RAG request to it")
+    parser.add_argument("--document-id", help="existing document on the target for every RAG request")
+    parser.add_argument("--output", help="write per-request results as JSONL")
+    args = parser.parse_args()
+
+    results = asyncio.run(replay(args))
+    if args.output:
+        with open(args.output, "w") as f:
+            f.writelines(json.dumps(r) + "\n" for r in results)
+    sys.exit(1 if any(r["failed"] for r in results) else 0)
+
+if __name__ == "__main__":
+    main()
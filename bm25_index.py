@@ -0,0 +1,82 @@
+# bm25_index.py - Inverted index with BM25 scoring for lexical retrieval
+import re
+from functools import lru_cache
+import numpy as np
+
+# Words in any script, identifiers (snake_case, camelCase, dotted names split on the dot) and numbers
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+# Case boundaries inside ASCII identifiers; other scripts are kept whole
+CAMEL_RE = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+
+STOPWORDS = frozenset("""
+a an and are as at be by for from how in is it of on or that the this to was what when where which who why with
+""".split())
+
+@lru_cache(maxsize=65536)
+def _word_terms(word: str) -> tuple:
+    lower = word.lower()
+    if lower in STOPWORDS:
+        return ()
+    parts = [p.lower() for piece in word.split("_") if piece
+             for p in (CAMEL_RE.findall(piece) if piece.isascii() else [piece])]
+    if len(parts) > 1:
+        return (lower,) + tuple(p for p in parts if p not in STOPWORDS)
+    return (lower,)
+
+def tokenize(text: str) -> list:
+    """Lowercased terms; code identifiers also contribute their snake/camel-case parts"""
+    terms = []
+    for word in TOKEN_RE.findall(text):
+        terms.extend(_word_terms(word))
+    return terms
+
+class BM25Index:
+    """Okapi BM25 over a fixed list of chunks.
+
+    Each posting stores its precomputed BM25 term weight, so a query is a sum of
+    a few weight vectors followed by a partial top-k selection.
+    """
+
+    def __init__(self, chunks: list, k1: float = 1.5, b: float = 0.75):
+        self.size = len(chunks)
+        self.vocab = {}
+        term_ids = []
+        lengths = np.zeros(self.size, dtype=np.float32)
+        for doc_id, chunk in enumerate(chunks):
+            terms = tokenize(chunk)
+            lengths[doc_id] = len(terms)
+            term_ids.extend(self.vocab.setdefault(t, len(self.vocab)) for t in terms)
+
+        # Postings as one (term, doc) array sorted by term, with tf from the run lengths
+        stride = max(self.size, 1)
+        doc_of_term = np.repeat(np.arange(self.size, dtype=np.int64), lengths.astype(np.int64))
+        keys, tf = np.unique(np.asarray(term_ids, dtype=np.int64) * stride + doc_of_term, return_counts=True)
+        terms = keys // stride
+        self.doc_ids = (keys % stride).astype(np.int32)
+        self.offsets = np.searchsorted(terms, np.arange(len(self.vocab) + 1))
+
+        avgdl = float(lengths.mean()) if self.size else 0.0
+        norms = k1 * (1 - b + b * lengths / avgdl) if avgdl else np.full(self.size, k1, dtype=np.float32)
+        df = np.diff(self.offsets)
+        idf = np.log(1 + (self.size - df + 0.5) / (df + 0.5))
+        tf = tf.astype(np.float32)
+        self.weights = (idf[terms] * tf * (k1 + 1) / (tf + norms[self.doc_ids])).astype(np.float32)
+
+    def scores(self, query: str):
+        """Dense BM25 score vector over all chunks (zeros for chunks with no query term)"""
+        scores = np.zeros(self.size, dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = self.vocab.get(term)
+            if term_id is not None:
+                start, end = self.offsets[term_id], self.offsets[term_id + 1]
+                scores[self.doc_ids[start:end]] += self.weights[start:end]
+        return scores
+
+    def search(self, query: str, top_k: int = 3) -> list:
+        """Top (score, chunk_index) pairs, best first; chunks without any query term are skipped"""
+        scores = self.scores(query)
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > top_k:
+            candidates = candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]]
+        ranked = sorted(candidates, key=lambda i: -scores[i])
+        return [(float(scores[i]), int(i)) for i in ranked]
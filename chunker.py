@@ -0,0 +1,119 @@
+# chunker.py - Streaming, token-aware text chunking with overlap
+import os
+import re
+from collections import deque, namedtuple
+from token_utils import count_tokens
+
+RAG_CHUNK_TOKENS = int(os.getenv("RAG_CHUNK_TOKENS", "200"))
+RAG_CHUNK_OVERLAP = int(os.getenv("RAG_CHUNK_OVERLAP", "40"))
+# Paragraphs longer than this are cut at the last newline/space so memory stays bounded
+MAX_PARAGRAPH_CHARS = int(os.getenv("MAX_PARAGRAPH_CHARS", "100000"))
+
+PARAGRAPH_BREAK_RE = re.compile(r"\n[ \t]*\n")
+WORD_RE = re.compile(r"\S+")
+
+# text, [start, end) character offsets into the source, token count, extra metadata
+Chunk = namedtuple("Chunk", ["text", "start", "end", "tokens", "metadata"], defaults=(None,))
+_Piece = namedtuple("_Piece", ["text", "start", "end", "tokens"])
+
+def _blocks(source, block_size: int = 1 << 20):
+    """Text in large blocks so paragraph scanning never re-copies small pieces"""
+    if isinstance(source, str):
+        yield source
+    elif hasattr(source, "read"):
+        while True:
+            block = source.read(block_size)
+            if not block:
+                return
+            yield block
+    else:
+        pending, size = [], 0
+        for block in source:
+            pending.append(block)
+            size += len(block)
+            if size >= block_size:
+                yield "".join(pending)
+                pending, size = [], 0
+        if pending:
+            yield "".join(pending)
+
+def iter_paragraphs(source):
+    """Yield (paragraph, start_offset) from a string or an iterable of text blocks in one pass"""
+    buffer, base = "", 0
+    for block in _blocks(source):
+        buffer = buffer + block if buffer else block
+        pos = 0
+        for match in PARAGRAPH_BREAK_RE.finditer(buffer):
+            if match.start() > pos:
+                yield buffer[pos:match.start()], base + pos
+            pos = match.end()
+        while len(buffer) - pos > MAX_PARAGRAPH_CHARS:
+            window_end = pos + MAX_PARAGRAPH_CHARS
+            cut = max(buffer.rfind("\n", pos, window_end), buffer.rfind(" ", pos, window_end))
+            cut = cut + 1 if cut > pos else window_end
+            yield buffer[pos:cut], base + pos
+            pos = cut
+        buffer, base = buffer[pos:], base + pos
+    if buffer.strip():
+        yield buffer, base
+
+def _sentence_pieces(paragraph: str, offset: int, tokenize, max_tokens: int):
+    """Sentences of a paragraph with source offsets; sentences over max_tokens are split by words"""
+    pos = 0
+    for sentence in tokenize(paragraph):
+        found = paragraph.find(sentence, pos)
+        start = found if found >= 0 else pos
+        pos = start + len(sentence)
+        tokens = count_tokens(sentence)
+        if tokens <= max_tokens:
+            yield _Piece(sentence, offset + start, offset + pos, tokens)
+            continue
+
+        words, window_tokens = [], 0
+        for match in WORD_RE.finditer(sentence):
+            word_tokens = count_tokens(match.group())
+            if words and window_tokens + word_tokens > max_tokens:
+                yield _Piece(" ".join(w.group() for w in words), offset + start + words[0].start(),
+                             offset + start + words[-1].end(), window_tokens)
+                words, window_tokens = [], 0
+            words.append(match)
+            window_tokens += word_tokens
+        if words:
+            yield _Piece(" ".join(w.group() for w in words), offset + start + words[0].start(),
+                         offset + start + words[-1].end(), window_tokens)
+
+def _emit(window) -> Chunk:
+    return Chunk(
+        " ".join(piece.text.strip() for piece in window),
+        window[0].start, window[-1].end,
+        sum(piece.tokens for piece in window)
+    )
+
+def iter_chunks(source, max_tokens: int = RAG_CHUNK_TOKENS, overlap_tokens: int = RAG_CHUNK_OVERLAP,
+                sent_tokenize=None):
+    """Yield Chunks of at most max_tokens tokens, consecutive chunks sharing up to overlap_tokens.
+
+    `source` is a string or any iterable of text blocks (e.g. an open file), consumed
+    in a single pass; only the current paragraph and chunk window are held in memory.
+    """
+    tokenize = sent_tokenize or (lambda text: [text])
+    overlap_tokens = min(overlap_tokens, max_tokens // 2)
+    window, window_tokens, fresh = deque(), 0, False
+
+    for paragraph, offset in iter_paragraphs(source):
+        for piece in _sentence_pieces(paragraph, offset, tokenize, max_tokens):
+            if not piece.text.strip():
+                continue
+            if window and window_tokens + piece.tokens > max_tokens:
+                if fresh:
+                    yield _emit(window)
+                    fresh = False
+                # Keep the tail of the window as overlap, but always leave room for the new piece
+                while window and (window_tokens > overlap_tokens or window_tokens + piece.tokens > max_tokens):
+                    window_tokens -= window.popleft().tokens
+            window.append(piece)
+            window_tokens += piece.tokens
+            fresh = True
+
+    if window and fresh:
+        yield _emit(window)
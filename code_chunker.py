@@ -0,0 +1,158 @@
+# code_chunker.py - AST-aware chunking for Python source files
+import ast
+from chunker import Chunk, RAG_CHUNK_TOKENS
+from token_utils import count_tokens
+
+DEFINITIONS = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+
+class _Source:
+    """Source lines with character offsets, addressed by 1-based inclusive line ranges"""
+
+    def __init__(self, source: str):
+        self.lines = source.splitlines(keepends=True)
+        self.offsets = [0]
+        for line in self.lines:
+            self.offsets.append(self.offsets[-1] + len(line))
+
+    def text(self, first: int, last: int) -> str:
+        return "".join(self.lines[first - 1:last])
+
+    def chunk(self, first: int, last: int, qualname: str, kind: str, tokens: int = None) -> Chunk:
+        text = self.text(first, last)
+        return Chunk(
+            text, self.offsets[first - 1], self.offsets[last],
+            tokens if tokens is not None else count_tokens(text),
+            {"qualname": qualname, "kind": kind, "start_line": first, "end_line": last}
+        )
+
+def _first_line(node) -> int:
+    decorators = getattr(node, "decorator_list", None) or []
+    return min([node.lineno] + [d.lineno for d in decorators])
+
+def _line_windows(src: _Source, first: int, last: int, qualname: str, kind: str, max_tokens: int):
+    """Split a line range into consecutive windows of at most max_tokens (a single huge line stays whole)"""
+    start, tokens = first, 0
+    for line_no in range(first, last + 1):
+        line_tokens = count_tokens(src.lines[line_no - 1])
+        if line_no > start and tokens + line_tokens > max_tokens:
+            yield src.chunk(start, line_no - 1, qualname, kind, tokens)
+            start, tokens = line_no, 0
+        tokens += line_tokens
+    if start <= last:
+        yield src.chunk(start, last, qualname, kind, tokens)
+
+def _statement_groups(src: _Source, statements: list, qualname: str, kind: str, max_tokens: int, head=None):
+    """Pack consecutive statements into chunks, splitting on statement boundaries where possible.
+
+    `head` is an optional (first, last) line range (e.g. a signature) kept with the first group.
+    """
+    group_start, group_end, tokens = None, None, 0
+    if head is not None:
+        group_start, group_end = head
+        tokens = count_tokens(src.text(*head))
+        if tokens > max_tokens:
+            yield from _line_windows(src, *head, qualname, kind, max_tokens)
+            group_start, tokens = None, 0
+    for stmt in statements:
+        first, last = _first_line(stmt), stmt.end_lineno
+        stmt_tokens = count_tokens(src.text(first, last))
+        if group_start is not None and tokens + stmt_tokens > max_tokens:
+            yield src.chunk(group_start, group_end, qualname, kind, tokens)
+            group_start, tokens = None, 0
+        if stmt_tokens > max_tokens:
+            yield from _line_windows(src, first, last, qualname, kind, max_tokens)
+            continue
+        if group_start is None:
+            group_start = first
+        group_end, tokens = last, tokens + stmt_tokens
+    if group_start is not None:
+        yield src.chunk(group_start, group_end, qualname, kind, tokens)
+
+def _definition_chunks(src: _Source, node, prefix: str, max_tokens: int):
+    qualname = f"{prefix}.{node.name}" if prefix else node.name
+    kind = "class" if isinstance(node, ast.ClassDef) else "function"
+    first, last = _first_line(node), node.end_lineno
+    whole = src.chunk(first, last, qualname, kind)
+    if whole.tokens <= max_tokens:
+        yield whole
+        return
+
+    # Oversized: the signature (and decorators) stays with the first group of the body
+    body_first = _first_line(node.body[0])
+    head = (first, body_first - 1) if body_first > first else None
+    if kind == "class":
+        members = [stmt for stmt in node.body if isinstance(stmt, DEFINITIONS)]
+        others = [stmt for stmt in node.body if not isinstance(stmt, DEFINITIONS)]
+        yield from _statement_groups(src, others, qualname, kind, max_tokens, head)
+        for member in members:
+            yield from _definition_chunks(src, member, qualname, max_tokens)
+    else:
+        parts = list(_statement_groups(src, node.body, qualname, kind, max_tokens, head))
+        for i, part in enumerate(parts, 1):
+            if len(parts) > 1:
+                part.metadata["part"] = i
+            yield part
+
+def iter_code_chunks(source: str, max_tokens: int = RAG_CHUNK_TOKENS):
+    """Yield Chunks along module/class/function boundaries; raises SyntaxError for invalid source.
+
+    Each chunk's metadata carries the qualified name, kind and 1-based line range, so
+    retrieval can hand whole functions to the prompt instead of arbitrary slices.
+    """
+    tree = ast.parse(source)
+    src = _Source(source)
+    module_statements = []
+
+    # Header comments (shebang, license, module notes) before the first statement
+    header_end = _first_line(tree.body[0]) - 1 if tree.body else len(src.lines)
+    if header_end >= 1 and src.text(1, header_end).strip():
+        yield from _line_windows(src, 1, header_end, "<module>", "module", max_tokens)
+
+    def flush():
+        chunks = list(_statement_groups(src, module_statements, "<module>", "module", max_tokens))
+        module_statements.clear()
+        return chunks
+
+    for node in tree.body:
+        if isinstance(node, DEFINITIONS):
+            yield from flush()
+            yield from _definition_chunks(src, node, "", max_tokens)
+        else:
+            module_statements.append(node)
+    yield from flush()
+
+def iter_line_chunks(source: str, max_tokens: int = RAG_CHUNK_TOKENS):
+    """Consecutive line windows of at most max_tokens, for sources that do not parse"""
+    src = _Source(source)
+    if src.lines:
+        yield from _line_windows(src, 1, len(src.lines), "<lines>", "lines", max_tokens)
+
+def iter_code_units(source: str, max_tokens: int):
+    """Contiguous, in-order slices of a source, each as large as possible up to max_tokens.
+
+    Neighbouring AST chunks are coalesced so a file of many small functions becomes a
+    few units; the slices (blank lines included) concatenate back to the source.
+    """
+    try:
+        pieces = list(iter_code_chunks(source, max_tokens))
+    except (SyntaxError, ValueError):
+        pieces = list(iter_line_chunks(source, max_tokens))
+    src = _Source(source)
+
+    units, group, tokens = [], [], 0
+    for piece in pieces:
+        if group and tokens + piece.tokens > max_tokens:
+            units.append(group)
+            group, tokens = [], 0
+        group.append(piece)
+        tokens += piece.tokens
+    if group:
+        units.append(group)
+
+    first = 1
+    for i, group in enumerate(units):
+        # Each unit also takes the blank lines and comments up to the next one
+        last = units[i + 1][0].metadata["start_line"] - 1 if i + 1 < len(units) else len(src.lines)
+        names = ", ".join(dict.fromkeys(piece.metadata["qualname"] for piece in group))
+        yield src.chunk(first, last, names, group[0].metadata["kind"])
+        first = last + 1
@@ -0,0 +1,142 @@
+# context_packer.py - Token-budgeted assembly of retrieved RAG chunks
+import os
+from collections import namedtuple
+from logger import get_logger
+from token_utils import count_tokens
+from bm25_index import tokenize
+from rag_engine import chunk_label
+from metrics import stage
+from tracing import span
+
+logger = get_logger("context_packer", "logs/backend.log")
+
+RAG_CONTEXT_TOKENS = int(os.getenv("RAG_CONTEXT_TOKENS", "2000"))
+# Per-model context budgets, e.g. "gpt-4.1-nano=3000,gpt-4=6000"
+RAG_CONTEXT_BUDGETS = os.getenv("RAG_CONTEXT_BUDGETS", "gpt-4.1-nano=3000,gpt-3.5=2000,gpt-4=6000")
+# MMR trade-off between relevance (1.0) and novelty (0.0)
+RAG_MMR_LAMBDA = float(os.getenv("RAG_MMR_LAMBDA", "0.7"))
+# Candidates at least this similar to an already packed chunk are dropped as duplicates
+RAG_DEDUP_THRESHOLD = float(os.getenv("RAG_DEDUP_THRESHOLD", "0.9"))
+# Chunks whose source spans are at most this many characters apart are merged
+RAG_MERGE_GAP = int(os.getenv("RAG_MERGE_GAP", "2"))
+
+SEPARATOR = "\n\n"
+
+PackedContext = namedtuple("PackedContext", ["text", "tokens", "budget", "chunk_ids"])
+
+def _parse_budgets(spec: str) -> dict:
+    budgets = {}
+    for item in spec.split(","):
+        if "=" in item:
+            name, value = item.split("=", 1)
+            budgets[name.strip()] = int(value)
+    return budgets
+
+_BUDGETS = _parse_budgets(RAG_CONTEXT_BUDGETS)
+
+def context_budget(model: str) -> int:
+    """Context token budget for a model (longest configured prefix match, else the default)"""
+    matches = [name for name in _BUDGETS if model.startswith(name)]
+    return _BUDGETS[max(matches, key=len)] if matches else RAG_CONTEXT_TOKENS
+
+def _similarity_fn(index: dict):
+    """Pairwise chunk similarity: cosine on embeddings when present, else term-set Jaccard"""
+    embeddings = index.get("embeddings")
+    if embeddings is not None:
+        return lambda i, j: float(embeddings[i] @ embeddings[j])
+
+    terms = {}
+    def jaccard(i, j):
+        for k in (i, j):
+            if k not in terms:
+                terms[k] = set(tokenize(index["chunks"][k]))
+        union = len(terms[i] | terms[j])
+        return len(terms[i] & terms[j]) / union if union else 0.0
+    return jaccard
+
+def _mmr_order(candidates: list, similarity) -> list:
+    """(chunk_id, max similarity to earlier picks) pairs in maximal-marginal-relevance order"""
+    top = max((score for score, _ in candidates), default=0.0) or 1.0
+    remaining = {i: score / top for score, i in candidates}
+    chosen, ordered = [], []
+    while remaining:
+        best, best_value, best_sim = None, None, 0.0
+        for i, relevance in remaining.items():
+            sim = max((similarity(i, j) for j in chosen), default=0.0)
+            value = RAG_MMR_LAMBDA * relevance - (1 - RAG_MMR_LAMBDA) * sim
+            if best_value is None or value > best_value:
+                best, best_value, best_sim = i, value, sim
+        del remaining[best]
+        chosen.append(best)
+        ordered.append((best, best_sim))
+    return ordered
+
+def _join(previous: str, following: str, overlapping: bool) -> str:
+    """Concatenate two neighbouring chunks, dropping text the chunker repeated as overlap"""
+    if overlapping:
+        for size in range(min(len(previous), len(following)), 0, -1):
+            if previous.endswith(following[:size]):
+                return previous + following[size:]
+    return previous + ("" if previous.endswith("\n") else SEPARATOR) + following
+
+def _merge_adjacent(index: dict, chunk_ids: list) -> list:
+    """Group selected chunks whose source spans touch or overlap; returns (ids, text, metadata)"""
+    offsets = index.get("offsets") or []
+    metadata = index.get("metadata") or [None] * len(index["chunks"])
+    spans = sorted(
+        (i for i in chunk_ids if i < len(offsets) and offsets[i][0] is not None),
+        key=lambda i: offsets[i][0]
+    )
+    groups, rank = [], {i: r for r, i in enumerate(chunk_ids)}
+    for i in spans:
+        start, end = offsets[i]
+        last = groups[-1] if groups else None
+        if last and start <= last["end"] + RAG_MERGE_GAP:
+            last["text"] = _join(last["text"], index["chunks"][i], start < last["end"])
+            last["ids"].append(i)
+            last["end"] = max(last["end"], end)
+            if last["metadata"] and metadata[i]:
+                names = last["metadata"]["qualname"].split(", ")
+                if metadata[i]["qualname"] not in names:
+                    names.append(metadata[i]["qualname"])
+                last["metadata"] = dict(last["metadata"], qualname=", ".join(names),
+                                        end_line=max(last["metadata"]["end_line"], metadata[i]["end_line"]))
+        else:
+            groups.append({"ids": [i], "text": index["chunks"][i], "end": end,
+                           "metadata": dict(metadata[i]) if metadata[i] else None})
+
+    # Chunks from stores without offsets are never merged
+    merged = {i for g in groups for i in g["ids"]}
+    groups.extend({"ids": [i], "text": index["chunks"][i], "metadata": metadata[i]}
+                  for i in chunk_ids if i not in merged)
+    groups.sort(key=lambda g: min(rank[i] for i in g["ids"]))
+    return [(g["ids"], g["text"], g["metadata"]) for g in groups]
+
+@span("context_pack")
+@stage("context_pack")
+def pack_context(index: dict, candidates: list, budget: int) -> PackedContext:
+    """Greedily pack retrieved (score, chunk_id) candidates into at most `budget` tokens.
+
+    Candidates are visited in MMR order so near-duplicates lose out to novel chunks
+    (and are dropped outright above RAG_DEDUP_THRESHOLD); chunks that do not fit are
+    skipped in favour of smaller ones. Neighbouring chunks are then merged so the
+    overlap between them is sent once.
+    """
+    similarity = _similarity_fn(index)
+    metadata = index.get("metadata") or [None] * len(index["chunks"])
+    selected, used = [], 0
+    for i, max_sim in _mmr_order(candidates, similarity):
+        if selected and max_sim >= RAG_DEDUP_THRESHOLD:
+            continue
+        cost = count_tokens(chunk_label(metadata[i]) + index["chunks"][i]) + (2 if selected else 0)
+        if used + cost > budget:
+            continue
+        selected.append(i)
+        used += cost
+
+    parts = [chunk_label(meta) + text for _, text, meta in _merge_adjacent(index, selected)]
+    text = SEPARATOR.join(parts)
+    packed = PackedContext(text, count_tokens(text) if text else 0, budget, selected)
+    logger.info(f"🧩 Packed {len(selected)}/{len(candidates)} chunks into {len(parts)} blocks "
+                f"({packed.tokens}/{budget} tokens)")
+    return packed
@@ -0,0 +1,162 @@
+# document_store.py - Shared on-disk store for RAG documents
+import os
+import json
+import uuid
+import pickle
+import sqlite3
+import tempfile
+import threading
+from datetime import datetime
+from logger import get_logger
+
+logger = get_logger("document_store", "logs/backend.log")
+
+DOCUMENT_STORE_DIR = os.getenv("DOCUMENT_STORE_DIR", "data/documents")
+DOCUMENT_DB_PATH = os.path.join(DOCUMENT_STORE_DIR, "documents.db")
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import scipy.sparse as sparse
+except ImportError:
+    sparse = None
+
+_local = threading.local()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    document_id TEXT PRIMARY KEY,
+    filename TEXT,
+    content_hash TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_documents_hash ON documents(content_hash);
+CREATE TABLE IF NOT EXISTS indexes (
+    content_hash TEXT PRIMARY KEY,
+    chunk_count INTEGER NOT NULL,
+    has_embeddings INTEGER NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    content_hash TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    start_offset INTEGER,
+    end_offset INTEGER,
+    metadata TEXT,
+    PRIMARY KEY (content_hash, position)
+);
+"""
+
+def _connect() -> sqlite3.Connection:
+    """One connection per thread; WAL lets every uvicorn worker read while one writes"""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(DOCUMENT_STORE_DIR, exist_ok=True)
+        conn = sqlite3.connect(DOCUMENT_DB_PATH, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        _local.conn = conn
+    return conn
+
+def _embeddings_path(content_hash: str) -> str:
+    return os.path.join(DOCUMENT_STORE_DIR, f"{content_hash}.npy")
+
+def _tfidf_paths(content_hash: str):
+    base = os.path.join(DOCUMENT_STORE_DIR, f"{content_hash}.tfidf")
+    return f"{base}.npz", f"{base}.pkl"
+
+def _atomic_write(path: str, write):
+    # Write to a temp file first so other workers never read a partial file; the name is
+    # unique per call, since two coordinator threads may save the same content at once
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def save_index(content_hash: str, chunks: list, embeddings=None, tfidf=None, offsets=None, metadata=None):
+    """Persist chunks (with source offsets and metadata) and optionally embeddings and the TF-IDF matrix"""
+    offsets = offsets or [(None, None)] * len(chunks)
+    metadata = [json.dumps(m) if m else None for m in (metadata or [None] * len(chunks))]
+    if embeddings is not None:
+        _atomic_write(_embeddings_path(content_hash), lambda f: np.save(f, embeddings))
+    if tfidf is not None and sparse is not None:
+        matrix_path, vectorizer_path = _tfidf_paths(content_hash)
+        _atomic_write(matrix_path, lambda f: sparse.save_npz(f, tfidf["matrix"]))
+        _atomic_write(vectorizer_path, lambda f: pickle.dump(tfidf["vectorizer"], f))
+
+    conn = _connect()
+    with conn:
+        conn.execute("DELETE FROM chunks WHERE content_hash = ?", (content_hash,))
+        conn.executemany(
+            "INSERT INTO chunks (content_hash, position, text, start_offset, end_offset, metadata) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [(content_hash, i, chunk, start, end, meta)
+             for i, (chunk, (start, end), meta) in enumerate(zip(chunks, offsets, metadata))]
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO indexes (content_hash, chunk_count, has_embeddings, created_at) VALUES (?, ?, ?, ?)",
+            (content_hash, len(chunks), int(embeddings is not None), datetime.now().isoformat())
+        )
+
+def load_index(content_hash: str):
+    """Load chunks and memory-mapped embeddings for a content hash, or None if not indexed"""
+    conn = _connect()
+    row = conn.execute(
+        "SELECT chunk_count, has_embeddings FROM indexes WHERE content_hash = ?", (content_hash,)
+    ).fetchone()
+    if row is None:
+        return None
+
+    rows = conn.execute(
+        "SELECT text, start_offset, end_offset, metadata FROM chunks WHERE content_hash = ? ORDER BY position",
+        (content_hash,)
+    ).fetchall()
+    chunks = [r["text"] for r in rows]
+    offsets = [(r["start_offset"], r["end_offset"]) for r in rows]
+    metadata = [json.loads(r["metadata"]) if r["metadata"] else None for r in rows]
+    embeddings = None
+    path = _embeddings_path(content_hash)
+    if row["has_embeddings"] and np is not None and os.path.isfile(path):
+        embeddings = np.load(path, mmap_mode="r")
+
+    tfidf = None
+    matrix_path, vectorizer_path = _tfidf_paths(content_hash)
+    if sparse is not None and os.path.isfile(matrix_path) and os.path.isfile(vectorizer_path):
+        with open(vectorizer_path, "rb") as f:
+            vectorizer = pickle.load(f)
+        tfidf = {"vectorizer": vectorizer, "matrix": sparse.load_npz(matrix_path).tocsr()}
+    return {"hash": content_hash, "chunks": chunks, "offsets": offsets, "metadata": metadata,
+            "embeddings": embeddings, "tfidf": tfidf}
+
+def add_document(content_hash: str, filename: str = "") -> str:
+    """Register an uploaded document against an existing index and return its document_id"""
+    document_id = uuid.uuid4().hex
+    conn = _connect()
+    with conn:
+        conn.execute(
+            "INSERT INTO documents (document_id, filename, content_hash, created_at) VALUES (?, ?, ?, ?)",
+            (document_id, filename, content_hash, datetime.now().isoformat())
+        )
+    logger.info(f"🗂️ Registered document {document_id} ({filename}) -> {content_hash[:12]}")
+    return document_id
+
+def get_document(document_id: str):
+    """Return the document record for an id, or None"""
+    if not document_id:
+        return None
+    row = _connect().execute(
+        "SELECT document_id, filename, content_hash, created_at FROM documents WHERE document_id = ?",
+        (document_id,)
+    ).fetchone()
+    return dict(row) if row else None
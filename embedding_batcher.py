@@ -0,0 +1,156 @@
+# embedding_batcher.py - Micro-batching executor for query embeddings
+import os
+import time
+import queue
+import asyncio
+import threading
+from concurrent.futures import Future
+from logger import get_logger
+
+logger = get_logger("embedding_batcher", "logs/backend.log")
+
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "32"))
+# How long the first request of a batch waits for company before encoding
+EMBED_BATCH_WAIT_MS = float(os.getenv("EMBED_BATCH_WAIT_MS", "5"))
+EMBED_QUEUE_SIZE = int(os.getenv("EMBED_QUEUE_SIZE", "1024"))
+# Callers wait this long for queue space before the request is rejected
+EMBED_QUEUE_TIMEOUT = float(os.getenv("EMBED_QUEUE_TIMEOUT", "5"))
+# Longest wait for a queued text's embedding before the caller gives up
+EMBED_RESULT_TIMEOUT = float(os.getenv("EMBED_RESULT_TIMEOUT", "30"))
+
+class EmbeddingQueueFull(RuntimeError):
+    """Raised when the embedding queue stays full for longer than the submit timeout"""
+
+class EmbeddingBatcher:
+    """Gathers texts submitted from many threads/coroutines into single encode() calls.
+
+    A dedicated daemon thread takes the first queued text, waits up to max_wait_ms
+    (or until max_batch texts are queued) and encodes the whole batch at once, so
+    concurrent queries share one forward pass instead of competing for CPU cores.
+    The queue is bounded; when it is full, callers block and eventually get
+    EmbeddingQueueFull instead of piling up unbounded work.
+    """
+
+    _STOP = object()
+
+    def __init__(self, encode, max_batch: int = EMBED_BATCH_SIZE, max_wait_ms: float = EMBED_BATCH_WAIT_MS,
+                 queue_size: int = EMBED_QUEUE_SIZE, submit_timeout: float = EMBED_QUEUE_TIMEOUT,
+                 result_timeout: float = EMBED_RESULT_TIMEOUT):
+        self.encode = encode
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.submit_timeout = submit_timeout
+        self.result_timeout = result_timeout
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.rejected = 0
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                    self._thread.start()
+
+    def _put(self, text: str, timeout: float) -> Future:
+        self._ensure_started()
+        future = Future()
+        if timeout > 0:
+            self._queue.put((text, future), timeout=timeout)
+        else:
+            self._queue.put_nowait((text, future))
+        return future
+
+    def _reject(self):
+        self.rejected += 1
+        return EmbeddingQueueFull(f"Embedding queue full ({self._queue.maxsize} pending)")
+
+    def submit(self, text: str) -> Future:
+        """Queue a text and return a Future for its embedding (blocks while the queue is full)"""
+        try:
+            return self._put(text, self.submit_timeout)
+        except queue.Full:
+            raise self._reject()
+
+    def embed(self, text: str):
+        """Blocking embedding of one text through the shared batch"""
+        return self.submit(text).result(timeout=self.result_timeout)
+
+    async def embed_async(self, text: str):
+        """Embedding of one text without blocking the event loop, even while the queue is full"""
+        deadline = time.monotonic() + self.submit_timeout
+        while True:
+            try:
+                future = self._put(text, 0)
+                break
+            except queue.Full:
+                if time.monotonic() >= deadline:
+                    raise self._reject()
+                await asyncio.sleep(max(self.max_wait, 0.005))
+        # Cancelling the caller cancels the queued Future; the batcher then skips its text
+        return await asyncio.wait_for(asyncio.wrap_future(future), self.result_timeout)
+
+    def _collect(self, first) -> list:
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is self._STOP:
+                self._queue.put(item)
+                break
+            batch.append(item)
+        return batch
+
+    def _encode(self, batch: list):
+        # Callers that were cancelled while queued no longer want an answer
+        batch = [(text, future) for text, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        # Identical concurrent questions are encoded once
+        texts = list(dict.fromkeys(text for text, _ in batch))
+        try:
+            vectors = self.encode(texts)
+        except Exception as e:
+            logger.exception(f"❌ Embedding batch of {len(texts)} failed")
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        by_text = dict(zip(texts, vectors))
+        for text, future in batch:
+            future.set_result(by_text[text])
+        self.batches += 1
+        self.items += len(batch)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is self._STOP:
+                return
+            try:
+                self._encode(self._collect(item))
+            except Exception:
+                # The thread must outlive any one batch, or every later caller waits forever
+                logger.exception("❌ Embedding batcher failed on a batch")
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "queued": self._queue.qsize(),
+            "rejected": self.rejected
+        }
+
+    def close(self, timeout: float = 5.0):
+        if self._thread is None:
+            return
+        self._queue.put(self._STOP)
+        self._thread.join(timeout)
+        self._thread = None
@@ -0,0 +1,111 @@
+# euriai_client.py - Pooled async HTTP client for the Euriai API
+import os
+import asyncio
+import httpx
+from dotenv import load_dotenv
+from logger import get_logger
+
+load_dotenv()
+logger = get_logger("euriai_client", "logs/backend.log")
+
+EURIAI_MAX_CONNECTIONS = int(os.getenv("EURIAI_MAX_CONNECTIONS", "20"))
+EURIAI_MAX_KEEPALIVE = int(os.getenv("EURIAI_MAX_KEEPALIVE", "10"))
+EURIAI_MAX_CONCURRENCY = int(os.getenv("EURIAI_MAX_CONCURRENCY", "50"))
+EURIAI_CONNECT_TIMEOUT = float(os.getenv("EURIAI_CONNECT_TIMEOUT", "10"))
+EURIAI_READ_TIMEOUT = float(os.getenv("EURIAI_READ_TIMEOUT", "120"))
+
+class EuriaiClient:
+    """Keep-alive connection pool plus a concurrency limit, shared by all requests in a worker.
+
+    The httpx client and semaphore are bound to the event loop they were created on,
+    so both are created lazily on first use inside the running loop.
+    """
+
+    def __init__(self, api_url: str, headers: dict, guard=None):
+        self.api_url = api_url
+        self.headers = headers
+        # Optional resilience.UpstreamGuard: adaptive limit, retries and circuit breaker
+        self.guard = guard
+        self._client = None
+        self._semaphore = None
+        self._loop = None
+        # Tasks that close each loop's client when that loop shuts down
+        self._closers = set()
+
+    def _ensure_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            if self._client is not None:
+                self._retire(self._client, self._loop)
+            self._client = httpx.AsyncClient(
+                headers=self.headers,
+                limits=httpx.Limits(
+                    max_connections=EURIAI_MAX_CONNECTIONS,
+                    max_keepalive_connections=EURIAI_MAX_KEEPALIVE
+                ),
+                timeout=httpx.Timeout(EURIAI_READ_TIMEOUT, connect=EURIAI_CONNECT_TIMEOUT)
+            )
+            self._semaphore = asyncio.Semaphore(EURIAI_MAX_CONCURRENCY)
+            self._loop = loop
+            closer = loop.create_task(self._close_on_shutdown(self._client))
+            self._closers.add(closer)
+            closer.add_done_callback(self._closers.discard)
+            logger.info(f"🔌 Euriai connection pool ready (max {EURIAI_MAX_CONNECTIONS} connections)")
+        return self._client
+
+    async def _close_on_shutdown(self, client: httpx.AsyncClient):
+        """Parked on the client's loop: asyncio.run (and uvicorn) cancel leftover tasks before
+        closing the loop, which closes the connection pool while its sockets can still be closed"""
+        try:
+            await asyncio.get_running_loop().create_future()
+        finally:
+            await client.aclose()
+
+    def _retire(self, client: httpx.AsyncClient, loop):
+        """Close a client bound to another loop that is still running (e.g. in another thread)"""
+        if loop.is_running():
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+
+    async def _send(self, send, close, latency_signal: bool = True):
+        if self.guard is None:
+            response = await send()
+            if response.is_error:
+                await close(response)
+            response.raise_for_status()
+            return response
+        return await self.guard.call_async(send, close, latency_signal)
+
+    async def post(self, payload: dict, headers: dict = None) -> dict:
+        """Send a non-streaming completion request and return the decoded JSON body"""
+        client = self._ensure_client()
+        async with self._semaphore:
+            response = await self._send(
+                lambda: client.post(self.api_url, json=payload, headers=headers),
+                lambda r: r.aclose(),
+                latency_signal=False
+            )
+            return response.json()
+
+    async def stream_lines(self, payload: dict, headers: dict = None):
+        """Send a streaming completion request and yield raw response lines.
+
+        Retries only happen before the body starts; a stream cut off midway fails.
+        """
+        client = self._ensure_client()
+        async with self._semaphore:
+            request = client.build_request("POST", self.api_url, json=payload, headers=headers)
+            response = await self._send(
+                lambda: client.send(request, stream=True),
+                lambda r: r.aclose()
+            )
+            try:
+                async for line in response.aiter_lines():
+                    yield line
+            finally:
+                await response.aclose()
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._loop = None
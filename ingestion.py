@@ -0,0 +1,211 @@
+# ingestion.py - Background RAG indexing on a pool of worker processes
+import os
+import time
+import threading
+import contextvars
+import queue
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from logger import get_logger
+import job_store
+import document_store
+import rag_engine
+from tracing import span
+from metrics import stage
+
+logger = get_logger("ingestion", "logs/backend.log")
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(max(1, min(4, (os.cpu_count() or 2) - 1)))))
+# Documents are embedded in shards of this many chunks, spread across the workers
+INGEST_SHARD_CHUNKS = int(os.getenv("INGEST_SHARD_CHUNKS", "256"))
+# Ingestion jobs coordinated at once; the rest wait in the queue
+INGEST_MAX_JOBS = int(os.getenv("INGEST_MAX_JOBS", "2"))
+# spawn keeps workers independent of the server's threads and open connections
+INGEST_START_METHOD = os.getenv("INGEST_START_METHOD", "spawn")
+# How often the coordinator checks on the chunking worker while waiting for its next shard
+INGEST_POLL_INTERVAL = float(os.getenv("INGEST_POLL_INTERVAL", "0.5"))
+
+JOB_KIND = "rag_ingest"
+
+class IngestionCancelled(Exception):
+    """Raised inside a job's coordinator once the job has been cancelled"""
+
+_pool = None
+_manager = None
+_pool_lock = threading.Lock()
+_coordinator = ThreadPoolExecutor(max_workers=INGEST_MAX_JOBS, thread_name_prefix="ingest")
+
+# ---------- Worker process side ----------
+def _init_worker():
+    """Load the sentence tokenizer and embedding model once per worker process"""
+    rag_engine.warm_up()
+
+def _chunk_shards(document_text: str, mode: str, shards, shard_size: int) -> int:
+    """Chunk a document, handing each shard_size run of chunks to the coordinator as soon as it is cut"""
+    texts, offsets, metadata, total = [], [], [], 0
+    for piece in rag_engine.iter_document_chunks(document_text, mode):
+        texts.append(piece.text)
+        offsets.append((piece.start, piece.end))
+        metadata.append(piece.metadata)
+        if len(texts) == shard_size:
+            shards.put((texts, offsets, metadata))
+            total += len(texts)
+            texts, offsets, metadata = [], [], []
+    if texts:
+        shards.put((texts, offsets, metadata))
+        total += len(texts)
+    shards.put(None)
+    return total
+
+def _encode(chunks: list):
+    return rag_engine.encode_chunks(chunks)
+
+def _fit_tfidf(chunks: list):
+    return rag_engine.fit_tfidf(chunks)
+
+# ---------- Server side ----------
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=INGEST_WORKERS,
+                mp_context=multiprocessing.get_context(INGEST_START_METHOD),
+                initializer=_init_worker
+            )
+            logger.info(f"🏭 Started ingestion pool with {INGEST_WORKERS} workers")
+        return _pool
+
+def _shard_queue():
+    """A queue worker processes can feed; the manager process is started on first use"""
+    global _manager
+    with _pool_lock:
+        if _manager is None:
+            _manager = multiprocessing.get_context(INGEST_START_METHOD).Manager()
+        return _manager.Queue()
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+def _next_shard(shards, chunking):
+    """The next shard from the chunking worker, None once it is done; raises if chunking failed"""
+    while True:
+        try:
+            return shards.get(timeout=INGEST_POLL_INTERVAL)
+        except queue.Empty:
+            if chunking.done():
+                # A finished worker put its end marker before returning, so only a failure lands here
+                chunking.result()
+                return None
+
+def _cancel_if_requested(job_id: str, futures):
+    if job_store.get_job(job_id)["status"] == "cancelled":
+        for pending in futures:
+            pending.cancel()
+        raise IngestionCancelled(job_id)
+
+def _build_in_pool(job_id: str, document_text: str, mode: str, doc_hash: str) -> dict:
+    pool = _get_pool()
+    shards = _shard_queue()
+    job_store.update_job(job_id, message="Chunking document")
+    chunking = pool.submit(_chunk_shards, document_text, mode, shards, INGEST_SHARD_CHUNKS)
+
+    # Each shard is embedded as soon as the chunker cuts it, so chunking overlaps with embedding
+    chunks, offsets, metadata, encoding = [], [], [], {}
+    with span("chunk", mode=mode), stage("chunk"):
+        while (shard := _next_shard(shards, chunking)) is not None:
+            encoding[pool.submit(_encode, shard[0])] = len(chunks)
+            chunks += shard[0]
+            offsets += shard[1]
+            metadata += shard[2]
+            job_store.update_job(job_id, message=f"Chunking document, {len(chunks)} chunks so far")
+            _cancel_if_requested(job_id, encoding)
+        chunking.result()
+    if not chunks:
+        return rag_engine.store_rag_index(doc_hash, chunks, offsets, metadata, mode=mode)
+
+    tfidf_future = pool.submit(_fit_tfidf, chunks)
+    job_store.update_job(job_id, progress=0.1, message=f"Embedding {len(chunks)} chunks in {len(encoding)} shards")
+
+    encoded, done = {}, 0
+    with span("embed_chunks", chunks=len(chunks), shards=len(encoding)), stage("embed_chunks"):
+        for future in as_completed(encoding):
+            encoded[encoding[future]] = future.result()
+            done += 1
+            _cancel_if_requested(job_id, list(encoding) + [tfidf_future])
+            # Chunking counts as the first tenth of the work
+            job_store.update_job(job_id, progress=round(0.1 + 0.85 * done / len(encoding), 3))
+
+    parts = [encoded[start] for start in sorted(encoded)]
+    embeddings = None
+    if np is not None and all(part is not None for part in parts):
+        embeddings = np.vstack(parts)
+    with stage("tfidf_fit"):
+        tfidf = tfidf_future.result()
+    return rag_engine.store_rag_index(doc_hash, chunks, offsets, metadata, embeddings, tfidf, mode)
+
+@span("ingest_job")
+def _run(job_id: str, document_text: str, filename: str):
+    started = time.perf_counter()
+    if not job_store.start_if_queued(job_id):
+        logger.info(f"🛑 Ingestion job {job_id} was cancelled before it started")
+        return
+    try:
+        mode = rag_engine.chunking_mode(filename)
+        doc_hash = rag_engine.document_hash(document_text, mode)
+        index = rag_engine.get_rag_index(doc_hash)
+        if index is None or index["embeddings"] is None:
+            try:
+                index = _build_in_pool(job_id, document_text, mode, doc_hash)
+            except BrokenProcessPool:
+                logger.warning("⚠️ Ingestion pool broke, indexing in-process")
+                _reset_pool()
+                index = rag_engine.build_rag_index(document_text, filename)
+
+        if job_store.get_job(job_id)["status"] == "cancelled":
+            raise IngestionCancelled(job_id)
+        document_id = document_store.add_document(index["hash"], filename)
+        job_store.finish_if_active(
+            job_id, "done", progress=1.0, message="✅ File ready for RAG. Now you can ask questions.",
+            result={"document_id": document_id, "chunks": len(index["chunks"])}
+        )
+        logger.info(f"✅ Ingestion job {job_id} finished in {time.perf_counter() - started:.2f}s")
+    except IngestionCancelled:
+        logger.info(f"🛑 Ingestion job {job_id} cancelled")
+    except Exception as e:
+        logger.exception(f"❌ Ingestion job {job_id} failed")
+        job_store.finish_if_active(job_id, "failed", error=str(e))
+
+def submit_ingestion(document_text: str, filename: str = "") -> str:
+    """Queue a document for indexing and return the job id immediately"""
+    job_id = job_store.create_job(JOB_KIND, {"filename": filename, "chars": len(document_text)})
+    # The job runs in the request's context so its spans join the upload's trace
+    _coordinator.submit(contextvars.copy_context().run, _run, job_id, document_text, filename)
+    logger.info(f"📥 Queued ingestion job {job_id} for {filename} ({len(document_text)} chars)")
+    return job_id
+
+def cancel(job_id: str) -> bool:
+    """Cancel a queued or running ingestion job; a running one stops after its current shard"""
+    if not job_store.finish_if_active(job_id, "cancelled"):
+        return False
+    logger.info(f"🛑 Cancelled ingestion job {job_id}")
+    return True
+
+def shutdown():
+    global _manager
+    _coordinator.shutdown(wait=False, cancel_futures=True)
+    _reset_pool()
+    with _pool_lock:
+        if _manager is not None:
+            _manager.shutdown()
+        _manager = None
@@ -0,0 +1,122 @@
+# job_queue.py - Bounded background queue for long-running file analyses
+import os
+import time
+import asyncio
+from logger import get_logger
+import job_store
+from ai_engine import debug_code_async, document_code_async, modularize_code_async
+
+logger = get_logger("job_queue", "logs/backend.log")
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "100"))
+
+JOB_KIND = "analyze_file"
+
+ACTIONS = {
+    "debug": lambda code: debug_code_async("Python", code),
+    "document": document_code_async,
+    "modularize": modularize_code_async
+}
+
+class JobQueueFull(RuntimeError):
+    """Raised when JOB_QUEUE_SIZE jobs are already waiting"""
+
+class JobQueue:
+    """Runs analyze_file actions on a fixed number of asyncio workers.
+
+    Job state lives in job_store so clients can poll it (and it survives restarts
+    as a record); the file contents only live in the in-memory queue.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, queue_size: int = JOB_QUEUE_SIZE):
+        self.worker_count = workers
+        self.queue_size = queue_size
+        self._queue = None
+        self._workers = []
+        self._running = {}
+        self._cancel_requested = set()
+
+    async def start(self):
+        if self._workers:
+            return
+        job_store.fail_orphaned()
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._workers = [asyncio.create_task(self._worker(i)) for i in range(self.worker_count)]
+        logger.info(f"🧵 Started {self.worker_count} analysis job workers")
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def submit(self, action: str, code: str, filename: str = "") -> str:
+        """Queue an analysis and return its job id; raises JobQueueFull when saturated"""
+        if action not in ACTIONS:
+            raise ValueError(f"Unsupported background action '{action}', expected one of {list(ACTIONS)}")
+        if self._queue is None:
+            raise RuntimeError("Job queue is not running")
+        if self._queue.full():
+            raise JobQueueFull(f"{self._queue.qsize()} analysis jobs already queued")
+        job_id = job_store.create_job(JOB_KIND, {"action": action, "filename": filename, "chars": len(code)})
+        self._queue.put_nowait((job_id, action, code))
+        logger.info(f"📥 Queued {action} job {job_id} for {filename}")
+        return job_id
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a queued or running job; returns False if it had already finished"""
+        if not job_store.finish_if_active(job_id, "cancelled"):
+            return False
+        # Queued jobs see the cancel when a worker tries to start them, in any uvicorn worker
+        task = self._running.get(job_id)
+        if task is not None:
+            self._cancel_requested.add(job_id)
+            task.cancel()
+        logger.info(f"🛑 Cancelled job {job_id}")
+        return True
+
+    async def _run(self, job_id: str, action: str, code: str):
+        started = time.perf_counter()
+        # Conditional, since a cancel may have been handled by another uvicorn worker
+        if not job_store.start_if_queued(job_id):
+            logger.info(f"🛑 Job {job_id} was cancelled before it started")
+            return
+        task = asyncio.create_task(ACTIONS[action](code))
+        self._running[job_id] = task
+        try:
+            result = await task
+        finally:
+            self._running.pop(job_id, None)
+
+        # The AI helpers report upstream failures as "Error: ..." strings
+        if isinstance(result, str) and result.startswith("Error:"):
+            job_store.finish_if_active(job_id, "failed", error=result)
+        else:
+            job_store.finish_if_active(job_id, "done", progress=1.0, result={"response": result})
+        logger.info(f"✅ {action} job {job_id} finished in {time.perf_counter() - started:.2f}s")
+
+    async def _worker(self, number: int):
+        while True:
+            job_id, action, code = await self._queue.get()
+            try:
+                await self._run(job_id, action, code)
+            except asyncio.CancelledError:
+                if job_id not in self._cancel_requested:
+                    job_store.finish_if_active(job_id, "failed", error="Interrupted by server shutdown")
+                    raise
+            except Exception as e:
+                logger.exception(f"❌ Job {job_id} failed")
+                job_store.finish_if_active(job_id, "failed", error=str(e))
+            finally:
+                self._cancel_requested.discard(job_id)
+                self._queue.task_done()
+
+    def stats(self) -> dict:
+        return {
+            "workers": len(self._workers),
+            "queued": self._queue.qsize() if self._queue else 0,
+            "running": len(self._running)
+        }
+
+job_queue = JobQueue()
@@ -0,0 +1,160 @@
+# job_store.py - Durable status records for background jobs
+import os
+import json
+import uuid
+import socket
+import sqlite3
+import threading
+from datetime import datetime
+from logger import get_logger
+
+logger = get_logger("job_store", "logs/backend.log")
+
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", "data/jobs.db")
+
+# queued -> running -> done | failed | cancelled (queued jobs can also go straight to cancelled)
+STATUSES = ("queued", "running", "done", "failed", "cancelled")
+FINISHED = ("done", "failed", "cancelled")
+
+# Jobs are owned by the process that runs them, so a restart can tell its orphans apart.
+# host:pid repeats across container restarts (same hostname, PID 1), hence the per-start id.
+BOOT_ID = uuid.uuid4().hex[:12]
+OWNER = f"{socket.gethostname()}:{os.getpid()}:{BOOT_ID}"
+
+_local = threading.local()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    progress REAL NOT NULL DEFAULT 0,
+    message TEXT,
+    params TEXT,
+    result TEXT,
+    error TEXT,
+    created_at TEXT NOT NULL,
+    started_at TEXT,
+    finished_at TEXT,
+    owner TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status);
+"""
+
+_JSON_FIELDS = ("params", "result")
+
+def _connect() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(JOB_DB_PATH) or ".", exist_ok=True)
+        conn = sqlite3.connect(JOB_DB_PATH, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        _local.conn = conn
+    return conn
+
+def _now() -> str:
+    return datetime.now().isoformat()
+
+def create_job(kind: str, params: dict = None) -> str:
+    """Record a queued job and return its id"""
+    job_id = uuid.uuid4().hex
+    conn = _connect()
+    with conn:
+        conn.execute(
+            "INSERT INTO jobs (job_id, kind, status, params, created_at, owner) VALUES (?, ?, 'queued', ?, ?, ?)",
+            (job_id, kind, json.dumps(params or {}), _now(), OWNER)
+        )
+    return job_id
+
+def _assignments(fields: dict):
+    for name in _JSON_FIELDS:
+        if name in fields:
+            fields[name] = json.dumps(fields[name])
+    return ", ".join(f"{name} = ?" for name in fields), list(fields.values())
+
+def update_job(job_id: str, **fields):
+    """Set any of status, progress, message, result and error on a job"""
+    if fields.get("status") == "running":
+        fields.setdefault("started_at", _now())
+    if fields.get("status") in FINISHED:
+        fields.setdefault("finished_at", _now())
+    assignments, values = _assignments(fields)
+    conn = _connect()
+    with conn:
+        conn.execute(f"UPDATE jobs SET {assignments} WHERE job_id = ?", (*values, job_id))
+
+def _seconds(start: str, end: str):
+    if not start or not end:
+        return None
+    return round((datetime.fromisoformat(end) - datetime.fromisoformat(start)).total_seconds(), 3)
+
+def get_job(job_id: str):
+    """Return a job record as a dict (with queue/run timings in seconds), or None"""
+    row = _connect().execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+    if row is None:
+        return None
+    job = dict(row)
+    for name in _JSON_FIELDS:
+        job[name] = json.loads(job[name]) if job[name] else None
+    now = _now() if job["status"] not in FINISHED else job["finished_at"]
+    job["timings"] = {
+        "queued_seconds": _seconds(job["created_at"], job["started_at"] or now),
+        "run_seconds": _seconds(job["started_at"], now),
+        "total_seconds": _seconds(job["created_at"], now)
+    }
+    return job
+
+def start_if_queued(job_id: str) -> bool:
+    """Move a job from queued to running; False if it was cancelled (or claimed) meanwhile"""
+    conn = _connect()
+    with conn:
+        cursor = conn.execute(
+            "UPDATE jobs SET status = 'running', progress = 0, started_at = ? WHERE job_id = ? AND status = 'queued'",
+            (_now(), job_id)
+        )
+    return cursor.rowcount > 0
+
+def finish_if_active(job_id: str, status: str, **fields) -> bool:
+    """Move a job to a finished status unless it already finished; returns whether it changed"""
+    fields.update(status=status, finished_at=_now())
+    assignments, values = _assignments(fields)
+    conn = _connect()
+    with conn:
+        cursor = conn.execute(
+            f"UPDATE jobs SET {assignments} WHERE job_id = ? AND status IN ('queued', 'running')",
+            (*values, job_id)
+        )
+    return cursor.rowcount > 0
+
+def _owner_alive(owner: str) -> bool:
+    try:
+        host, pid, boot_id = owner.rsplit(":", 2)
+    except (AttributeError, ValueError):
+        return False
+    if host != socket.gethostname():
+        # Processes on other machines cannot be checked, so their jobs are left alone
+        return True
+    if int(pid) == os.getpid():
+        # Our own pid under another boot id: an earlier run of this container
+        return boot_id == BOOT_ID
+    try:
+        os.kill(int(pid), 0)
+    except (ValueError, ProcessLookupError):
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def fail_orphaned() -> int:
+    """Mark queued/running jobs whose owning process has exited as failed; returns how many"""
+    conn = _connect()
+    rows = conn.execute("SELECT job_id, owner FROM jobs WHERE status IN ('queued', 'running')").fetchall()
+    orphaned = [row["job_id"] for row in rows if row["owner"] != OWNER and not _owner_alive(row["owner"])]
+    for job_id in orphaned:
+        finish_if_active(job_id, "failed", error="Interrupted by server restart")
+    if orphaned:
+        logger.warning(f"⚠️ Marked {len(orphaned)} orphaned jobs as failed")
+    return len(orphaned)
@@ -1,19 +1,214 @@
-import logging
 import os
+import json
+import time
+import queue
+import atexit
+import random
+import hashlib
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from dotenv import load_dotenv
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+load_dotenv()
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "json" writes one JSON object per line to the log file; "text" keeps the classic format
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+LOG_CONSOLE = os.getenv("LOG_CONSOLE", "true").lower() in ("1", "true", "yes")
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUPS = int(os.getenv("LOG_BACKUPS", "5"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Longest payload/text excerpt written to the logs; the rest is replaced by its length and hash
+LOG_PAYLOAD_CHARS = int(os.getenv("LOG_PAYLOAD_CHARS", "300"))
+# Share of INFO/DEBUG records kept per logger, e.g. "ai_engine=0.1,main=0.5"; warnings are always kept
+LOG_SAMPLE_RATES = {
+    name.strip(): float(rate)
+    for name, _, rate in (item.partition("=") for item in os.getenv("LOG_SAMPLE_RATES", "").split(","))
+    if name.strip() and rate
+}
+
+TEXT_FORMAT = '[%(asctime)s] %(levelname)s - %(name)s:%(lineno)d - %(message)s'
+
+# Attributes every LogRecord has; anything else came in through `extra=` and goes into the JSON
+_STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per record, with `extra=` fields included"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 6),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)),
+            "level": record.levelname,
+            "logger": record.name,
+            "line": record.lineno,
+            "msg": record.getMessage()
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class _DroppingQueueHandler(QueueHandler):
+    """Hands records to the listener thread; drops them instead of blocking when the queue is full"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+class _SamplingFilter(logging.Filter):
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+class _SharedRotatingFileHandler(RotatingFileHandler):
+    """Size-based rotation that several processes can share (uvicorn and ingestion workers).
+
+    Writes and rollovers happen under an exclusive lock on a sidecar .lock file, and
+    a process whose file was rotated by another one reopens the new file first.
+    """
+
+    def __init__(self, filename: str, **kwargs):
+        super().__init__(filename, delay=True, **kwargs)
+        self._lock_file = None
+
+    def _reopen_if_rotated(self):
+        if self.stream is None:
+            return
+        try:
+            on_disk = os.stat(self.baseFilename)
+        except FileNotFoundError:
+            on_disk = None
+        opened = os.fstat(self.stream.fileno())
+        if on_disk is None or (on_disk.st_dev, on_disk.st_ino) != (opened.st_dev, opened.st_ino):
+            self.stream.close()
+            self.stream = None
+
+    def emit(self, record):
+        if self._lock_file is None:
+            self._lock_file = open(f"{self.baseFilename}.lock", "a")
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        try:
+            self._reopen_if_rotated()
+            super().emit(record)
+        finally:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def close(self):
+        super().close()
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+class _Listener(QueueListener):
+    def enqueue_sentinel(self):
+        # Blocks for a free slot: a dropped sentinel would leave stop() waiting forever
+        self.queue.put(self._sentinel)
+
+def _file_handler(log_file: str) -> logging.Handler:
+    if fcntl is None:
+        # No inter-process lock: each process rotates a file of its own
+        root, ext = os.path.splitext(log_file)
+        return RotatingFileHandler(f"{root}.{os.getpid()}{ext}", maxBytes=LOG_MAX_BYTES,
+                                   backupCount=LOG_BACKUPS, encoding="utf-8")
+    return _SharedRotatingFileHandler(log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS,
+                                      encoding="utf-8")
+
+_lock = threading.Lock()
+_queue_handlers = {}
+_listeners = []
+
+def _file_formatter() -> logging.Formatter:
+    return JSONFormatter() if LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT)
+
+def _queue_handler(log_file: str) -> QueueHandler:
+    """One queue and background listener per log file, shared by every logger writing to it"""
+    with _lock:
+        handler = _queue_handlers.get(log_file)
+        if handler is None:
+            file_handler = _file_handler(log_file)
+            file_handler.setFormatter(_file_formatter())
+            handlers = [file_handler]
+            if LOG_CONSOLE:
+                console_handler = logging.StreamHandler()
+                console_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+                handlers.append(console_handler)
+
+            log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+            listener = _Listener(log_queue, *handlers, respect_handler_level=True)
+            listener.start()
+            _listeners.append(listener)
+            handler = _queue_handlers[log_file] = _DroppingQueueHandler(log_queue)
+        return handler
+
+def _stop_listeners():
+    """Flush whatever is still queued when the process exits"""
+    for listener in _listeners:
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+    _listeners.clear()
+
+atexit.register(_stop_listeners)
 
 def get_logger(name: str, log_file: str = "logs/app.log") -> logging.Logger:
     os.makedirs("logs", exist_ok=True)
     logger = logging.getLogger(name)
-    logger.setLevel(logging.INFO)
-
-    formatter = logging.Formatter('[%(asctime)s] %(levelname)s - %(name)s:%(lineno)d - %(message)s')
+    logger.setLevel(LOG_LEVEL)
 
     if not logger.handlers:
-        file_handler = logging.FileHandler(log_file)
-        file_handler.setFormatter(formatter)
-        console_handler = logging.StreamHandler()
-        console_handler.setFormatter(formatter)
-        logger.addHandler(file_handler)
-        logger.addHandler(console_handler)
+        logger.addHandler(_queue_handler(log_file))
+        # Each logger owns its file; root handlers (e.g. uvicorn's) would write synchronously
+        logger.propagate = False
+        rate = LOG_SAMPLE_RATES.get(name)
+        if rate is not None and rate < 1.0:
+            logger.addFilter(_SamplingFilter(rate))
 
     return logger
+
+def dropped_records() -> int:
+    """Records discarded because a log queue was full"""
+    return sum(h.dropped for h in _queue_handlers.values())
+
+def digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8", "replace")).hexdigest()[:12]
+
+def truncate(text, limit: int = LOG_PAYLOAD_CHARS) -> str:
+    """Text short enough to log; longer text keeps its head plus length and hash"""
+    text = str(text)
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}… [{len(text)} chars, sha256:{digest(text)}]"
+
+def payload_summary(payload: dict) -> dict:
+    """What is worth logging about a chat-completions payload: settings, sizes, a hash and a short preview"""
+    messages = payload.get("messages") or []
+    content = "\n".join(str(m.get("content", "")) for m in messages)
+    return {
+        "model": payload.get("model"),
+        "stream": payload.get("stream", False),
+        "temperature": payload.get("temperature"),
+        "messages": len(messages),
+        "chars": len(content),
+        "sha256": digest(content),
+        "preview": truncate(content, min(LOG_PAYLOAD_CHARS, 120))
+    }
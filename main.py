@@ -1,20 +1,63 @@
 # main.py
 from fastapi import FastAPI, UploadFile, File, Form, Request
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
+from contextlib import asynccontextmanager
+import ai_engine
 from ai_engine import (
-    explain_code, explain_code_stream, debug_code, generate_code,
-    ask_generic_question, document_code, modularize_code
+    explain_code_async, explain_code_stream_async, debug_code_async, generate_code_async,
+    ask_generic_question_async, document_code_async,
+    debug_code_stream_async, generate_code_stream_async, ask_generic_question_stream_async,
+    document_code_stream_async, modularize_code_stream_async
 )
-from rag_engine import get_rag_context
-from logger import get_logger
-from token_utils import log_token_usage
+from rag_engine import get_rag_index, rank_rag_index
+from context_packer import pack_context, context_budget
+from logger import get_logger, truncate, dropped_records
+import document_store
+import job_store
+import ingestion
+from job_queue import job_queue, JobQueueFull, ACTIONS as job_queue_actions
+import rag_engine
+from token_utils import usage_writer, summarize_token_usage, query_token_usage
+import traffic_recorder
+import metrics
+import tracing
+import time
 import os
 
 logger = get_logger("main", "logs/backend.log")
-app = FastAPI()
 
-rag_session = {"document_text": "", "filename": ""}
+RAG_WARMUP = os.getenv("RAG_WARMUP", "true").lower() in ("1", "true", "yes")
+# Retrieved candidates handed to the context packer, which trims them to the model's token budget
+RAG_PACK_CANDIDATES = int(os.getenv("RAG_PACK_CANDIDATES", "20"))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if RAG_WARMUP:
+        rag_engine.start_warm_up()
+    await job_queue.start()
+    yield
+    await job_queue.stop()
+    await ai_engine.async_client.aclose()
+    await run_in_threadpool(rag_engine.embedding_batcher.close)
+    ingestion.shutdown()
+    await run_in_threadpool(usage_writer.close)
+    await run_in_threadpool(traffic_recorder.traffic_writer.close)
+    await run_in_threadpool(tracing.trace_writer.close)
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(metrics.MetricsMiddleware, routes=app.routes)
+
+if traffic_recorder.RECORD_TRAFFIC:
+    # Replay captures with bench/replay.py
+    app.add_middleware(traffic_recorder.TrafficRecorder)
+    for guard in (ai_engine.sync_guard, ai_engine.async_guard):
+        guard.observers.append(traffic_recorder.note_upstream)
+    logger.info(f"🎙️ Recording {traffic_recorder.RECORD_SAMPLE_RATE:.0%} of requests to {traffic_recorder.RECORD_PATH}")
+
+# Added last so it wraps the other middleware: every span and log record of a request shares its trace id
+app.add_middleware(tracing.TracingMiddleware)
 
 class CodeRequest(BaseModel):
     language: str
@@ -28,38 +71,167 @@ class RAGRequest(BaseModel):
     question: str
     document_id: str = None
 
+class RAGRequestError(Exception):
+    """The requested document is unknown or has no index"""
+
+def _stream_response(stream) -> StreamingResponse:
+    return StreamingResponse(stream, media_type="text/plain; charset=utf-8")
+
 @app.post("/explain")
-def explain(req: CodeRequest):
+async def explain(req: CodeRequest):
     logger.info("📖 /explain request")
-    return {"response": explain_code(req.language, req.topic, req.level)}
-
-from fastapi.responses import StreamingResponse, JSONResponse
+    return {"response": await explain_code_async(req.language, req.topic, req.level)}
 
 @app.post("/explain_stream")
-def explain_stream(req: CodeRequest):
+async def explain_stream(req: CodeRequest):
     try:
-        logger.info(f"🌊 Streaming explanation for: {req.topic}")
-        stream = explain_code_stream(req.language, req.topic, req.level)
-        return StreamingResponse(stream, media_type="text/plain; charset=utf-8")
+        logger.info(f"🌊 Streaming explanation for: {truncate(req.topic)}")
+        return _stream_response(explain_code_stream_async(req.language, req.topic, req.level))
     except Exception as e:
         logger.exception("❌ Error in /explain_stream")
         return JSONResponse(status_code=500, content={"error": str(e)})
 
 
 @app.post("/debug")
-def debug(req: CodeRequest):
-    logger.info(f"🐞 Debug requested: {req.topic}")
-    return {"response": debug_code(req.language, req.topic)}
+async def debug(req: CodeRequest):
+    logger.info(f"🐞 Debug requested: {truncate(req.topic)}")
+    return {"response": await debug_code_async(req.language, req.topic)}
 
 @app.post("/generate")
-def generate(req: CodeRequest):
-    logger.info(f"💡 Generate code for: {req.topic}")
-    return {"response": generate_code(req.language, req.topic, req.level)}
+async def generate(req: CodeRequest):
+    logger.info(f"💡 Generate code for: {truncate(req.topic)}")
+    return {"response": await generate_code_async(req.language, req.topic, req.level)}
 
 @app.post("/ask")
-def ask(req: AskRequest):
-    logger.info(f"🧠 Generic question: {req.question}")
-    return {"response": ask_generic_question(req.question)}
+async def ask(req: AskRequest):
+    logger.info(f"🧠 Generic question: {truncate(req.question)}")
+    return {"response": await ask_generic_question_async(req.question)}
+
+@app.post("/debug_stream")
+async def debug_stream(req: CodeRequest):
+    logger.info(f"🐞 Streaming debug for: {truncate(req.topic)}")
+    return _stream_response(debug_code_stream_async(req.language, req.topic))
+
+@app.post("/generate_stream")
+async def generate_stream(req: CodeRequest):
+    logger.info(f"💡 Streaming code generation for: {truncate(req.topic)}")
+    return _stream_response(generate_code_stream_async(req.language, req.topic, req.level))
+
+@app.post("/ask_stream")
+async def ask_stream(req: AskRequest):
+    logger.info(f"🧠 Streaming generic question: {truncate(req.question)}")
+    return _stream_response(ask_generic_question_stream_async(req.question))
+
+@app.get("/ready")
+def ready():
+    status = rag_engine.engine_status()
+    return JSONResponse(status_code=200 if status["ready"] else 503, content={"embedding_engine": status})
+
+@app.get("/usage")
+def usage(bucket: str = "hour", hours: float = 24, model: str = None, endpoint: str = None):
+    try:
+        end = time.time()
+        return {
+            "summary": summarize_token_usage(),
+            "series": query_token_usage(end - hours * 3600, end, bucket, model, endpoint)
+        }
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+
+@app.get("/cache_stats")
+def cache_stats():
+    return {
+        "response_cache": ai_engine.response_cache.stats(),
+        "semantic_cache": ai_engine.semantic_cache.stats(),
+        "embedding_batcher": rag_engine.embedding_batcher.stats(),
+        "single_flight": ai_engine.single_flight_stats()
+    }
+
+@app.get("/upstream_stats")
+def upstream_stats():
+    return ai_engine.upstream_stats()
+
+@metrics.REGISTRY.collector
+def _component_metrics():
+    """Scrape-time samples from the caches, batcher, coalescing, upstream guard and job queue"""
+    caches = {"response": ai_engine.response_cache.stats(), "semantic": ai_engine.semantic_cache.stats()}
+    batcher = rag_engine.embedding_batcher.stats()
+    flights = ai_engine.single_flight_stats()
+    upstream = ai_engine.upstream_stats()
+    jobs = job_queue.stats()
+    return [
+        ("cache_hits_total", "counter", "Cache lookups served from the cache",
+         [({"cache": name}, c["hits"]) for name, c in caches.items()]),
+        ("cache_misses_total", "counter", "Cache lookups that missed",
+         [({"cache": name}, c["misses"]) for name, c in caches.items()]),
+        ("cache_hit_ratio", "gauge", "Hits over lookups since start",
+         [({"cache": name}, c["hit_ratio"]) for name, c in caches.items()]),
+        ("cache_entries", "gauge", "Entries held in memory",
+         [({"cache": name}, c["entries"]) for name, c in caches.items()]),
+        ("embedding_batches_total", "counter", "encode() calls made by the embedding batcher",
+         [({}, batcher["batches"])]),
+        ("embedding_batch_items_total", "counter", "Texts encoded by the embedding batcher",
+         [({}, batcher["items"])]),
+        ("embedding_queue_depth", "gauge", "Texts waiting for the embedding batcher",
+         [({}, batcher["queued"])]),
+        ("single_flight_coalesced_total", "counter", "Requests that shared another request's upstream call",
+         [({}, flights["coalesced"])]),
+        ("upstream_concurrency_limit", "gauge", "Adaptive upstream concurrency limit",
+         [({}, upstream["limiter"]["limit"])]),
+        ("upstream_in_flight", "gauge", "Upstream calls in flight", [({}, upstream["limiter"]["in_flight"])]),
+        ("upstream_circuit_open", "gauge", "1 while the upstream circuit breaker is open",
+         [({}, 1 if upstream["breaker"]["state"] == "open" else 0)]),
+        ("upstream_retries_total", "counter", "Upstream attempts retried",
+         [({"path": path}, upstream[path]["retries"]) for path in ("sync", "async")]),
+        ("analysis_jobs", "gauge", "Background analysis jobs by state",
+         [({"state": "queued"}, jobs["queued"]), ({"state": "running"}, jobs["running"])]),
+        ("log_records_dropped_total", "counter", "Log records dropped because the log queue was full",
+         [({}, dropped_records())])
+    ]
+
+@app.get("/metrics")
+def prometheus_metrics():
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.post("/jobs")
+async def submit_job(action: str = Form(...), file: UploadFile = File(...)):
+    """Run a debug/document/modularize analysis in the background; poll /jobs/{job_id}"""
+    try:
+        code = (await file.read()).decode("utf-8")
+        job_id = job_queue.submit(action, code, file.filename or "")
+        return {"job_id": job_id, "status": "queued"}
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": f"❌ {e}"})
+    except JobQueueFull as e:
+        return JSONResponse(status_code=503, content={"error": f"❌ {e}, try again later"})
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    job = job_store.get_job(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": f"❌ Unknown job {job_id}"})
+    return job
+
+@app.get("/jobs/{job_id}/result")
+def job_result(job_id: str):
+    job = job_store.get_job(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": f"❌ Unknown job {job_id}"})
+    if job["status"] in ("queued", "running"):
+        return JSONResponse(status_code=202, content={"status": job["status"], "progress": job["progress"]})
+    if job["status"] != "done":
+        return JSONResponse(status_code=409, content={"status": job["status"], "error": job["error"] or job["status"]})
+    return {"status": "done", **(job["result"] or {}), "timings": job["timings"]}
+
+@app.post("/jobs/{job_id}/cancel")
+def cancel_job(job_id: str):
+    job = job_store.get_job(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": f"❌ Unknown job {job_id}"})
+    # Each kind of job has its own cancel path (and bookkeeping)
+    cancel = ingestion.cancel if job["kind"] == ingestion.JOB_KIND else job_queue.cancel
+    cancelled = cancel(job_id)
+    return {"cancelled": cancelled, "status": job_store.get_job(job_id)["status"]}
 
 @app.post("/analyze_file")
 async def analyze_file(action: str = Form(...), file: UploadFile = File(...)):
@@ -68,17 +240,18 @@ async def analyze_file(action: str = Form(...), file: UploadFile = File(...)):
         logger.info(f"📄 Received file for action: {action}")
 
         if action == "explain":
-            result = document_code(code)
-        elif action == "debug":
-            result = debug_code("Python", code)
-        elif action == "document":
-            result = document_code(code)
-        elif action == "modularize":
-            result = modularize_code(code)
+            result = await document_code_async(code)
+        elif action in job_queue_actions:
+            # Long analyses run on the job queue instead of holding the request open; poll /jobs/{job_id}
+            try:
+                job_id = job_queue.submit(action, code, file.filename or "")
+            except JobQueueFull as e:
+                return JSONResponse(status_code=503, content={"error": f"❌ {e}, try again later"})
+            return {"response": f"⏳ {action.capitalize()} job queued...", "job_id": job_id}
         elif action == "rag":
-            rag_session["document_text"] = code
-            rag_session["filename"] = file.filename
-            result = "✅ File ready for RAG. Now you can ask questions."
+            # Indexing runs on the ingestion pool; clients poll /jobs/{job_id} for the document_id
+            job_id = await run_in_threadpool(ingestion.submit_ingestion, code, file.filename or "")
+            return {"response": "⏳ Indexing document...", "job_id": job_id}
         else:
             result = "❌ Invalid action."
 
@@ -88,20 +261,60 @@ async def analyze_file(action: str = Form(...), file: UploadFile = File(...)):
         logger.exception("❌ Error analyzing file")
         return {"error": f"Error analyzing file: {e}"}
 
+async def _rag_prompt(request: RAGRequest):
+    """Retrieve and pack context for a RAG question; returns (combined_prompt, packed_context)"""
+    document = document_store.get_document(request.document_id)
+    if document is None:
+        raise RAGRequestError("❌ No document uploaded for RAG.")
+
+    index = get_rag_index(document["content_hash"])
+    if index is None:
+        raise RAGRequestError(f"❌ Document {request.document_id} has no RAG index.")
+
+    logger.info(f"💬 RAG question received: {truncate(request.question)}")
+    candidates = await run_in_threadpool(rank_rag_index, index, request.question, RAG_PACK_CANDIDATES)
+    packed = await run_in_threadpool(pack_context, index, candidates, context_budget(ai_engine.DEFAULT_MODEL))
+    logger.debug(f"📚 Context used:\n{packed.text[:500]}...")
+    return f"Context:\n{packed.text}\n\nQuestion: {request.question}", packed
+
+@app.post("/analyze_file_stream")
+async def analyze_file_stream(action: str = Form(...), file: UploadFile = File(...)):
+    """Streaming twin of /analyze_file for the LLM actions"""
+    streams = {
+        "explain": document_code_stream_async,
+        "debug": lambda code: debug_code_stream_async("Python", code),
+        "document": document_code_stream_async,
+        "modularize": modularize_code_stream_async
+    }
+    if action not in streams:
+        return JSONResponse(status_code=400, content={"error": f"❌ Unsupported streaming action '{action}'"})
+    try:
+        code = (await file.read()).decode("utf-8")
+    except UnicodeDecodeError as e:
+        return JSONResponse(status_code=400, content={"error": f"Error analyzing file: {e}"})
+    logger.info(f"📄 Streaming file action: {action}")
+    return _stream_response(streams[action](code))
+
 @app.post("/rag_chat")
 async def rag_chat(request: RAGRequest):
     try:
-        document_text = rag_session.get("document_text", "")
-        if not document_text:
-            return {"error": "❌ No document uploaded for RAG."}
-
-        logger.info(f"💬 RAG question received: {request.question}")
-        context = get_rag_context(document_text, request.question, top_k=3)
-        logger.debug(f"📚 Context used:\n{context[:500]}...")
-
-        combined_prompt = f"Context:\n{context}\n\nQuestion: {request.question}"
-        answer = ask_generic_question(combined_prompt)
-        return {"response": answer}
+        combined_prompt, packed = await _rag_prompt(request)
+        # Answers depend on the retrieved context, so near-duplicate matching is unsafe here
+        answer = await ask_generic_question_async(combined_prompt, use_semantic_cache=False)
+        return {"response": answer, "context_tokens": packed.tokens, "context_chunks": len(packed.chunk_ids)}
+    except RAGRequestError as e:
+        return {"error": str(e)}
     except Exception as e:
         logger.exception("❌ RAG chat error")
         return {"error": f"RAG chat failed: {e}"}
+
+@app.post("/rag_chat_stream")
+async def rag_chat_stream(request: RAGRequest):
+    try:
+        combined_prompt, _ = await _rag_prompt(request)
+        return _stream_response(ask_generic_question_stream_async(combined_prompt))
+    except RAGRequestError as e:
+        return JSONResponse(status_code=404, content={"error": str(e)})
+    except Exception as e:
+        logger.exception("❌ RAG chat stream error")
+        return JSONResponse(status_code=500, content={"error": f"RAG chat failed: {e}"})
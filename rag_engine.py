@@ -1,43 +1,129 @@
 # rag_engine.py - Properly Fixed
+import os
 import re
-import nltk
+import hashlib
+import threading
+from collections import OrderedDict
 from logger import get_logger
+import document_store
+from bm25_index import BM25Index, tokenize as lexical_tokenize
+from chunker import iter_chunks, RAG_CHUNK_TOKENS, RAG_CHUNK_OVERLAP
+from code_chunker import iter_code_chunks
+from embedding_batcher import EmbeddingBatcher
+from metrics import stage
+from tracing import span
 
 logger = get_logger("rag_engine", "logs/backend.log")
 
-# Global variables
-model = None
-util = None
-sent_tokenize = None
+RAG_INDEX_CACHE_SIZE = int(os.getenv("RAG_INDEX_CACHE_SIZE", "16"))
+# Candidates taken from each retriever before reciprocal-rank fusion
+RAG_HYBRID_CANDIDATES = int(os.getenv("RAG_HYBRID_CANDIDATES", "50"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "all-MiniLM-L6-v2")
+# Offline mode never downloads NLTK data or model weights; only local copies are used
+RAG_OFFLINE = os.getenv("RAG_OFFLINE", "false").lower() in ("1", "true", "yes")
+
+if RAG_OFFLINE:
+    os.environ.setdefault("HF_HUB_OFFLINE", "1")
+    os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
 
-# Try to import optional dependencies with error handling
 try:
-    from sentence_transformers import SentenceTransformer, util as st_util
-    from sklearn.feature_extraction.text import TfidfVectorizer
     import numpy as np
-    from nltk.tokenize import sent_tokenize
-    
-    # Download required NLTK data
-    try:
-        nltk.data.find('tokenizers/punkt')
-    except LookupError:
-        logger.info("Downloading NLTK punkt tokenizer...")
-        nltk.download('punkt')
-    
-    # Initialize model and util
-    model = SentenceTransformer("all-MiniLM-L6-v2")
-    util = st_util  # Now util is properly assigned
-    logger.info("✅ RAG engine initialized successfully")
-    
-except ImportError as e:
-    logger.error(f"❌ RAG dependencies missing: {e}")
-    logger.error("Please install: pip install sentence-transformers scikit-learn nltk")
-    model = None
-    util = None
-    
-    # Fallback tokenizer
-    def sent_tokenize(text):
-        return text.split('. ')
+except ImportError:
+    np = None
+
+# Global variables, populated lazily by get_model() / get_sent_tokenize()
+model = None
+sent_tokenize = None
+
+# cold -> loading -> ready | unavailable
+_engine_state = "cold"
+_engine_lock = threading.Lock()
+_tokenizer_lock = threading.Lock()
+
+# Recently used document indexes (embeddings are memory-mapped), keyed by content hash
+_index_cache = OrderedDict()
+
+def _fallback_sent_tokenize(text):
+    return re.split(r'(?<=[.!?])\s+', text)
+
+def get_sent_tokenize():
+    """Return the NLTK sentence tokenizer, loading punkt on first use"""
+    global sent_tokenize
+    if sent_tokenize is not None:
+        return sent_tokenize
+    with _tokenizer_lock:
+        if sent_tokenize is not None:
+            return sent_tokenize
+        try:
+            import nltk
+            from nltk.tokenize import sent_tokenize as nltk_sent_tokenize
+            try:
+                nltk.data.find('tokenizers/punkt')
+            except LookupError:
+                if RAG_OFFLINE:
+                    raise
+                logger.info("Downloading NLTK punkt tokenizer...")
+                nltk.download('punkt', quiet=True)
+            # Newer NLTK releases look up extra tables lazily, so fail here rather than mid-chunking
+            nltk_sent_tokenize("Warm up. Check.")
+            sent_tokenize = nltk_sent_tokenize
+        except (ImportError, LookupError) as e:
+            logger.warning(f"⚠️ NLTK punkt unavailable, using simple sentence splitting: {e}")
+            sent_tokenize = _fallback_sent_tokenize
+    return sent_tokenize
+
+def get_model(wait: bool = True):
+    """Return the embedding model, loading it on first use.
+
+    With wait=False the call never blocks: it returns None until the model is ready
+    and starts a background warm-up if nobody has yet.
+    """
+    global model, _engine_state
+    if _engine_state == "ready" or _engine_state == "unavailable":
+        return model
+    if not wait:
+        if _engine_state == "cold":
+            start_warm_up()
+        return None
+
+    with _engine_lock:
+        if _engine_state in ("cold", "loading"):
+            _engine_state = "loading"
+            try:
+                from sentence_transformers import SentenceTransformer
+                model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+                _engine_state = "ready"
+                logger.info("✅ RAG engine initialized successfully")
+            except ImportError as e:
+                logger.error(f"❌ RAG dependencies missing: {e}")
+                logger.error("Please install: pip install sentence-transformers scikit-learn nltk")
+                _engine_state = "unavailable"
+            except Exception as e:
+                logger.error(f"❌ Could not load embedding model {EMBEDDING_MODEL_NAME}: {e}")
+                _engine_state = "unavailable"
+    return model
+
+def warm_up():
+    """Load the tokenizer and embedding model ahead of the first request"""
+    get_sent_tokenize()
+    get_model()
+
+def start_warm_up():
+    global _engine_state
+    with _engine_lock:
+        if _engine_state != "cold":
+            return
+        _engine_state = "loading"
+    threading.Thread(target=warm_up, name="rag-warm-up", daemon=True).start()
+
+def engine_status() -> dict:
+    return {
+        "state": _engine_state,
+        "ready": _engine_state == "ready",
+        "model": EMBEDDING_MODEL_NAME,
+        "offline": RAG_OFFLINE
+    }
 
 def manual_cosine_similarity(query_embedding, chunk_embeddings):
     """Manual cosine similarity calculation as fallback"""
@@ -56,55 +142,213 @@ def manual_cosine_similarity(query_embedding, chunk_embeddings):
         logger.error(f"Manual similarity calculation failed: {e}")
         return None
 
-def get_rag_context(document_text: str, question: str, top_k: int = 3) -> str:
+def chunking_mode(filename: str = "") -> str:
+    """'python' for Python sources (chunked along the AST), otherwise 'text'"""
+    return "python" if (filename or "").lower().endswith(".py") else "text"
+
+def document_hash(document_text: str, mode: str = "text") -> str:
+    """Content hash used as the key of a document's RAG index (salted for non-text chunking)"""
+    salt = "" if mode == "text" else f"{mode}\0"
+    return hashlib.sha256((salt + document_text).encode("utf-8")).hexdigest()
+
+def _remember_index(index: dict) -> dict:
+    _index_cache[index["hash"]] = index
+    _index_cache.move_to_end(index["hash"])
+    while len(_index_cache) > RAG_INDEX_CACHE_SIZE:
+        _index_cache.popitem(last=False)
+    return index
+
+def get_rag_index(doc_hash: str):
+    """Return a previously built index from memory or the document store, or None"""
+    if doc_hash in _index_cache:
+        _index_cache.move_to_end(doc_hash)
+        return _index_cache[doc_hash]
+
+    try:
+        index = document_store.load_index(doc_hash)
+    except Exception as e:
+        logger.warning(f"⚠️ Could not load RAG index {doc_hash[:12]}: {e}")
+        return None
+    return _remember_index(index) if index is not None else None
+
+@stage("embed_encode")
+def _encode_batch(texts: list):
+    return model.encode(texts, batch_size=len(texts), convert_to_numpy=True, normalize_embeddings=True)
+
+# Query embeddings from concurrent requests share encode() calls
+embedding_batcher = EmbeddingBatcher(_encode_batch)
+
+@span("embed_query")
+def embed_text(text: str, wait: bool = True):
+    """Normalized embedding for a single text, or None when the model is unavailable"""
+    if get_model(wait) is None:
+        return None
+    return embedding_batcher.embed(text)
+
+async def embed_text_async(text: str):
+    """embed_text for coroutines: never waits for a cold model, and encoding runs on the batcher thread"""
+    if get_model(wait=False) is None:
+        return None
+    with span("embed_query"):
+        return await embedding_batcher.embed_async(text)
+
+@stage("tfidf_fit")
+def fit_tfidf(chunks: list):
+    """TF-IDF vectorizer and CSR chunk matrix for the sparse half of hybrid retrieval"""
+    try:
+        from sklearn.feature_extraction.text import TfidfVectorizer
+    except ImportError:
+        return None
+    try:
+        vectorizer = TfidfVectorizer(analyzer=lexical_tokenize, sublinear_tf=True, dtype=np.float32)
+        matrix = vectorizer.fit_transform(chunks).tocsr()
+    except ValueError as e:
+        # Raised for documents without a single indexable term
+        logger.warning(f"⚠️ TF-IDF index skipped: {e}")
+        return None
+    return {"vectorizer": vectorizer, "matrix": matrix}
+
+@span("chunk")
+@stage("chunk")
+def chunk_document(document_text: str, mode: str = "text"):
+    """(chunks, offsets, metadata) lists for a document"""
+    pieces = list(iter_document_chunks(document_text, mode))
+    return ([piece.text for piece in pieces], [(piece.start, piece.end) for piece in pieces],
+            [piece.metadata for piece in pieces])
+
+@span("embed_chunks")
+@stage("embed_chunks")
+def encode_chunks(chunks: list):
+    """Normalized chunk embeddings, or None when the model is unavailable"""
+    embedder = get_model()
+    if embedder is None or not chunks:
+        return None
+    return embedder.encode(chunks, convert_to_numpy=True, normalize_embeddings=True)
+
+def store_rag_index(doc_hash: str, chunks: list, offsets: list, metadata: list, embeddings=None, tfidf=None,
+                    mode: str = "text") -> dict:
+    """Persist a freshly built index and keep it in the in-memory cache"""
+    index = {"hash": doc_hash, "chunks": chunks, "offsets": offsets, "metadata": metadata,
+             "embeddings": embeddings, "tfidf": tfidf}
+    try:
+        document_store.save_index(doc_hash, chunks, embeddings, tfidf, offsets, metadata)
+    except Exception as e:
+        logger.warning(f"⚠️ Could not persist RAG index {doc_hash[:12]}: {e}")
+    logger.info(f"📚 Indexed {mode} document {doc_hash[:12]} ({len(chunks)} chunks)")
+    return _remember_index(index)
+
+def build_rag_index(document_text: str, filename: str = "") -> dict:
+    """Chunk, embed and TF-IDF a document once; reuses an existing index for the same content"""
+    mode = chunking_mode(filename)
+    doc_hash = document_hash(document_text, mode)
+    embedder = get_model()
+    index = get_rag_index(doc_hash)
+    if index is not None and (index["embeddings"] is not None or embedder is None):
+        return index
+
+    chunks, offsets, metadata = chunk_document(document_text, mode)
+    embeddings = encode_chunks(chunks)
+    tfidf = fit_tfidf(chunks) if chunks else None
+    return store_rag_index(doc_hash, chunks, offsets, metadata, embeddings, tfidf, mode)
+
+def _ranked(scores, n: int, positive_only: bool = False):
+    """Indices of the n highest scores, best first"""
+    candidates = np.flatnonzero(scores > 0) if positive_only else np.arange(len(scores))
+    if len(candidates) > n:
+        candidates = candidates[np.argpartition(-scores[candidates], n - 1)[:n]]
+    return candidates[np.argsort(-scores[candidates])]
+
+def reciprocal_rank_fusion(rankings: list, k: int = RRF_K) -> list:
+    """Fuse several best-first index rankings; returns (score, index) pairs, best first"""
+    fused = {}
+    for ranking in rankings:
+        for rank, i in enumerate(ranking):
+            fused[int(i)] = fused.get(int(i), 0.0) + 1.0 / (k + rank + 1)
+    return sorted(((score, i) for i, score in fused.items()), reverse=True)
+
+@span("retrieval")
+@stage("retrieval_rank")
+def rank_rag_index(index: dict, question: str, top_k: int = 3) -> list:
+    """Best-first (score, chunk_index) pairs for a question, encoding only the question.
+
+    Dense cosine and sparse TF-IDF rankings are fused with reciprocal-rank fusion;
+    with neither available the BM25 keyword index is used.
+    """
+    chunks = index["chunks"]
+    if not chunks:
+        return []
+
+    rankings = []
+    embeddings = index["embeddings"]
+    question_embedding = embed_text(question) if embeddings is not None else None
+    if question_embedding is not None:
+        rankings.append(_ranked(embeddings @ question_embedding, RAG_HYBRID_CANDIDATES))
+
+    tfidf = index.get("tfidf")
+    if tfidf is not None:
+        query_vector = tfidf["vectorizer"].transform([question])
+        sparse_scores = (tfidf["matrix"] @ query_vector.T).toarray().ravel()
+        rankings.append(_ranked(sparse_scores, RAG_HYBRID_CANDIDATES, positive_only=True))
+
+    if not any(len(r) for r in rankings):
+        return _bm25_for(index).search(question, top_k) or [(0.0, i) for i in range(min(top_k, len(chunks)))]
+    return reciprocal_rank_fusion(rankings)[:top_k]
+
+def query_rag_index(index: dict, question: str, top_k: int = 3) -> list:
+    """Return the top_k chunks of an index for a question"""
+    return [format_chunk(index, i) for _, i in rank_rag_index(index, question, top_k)]
+
+def chunk_label(metadata) -> str:
+    """'# qualname (lines a-b)' heading for code chunks, empty for prose"""
+    if not metadata or "qualname" not in metadata:
+        return ""
+    return f"# {metadata['qualname']} (lines {metadata['start_line']}-{metadata['end_line']})\n"
+
+def format_chunk(index: dict, i: int) -> str:
+    """Chunk text, headed by its qualified name and line range when it came from source code"""
+    metadata = (index.get("metadata") or [None] * len(index["chunks"]))[i]
+    return chunk_label(metadata) + index["chunks"][i]
+
+@span("get_rag_context")
+def get_rag_context(document_text: str, question: str, top_k: int = 3, filename: str = "") -> str:
     """Get relevant context from document for RAG"""
     try:
-        # Check if model and util are available
-        if model is None or util is None:
+        # Check if the embedding model is available
+        if get_model() is None:
             logger.warning("RAG model not available, using simple text search")
-            return simple_text_search(document_text, question, top_k)
-        
-        # Normal RAG processing
-        chunks = chunk_text(document_text)
-        
-        if not chunks:
-            return "❌ No content found in document"
-        
-        # Encode chunks and question
-        chunk_embeddings = model.encode(chunks, convert_to_tensor=True)
-        question_embedding = model.encode(question, convert_to_tensor=True)
+            return simple_text_search(document_text, question, top_k, filename)
 
-        # Calculate similarities using sentence-transformers util
-        similarities = util.pytorch_cos_sim(question_embedding, chunk_embeddings)[0]
-        top_indices = similarities.argsort(descending=True)[:top_k]
-        top_chunks = [chunks[i] for i in top_indices]
+        index = build_rag_index(document_text, filename)
+        if not index["chunks"]:
+            return "❌ No content found in document"
 
-        return "\n\n".join(top_chunks)
+        return "\n\n".join(query_rag_index(index, question, top_k))
         
     except Exception as e:
         logger.error(f"RAG processing error: {e}")
-        return simple_text_search(document_text, question, top_k)
+        return simple_text_search(document_text, question, top_k, filename)
+
+def _bm25_for(index: dict) -> BM25Index:
+    """Inverted index for a document, built once and kept alongside its cached index"""
+    bm25 = index.get("bm25")
+    if bm25 is None:
+        bm25 = index["bm25"] = BM25Index(index["chunks"])
+    return bm25
 
-def simple_text_search(document_text: str, question: str, top_k: int = 3) -> str:
+def keyword_search(index: dict, question: str, top_k: int = 3) -> list:
+    """Rank an index's chunks by BM25 against the question"""
+    hits = _bm25_for(index).search(question, top_k)
+    return [format_chunk(index, i) for _, i in hits]
+
+def simple_text_search(document_text: str, question: str, top_k: int = 3, filename: str = "") -> str:
     """Fallback text search when RAG model is unavailable"""
     try:
-        # Simple keyword matching
-        question_words = set(question.lower().split())
-        chunks = chunk_text(document_text)
+        index = build_rag_index(document_text, filename)
         
-        if not chunks:
+        if not index["chunks"]:
             return document_text[:1000]
         
-        # Score chunks based on keyword overlap
-        scored_chunks = []
-        for chunk in chunks:
-            chunk_words = set(chunk.lower().split())
-            overlap = len(question_words.intersection(chunk_words))
-            scored_chunks.append((overlap, chunk))
-        
-        # Sort by score and return top chunks
-        scored_chunks.sort(key=lambda x: x[0], reverse=True)
-        top_chunks = [chunk for _, chunk in scored_chunks[:top_k]]
+        top_chunks = keyword_search(index, question, top_k)
         
         return "\n\n".join(top_chunks) if top_chunks else document_text[:1000]
         
@@ -112,45 +356,20 @@ def simple_text_search(document_text: str, question: str, top_k: int = 3) -> str
         logger.error(f"Fallback search error: {e}")
         return document_text[:1000]
 
-def chunk_text(text, max_tokens=200):
+@stage("chunk")
+def chunk_text(text, max_tokens=RAG_CHUNK_TOKENS):
     """Split text into chunks for RAG processing"""
-    try:
-        if sent_tokenize is None:
-            # Fallback chunking
-            words = text.split()
-            chunks = []
-            current_chunk = ""
-            
-            for word in words:
-                if len(current_chunk) + len(word) < max_tokens:
-                    current_chunk += " " + word
-                else:
-                    if current_chunk.strip():
-                        chunks.append(current_chunk.strip())
-                    current_chunk = word
-            
-            if current_chunk.strip():
-                chunks.append(current_chunk.strip())
-            
-            return chunks
-        
-        # Normal NLTK tokenization
-        sentences = sent_tokenize(text)
-        chunks, current_chunk = [], ""
-        
-        for sent in sentences:
-            if len(current_chunk) + len(sent) < max_tokens:
-                current_chunk += " " + sent
-            else:
-                if current_chunk.strip():
-                    chunks.append(current_chunk.strip())
-                current_chunk = sent
-        
-        if current_chunk.strip():
-            chunks.append(current_chunk.strip())
-        
-        return chunks
-        
-    except Exception as e:
-        logger.error(f"Chunking error: {e}")
-        return [chunk.strip() for chunk in text.split('\n\n') if chunk.strip()]
\ No newline at end of file
+    return [chunk.text for chunk in iter_text_chunks(text, max_tokens)]
+
+def iter_text_chunks(source, max_tokens=RAG_CHUNK_TOKENS, overlap_tokens=RAG_CHUNK_OVERLAP):
+    """Token-bounded, overlapping Chunks (with source offsets) from a string or stream of text"""
+    return iter_chunks(source, max_tokens, overlap_tokens, sent_tokenize=get_sent_tokenize())
+
+def iter_document_chunks(document_text: str, mode: str = "text", max_tokens=RAG_CHUNK_TOKENS):
+    """Chunks for a document; Python sources split on module/class/function boundaries"""
+    if mode == "python":
+        try:
+            return list(iter_code_chunks(document_text, max_tokens))
+        except (SyntaxError, ValueError) as e:
+            logger.warning(f"⚠️ Could not parse Python source, using text chunking: {e}")
+    return iter_text_chunks(document_text, max_tokens)
@@ -0,0 +1,353 @@
+# resilience.py - Adaptive concurrency, retries and circuit breaking for upstream calls
+import os
+import time
+import random
+import asyncio
+import threading
+from email.utils import parsedate_to_datetime
+from logger import get_logger
+
+logger = get_logger("resilience", "logs/backend.log")
+
+UPSTREAM_MIN_CONCURRENCY = int(os.getenv("UPSTREAM_MIN_CONCURRENCY", "1"))
+UPSTREAM_MAX_CONCURRENCY = int(os.getenv("UPSTREAM_MAX_CONCURRENCY", os.getenv("EURIAI_MAX_CONCURRENCY", "50")))
+UPSTREAM_INITIAL_CONCURRENCY = int(os.getenv("UPSTREAM_INITIAL_CONCURRENCY", "10"))
+# Responses slower than this (time to headers) count as congestion and shrink the limit;
+# non-streaming calls include the whole generation, so their duration is not a signal
+UPSTREAM_LATENCY_TARGET = float(os.getenv("UPSTREAM_LATENCY_TARGET", "15"))
+UPSTREAM_BACKOFF_RATIO = float(os.getenv("UPSTREAM_BACKOFF_RATIO", "0.5"))
+# How long a request may wait for a concurrency slot before failing
+UPSTREAM_QUEUE_TIMEOUT = float(os.getenv("UPSTREAM_QUEUE_TIMEOUT", "60"))
+
+UPSTREAM_MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", "3"))
+UPSTREAM_BACKOFF_BASE = float(os.getenv("UPSTREAM_BACKOFF_BASE", "0.5"))
+UPSTREAM_BACKOFF_MAX = float(os.getenv("UPSTREAM_BACKOFF_MAX", "30"))
+
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", "30"))
+
+RETRYABLE_STATUSES = frozenset({429, 500, 502, 503, 504})
+OVERLOAD_STATUSES = frozenset({429, 503})
+
+class UpstreamError(Exception):
+    """Upstream answered with an error status (after any retries)"""
+
+    def __init__(self, status: int, message: str = ""):
+        super().__init__(f"Upstream returned HTTP {status}{': ' + message if message else ''}")
+        self.status = status
+
+class CircuitOpenError(Exception):
+    """Raised without calling upstream while the circuit breaker is open"""
+
+class UpstreamOverloaded(Exception):
+    """No concurrency slot became free within the queue timeout"""
+
+def retry_after_seconds(headers) -> float:
+    """Seconds requested by a Retry-After header (delta-seconds or HTTP date), or None"""
+    value = headers.get("Retry-After") if headers is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(attempt: int, retry_after: float = None) -> float:
+    """Full-jitter exponential backoff, or the server's Retry-After when it gave one"""
+    if retry_after is not None:
+        return min(retry_after, UPSTREAM_BACKOFF_MAX)
+    return random.uniform(0, min(UPSTREAM_BACKOFF_MAX, UPSTREAM_BACKOFF_BASE * (2 ** attempt)))
+
+class AdaptiveLimiter:
+    """AIMD concurrency limit shared by threads and coroutines.
+
+    Each fast success adds 1/limit (about +1 per round of requests); an overload
+    signal (429/503 or a response slower than the latency target) multiplies the
+    limit by the backoff ratio, at most once per in-flight round.
+    """
+
+    def __init__(self, initial: int = UPSTREAM_INITIAL_CONCURRENCY, minimum: int = UPSTREAM_MIN_CONCURRENCY,
+                 maximum: int = UPSTREAM_MAX_CONCURRENCY, latency_target: float = UPSTREAM_LATENCY_TARGET):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = float(max(minimum, min(initial, maximum)))
+        self.latency_target = latency_target
+        self.in_flight = 0
+        self.decreases = 0
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._async_waiters = []
+
+    def _try_acquire(self) -> bool:
+        if self.in_flight < int(self.limit):
+            self.in_flight += 1
+            return True
+        return False
+
+    def acquire(self, timeout: float = UPSTREAM_QUEUE_TIMEOUT):
+        deadline = time.monotonic() + timeout
+        with self._available:
+            while not self._try_acquire():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise UpstreamOverloaded(f"No upstream slot free after {timeout:.0f}s (limit {int(self.limit)})")
+                self._available.wait(remaining)
+
+    async def acquire_async(self, timeout: float = UPSTREAM_QUEUE_TIMEOUT):
+        loop = asyncio.get_running_loop()
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                if self._try_acquire():
+                    return
+                waiter = loop.create_future()
+                self._async_waiters.append((loop, waiter))
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    raise asyncio.TimeoutError()
+                await asyncio.wait_for(waiter, remaining)
+            except asyncio.TimeoutError:
+                raise UpstreamOverloaded(f"No upstream slot free after {timeout:.0f}s (limit {int(self.limit)})")
+            finally:
+                with self._lock:
+                    if (loop, waiter) in self._async_waiters:
+                        self._async_waiters.remove((loop, waiter))
+
+    def _wake(self):
+        # Called with the lock held; woken waiters re-check the limit themselves
+        self._available.notify_all()
+        waiters, self._async_waiters = self._async_waiters, []
+        for loop, waiter in waiters:
+            loop.call_soon_threadsafe(lambda w=waiter: w.done() or w.set_result(None))
+
+    def release(self, latency: float = None, overloaded: bool = False):
+        with self._lock:
+            self.in_flight -= 1
+            if overloaded or (latency is not None and latency > self.latency_target):
+                self._decrease()
+            elif latency is not None:
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            self._wake()
+
+    def _decrease(self):
+        now = time.monotonic()
+        # One multiplicative decrease per congestion event, not one per failed request
+        if now - self._last_decrease < min(self.latency_target, 1.0):
+            return
+        self._last_decrease = now
+        self.limit = max(float(self.minimum), self.limit * UPSTREAM_BACKOFF_RATIO)
+        self.decreases += 1
+        logger.warning(f"📉 Upstream congestion, concurrency limit now {int(self.limit)}")
+
+    def stats(self) -> dict:
+        return {"limit": round(self.limit, 2), "in_flight": self.in_flight, "decreases": self.decreases}
+
+class CircuitBreaker:
+    """closed -> open after consecutive failures -> half_open after the reset timeout,
+    where a single probe request decides between closed and open again"""
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_timeout: float = BREAKER_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.transitions = {"open": 0, "half_open": 0, "closed": 0}
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def _move(self, state: str):
+        if state != self.state:
+            self.state = state
+            self.transitions[state] += 1
+            logger.warning(f"⚡ Upstream circuit breaker {state}")
+
+    def allow(self) -> bool:
+        """Raise CircuitOpenError unless a request may go upstream now; True when it is the half-open probe"""
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self._move("half_open")
+                self._probing = False
+            if self.state == "open" or (self.state == "half_open" and self._probing):
+                retry_in = max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+                raise CircuitOpenError(f"Upstream unavailable, circuit open (retry in {retry_in:.0f}s)")
+            if self.state == "half_open":
+                self._probing = True
+                return True
+            return False
+
+    def abandon_probe(self):
+        """The probe ended without an answer (cancelled, no slot): let the next request probe instead"""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._probing = False
+            self._move("closed")
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self._move("open")
+
+    def stats(self) -> dict:
+        return {"state": self.state, "consecutive_failures": self.failures, "transitions": dict(self.transitions)}
+
+class UpstreamGuard:
+    """Runs an upstream request under the breaker and limiter, retrying transient failures.
+
+    `send` performs one attempt and returns a response object with `status_code`
+    and `headers` (requests and httpx both qualify); `retryable` lists the
+    transport exceptions worth retrying. For streaming responses only the request
+    up to the headers is guarded; pass latency_signal=False for non-streaming calls,
+    whose duration is mostly generation time. Observers are called as fn(latency, status)
+    after every attempt, with status None for transport errors. A cancelled attempt
+    frees its slot and probe without an outcome.
+    """
+
+    def __init__(self, limiter: AdaptiveLimiter, breaker: CircuitBreaker, retryable: tuple = (),
+                 max_retries: int = UPSTREAM_MAX_RETRIES):
+        self.limiter = limiter
+        self.breaker = breaker
+        self.retryable = tuple(retryable)
+        self.max_retries = max_retries
+        self.observers = []
+        self.counters = {
+            "requests": 0, "attempts": 0, "successes": 0, "retries": 0, "failures": 0,
+            "rate_limited": 0, "server_errors": 0, "transport_errors": 0, "rejected_open": 0
+        }
+
+    def _outcome(self, response, error):
+        """(retry?, failure to raise or None, Retry-After) for one attempt; updates breaker and counters"""
+        if error is not None:
+            self.counters["transport_errors"] += 1
+            self.breaker.record_failure()
+            return isinstance(error, self.retryable), error, None
+        status = response.status_code
+        if status < 400:
+            self.breaker.record_success()
+            return False, None, None
+        failure = UpstreamError(status, getattr(response, "reason_phrase", None) or getattr(response, "reason", ""))
+        # Every answer settles the breaker (and ends a half-open probe): other 4xx mean upstream is alive
+        if status == 429:
+            self.counters["rate_limited"] += 1
+            self.breaker.record_failure()
+        elif status >= 500:
+            self.counters["server_errors"] += 1
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return status in RETRYABLE_STATUSES, failure, retry_after_seconds(response.headers)
+
+    def _observe(self, latency: float, response):
+        status = response.status_code if response is not None else None
+        for observer in self.observers:
+            try:
+                observer(latency, status)
+            except Exception:
+                logger.exception("❌ Upstream observer failed")
+
+    def _admit(self, attempt: int) -> bool:
+        if attempt == 0:
+            self.counters["requests"] += 1
+        self.counters["attempts"] += 1
+        try:
+            return self.breaker.allow()
+        except CircuitOpenError:
+            self.counters["rejected_open"] += 1
+            # The breaker opened while we were backing off: this request has failed
+            if attempt:
+                self.counters["failures"] += 1
+            raise
+
+    def _abandon(self, probe: bool, acquired: bool):
+        if acquired:
+            self.limiter.release()
+        if probe:
+            self.breaker.abandon_probe()
+
+    def _settle(self, started: float, response, error, latency_signal: bool):
+        """Observe one finished attempt, update breaker and limiter; returns _outcome's tuple"""
+        latency = time.monotonic() - started
+        self._observe(latency, response)
+        retry, failure, retry_after = self._outcome(response, error)
+        # A long generation is not congestion: capped at the target it still counts as a success
+        signal = latency if latency_signal else min(latency, self.limiter.latency_target)
+        self.limiter.release(signal, overloaded=failure is not None and (
+            error is not None or response.status_code in OVERLOAD_STATUSES))
+        return retry, failure, retry_after
+
+    def _give_up(self, failure, attempt: int, retry: bool) -> bool:
+        if retry and attempt < self.max_retries:
+            self.counters["retries"] += 1
+            return False
+        self.counters["failures"] += 1
+        return True
+
+    def call(self, send, close=None, latency_signal: bool = True):
+        for attempt in range(self.max_retries + 1):
+            probe, acquired = self._admit(attempt), False
+            try:
+                self.limiter.acquire()
+                acquired = True
+                started, response, error = time.monotonic(), None, None
+                try:
+                    response = send()
+                except Exception as e:
+                    error = e
+            except BaseException:
+                self._abandon(probe, acquired)
+                raise
+            retry, failure, retry_after = self._settle(started, response, error, latency_signal)
+            if failure is None:
+                self.counters["successes"] += 1
+                return response
+            if close and response is not None:
+                close(response)
+            if self._give_up(failure, attempt, retry):
+                raise failure
+            delay = backoff_delay(attempt, retry_after)
+            logger.warning(f"🔁 Upstream attempt {attempt + 1} failed ({failure}), retrying in {delay:.2f}s")
+            time.sleep(delay)
+
+    async def call_async(self, send, close=None, latency_signal: bool = True):
+        for attempt in range(self.max_retries + 1):
+            probe, acquired = self._admit(attempt), False
+            try:
+                await self.limiter.acquire_async()
+                acquired = True
+                started, response, error = time.monotonic(), None, None
+                try:
+                    response = await send()
+                except Exception as e:
+                    error = e
+            except BaseException:
+                # Cancelled (client gone, job cancelled) or no slot: nothing learned about upstream
+                self._abandon(probe, acquired)
+                raise
+            retry, failure, retry_after = self._settle(started, response, error, latency_signal)
+            if failure is None:
+                self.counters["successes"] += 1
+                return response
+            if close and response is not None:
+                await close(response)
+            if self._give_up(failure, attempt, retry):
+                raise failure
+            delay = backoff_delay(attempt, retry_after)
+            logger.warning(f"🔁 Upstream attempt {attempt + 1} failed ({failure}), retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+    def stats(self) -> dict:
+        return {**self.counters, "limiter": self.limiter.stats(), "breaker": self.breaker.stats()}
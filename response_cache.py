@@ -0,0 +1,164 @@
+# response_cache.py - Exact-match cache for deterministic prompt completions
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from logger import get_logger
+
+logger = get_logger("response_cache", "logs/backend.log")
+
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "1024"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "86400"))
+# Empty path disables the on-disk tier
+RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", "data/response_cache.db")
+
+def _normalize_content(content: str) -> str:
+    lines = content.replace("\r\n", "\n").strip().split("\n")
+    return "\n".join(line.rstrip() for line in lines)
+
+def make_cache_key(model: str, messages: list, temperature: float) -> str:
+    """Stable key over the normalized model, messages and temperature"""
+    normalized = {
+        "model": model.strip().lower(),
+        "messages": [
+            {"role": m["role"], "content": _normalize_content(m["content"])}
+            for m in messages
+        ],
+        "temperature": round(float(temperature), 2)
+    }
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True).encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    """In-memory LRU with TTL expiry, backed by an optional SQLite tier that survives restarts"""
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_SIZE, ttl: float = RESPONSE_CACHE_TTL,
+                 db_path: str = RESPONSE_CACHE_PATH):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.db_path = db_path
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _connect(self):
+        if self._db is None and self.db_path:
+            try:
+                os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+                self._db = sqlite3.connect(self.db_path, timeout=5, check_same_thread=False)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.executescript(
+                    "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL);"
+                    "CREATE INDEX IF NOT EXISTS idx_responses_expiry ON responses(expires_at);"
+                )
+            except Exception as e:
+                logger.warning(f"⚠️ Response cache disk tier disabled: {e}")
+                self.db_path = ""
+                self._db = None
+        return self._db
+
+    def _remember(self, key: str, value: str, expires_at: float):
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _get_memory(self, key: str, now: float):
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, expires_at = entry
+            if expires_at > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._entries[key]
+        return None
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            value = self._get_memory(key, now)
+            if value is not None:
+                return value
+
+            db = self._connect()
+            if db is not None:
+                try:
+                    row = db.execute(
+                        "SELECT value, expires_at FROM responses WHERE key = ? AND expires_at > ?", (key, now)
+                    ).fetchone()
+                except sqlite3.Error as e:
+                    logger.warning(f"⚠️ Response cache disk read failed: {e}")
+                    row = None
+                if row is not None:
+                    self._remember(key, row[0], row[1])
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return row[0]
+
+            self.misses += 1
+            return None
+
+    def _store_disk(self, key: str, value: str, expires_at: float):
+        with self._lock:
+            db = self._connect()
+            if db is not None:
+                try:
+                    with db:
+                        db.execute(
+                            "INSERT OR REPLACE INTO responses (key, value, expires_at) VALUES (?, ?, ?)",
+                            (key, value, expires_at)
+                        )
+                        db.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),))
+                except sqlite3.Error as e:
+                    logger.warning(f"⚠️ Response cache disk write failed: {e}")
+
+    def set(self, key: str, value: str):
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._remember(key, value, expires_at)
+        self._store_disk(key, value, expires_at)
+
+    async def get_async(self, key: str):
+        """get() for the event loop: memory hits answer inline, the disk tier runs in a thread"""
+        if not self.db_path:
+            return self.get(key)
+        with self._lock:
+            value = self._get_memory(key, time.time())
+        if value is not None:
+            return value
+        return await asyncio.to_thread(self.get, key)
+
+    async def set_async(self, key: str, value: str):
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._remember(key, value, expires_at)
+        if self.db_path:
+            await asyncio.to_thread(self._store_disk, key, value, expires_at)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            db = self._connect()
+            if db is not None:
+                with db:
+                    db.execute("DELETE FROM responses")
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0
+        }
@@ -0,0 +1,122 @@
+# semantic_cache.py - Embedding-similarity cache for near-duplicate questions
+import os
+import time
+import threading
+from logger import get_logger
+
+logger = get_logger("semantic_cache", "logs/backend.log")
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "512"))
+SEMANTIC_CACHE_DEFAULT_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_DEFAULT_THRESHOLD", "0.93"))
+# Per-endpoint cosine thresholds, e.g. "ask=0.92,explain=0.95"
+SEMANTIC_CACHE_THRESHOLDS = os.getenv("SEMANTIC_CACHE_THRESHOLDS", "ask=0.92,explain=0.95")
+
+def _parse_thresholds(spec: str) -> dict:
+    thresholds = {}
+    for item in spec.split(","):
+        if "=" in item:
+            name, value = item.split("=", 1)
+            thresholds[name.strip()] = float(value)
+    return thresholds
+
+class _Namespace:
+    """Bounded matrix of normalized prompt embeddings with their answers; grows up to capacity"""
+
+    def __init__(self, capacity: int, dim: int):
+        self.capacity = capacity
+        rows = min(capacity, 16)
+        self.vectors = np.zeros((rows, dim), dtype=np.float32)
+        self.last_used = np.zeros(rows, dtype=np.float64)
+        self.answers = []
+        self.size = 0
+
+    def nearest(self, embedding):
+        if self.size == 0:
+            return None, 0.0
+        scores = self.vectors[:self.size] @ embedding
+        best = int(np.argmax(scores))
+        return best, float(scores[best])
+
+    def insert(self, embedding, answer: str) -> bool:
+        """Store an entry, evicting the least recently used one when full; returns True on eviction"""
+        evicted = self.size == self.capacity
+        if evicted:
+            slot = int(np.argmin(self.last_used[:self.size]))
+            self.answers[slot] = answer
+        else:
+            if self.size == len(self.vectors):
+                rows = min(self.capacity, self.size * 2)
+                self.vectors = np.resize(self.vectors, (rows, self.vectors.shape[1]))
+                self.last_used = np.resize(self.last_used, rows)
+            slot = self.size
+            self.answers.append(answer)
+            self.size += 1
+        self.vectors[slot] = embedding
+        self.last_used[slot] = time.monotonic()
+        return evicted
+
+class SemanticCache:
+    """Bounded nearest-neighbour answer cache, one namespace per endpoint and scope.
+
+    The scope keeps prompts that differ in fixed parameters (language, level) apart,
+    so only the free-text part of a request is compared by similarity.
+    """
+
+    def __init__(self, capacity: int = SEMANTIC_CACHE_SIZE, thresholds: dict = None,
+                 default_threshold: float = SEMANTIC_CACHE_DEFAULT_THRESHOLD):
+        self.capacity = capacity
+        self.thresholds = thresholds if thresholds is not None else _parse_thresholds(SEMANTIC_CACHE_THRESHOLDS)
+        self.default_threshold = default_threshold
+        self._namespaces = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return np is not None and self.capacity > 0
+
+    def threshold(self, endpoint: str) -> float:
+        return self.thresholds.get(endpoint, self.default_threshold)
+
+    def lookup(self, endpoint: str, embedding, scope: str = ""):
+        """Return (answer, score) for the closest cached prompt above the endpoint threshold, else (None, score)"""
+        with self._lock:
+            namespace = self._namespaces.get((endpoint, scope))
+            if namespace is None:
+                self.misses += 1
+                return None, 0.0
+            slot, score = namespace.nearest(embedding)
+            if slot is not None and score >= self.threshold(endpoint):
+                namespace.last_used[slot] = time.monotonic()
+                self.hits += 1
+                return namespace.answers[slot], score
+            self.misses += 1
+            return None, score
+
+    def store(self, endpoint: str, embedding, answer: str, scope: str = ""):
+        with self._lock:
+            namespace = self._namespaces.get((endpoint, scope))
+            if namespace is None:
+                namespace = _Namespace(self.capacity, len(embedding))
+                self._namespaces[(endpoint, scope)] = namespace
+            if namespace.insert(embedding, answer):
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "namespaces": len(self._namespaces),
+            "entries": sum(ns.size for ns in self._namespaces.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "thresholds": dict(self.thresholds, default=self.default_threshold)
+        }
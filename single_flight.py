@@ -0,0 +1,186 @@
+# single_flight.py - Coalesce identical in-flight upstream calls
+import asyncio
+import threading
+from concurrent.futures import Future
+
+class SingleFlight:
+    """Threads calling do() with the same key while a call is in flight share its result"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.leaders = 0
+        self.followers = 0
+
+    def do(self, key: str, fn):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+                self.leaders += 1
+            else:
+                self.followers += 1
+        if not leader:
+            return future.result()
+        try:
+            future.set_result(fn())
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                del self._calls[key]
+        return future.result()
+
+class AsyncSingleFlight:
+    """Coroutines awaiting do() with the same key share one task; a caller that is
+    cancelled (e.g. a disconnected client) does not cancel the call for the others"""
+
+    def __init__(self):
+        self._calls = {}
+        self.leaders = 0
+        self.followers = 0
+
+    async def do(self, key: str, coro_fn):
+        task = self._calls.get(key)
+        if task is None:
+            task = self._calls[key] = asyncio.ensure_future(coro_fn())
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+            self.leaders += 1
+        else:
+            self.followers += 1
+        return await asyncio.shield(task)
+
+class _Broadcast:
+    """Items produced so far by one upstream stream, replayed to every subscriber"""
+
+    def __init__(self):
+        self.items = []
+        self.done = False
+        self.error = None
+        # Async fan-out only: replaced with a fresh event after every publish
+        self.changed = None
+        self.task = None
+
+class StreamFanout:
+    """Threads subscribing to the same key while its stream is live share one upstream iterator.
+
+    The first subscriber drives the upstream generator; the others replay what it
+    has produced so far and then follow along as new items arrive.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._streams = {}
+        self.leaders = 0
+        self.followers = 0
+
+    def subscribe(self, key: str, gen_fn):
+        with self._lock:
+            entry = self._streams.get(key)
+            leader = entry is None
+            if leader:
+                entry = self._streams[key] = (_Broadcast(), threading.Condition())
+                self.leaders += 1
+            else:
+                self.followers += 1
+        broadcast, changed = entry
+        return self._produce(key, broadcast, changed, gen_fn) if leader else self._follow(broadcast, changed)
+
+    def _produce(self, key: str, broadcast: _Broadcast, changed: threading.Condition, gen_fn):
+        try:
+            for item in gen_fn():
+                with changed:
+                    broadcast.items.append(item)
+                    changed.notify_all()
+                yield item
+        except BaseException as e:
+            broadcast.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._streams[key]
+            with changed:
+                broadcast.done = True
+                changed.notify_all()
+
+    def _follow(self, broadcast: _Broadcast, changed: threading.Condition):
+        position = 0
+        while True:
+            with changed:
+                while position >= len(broadcast.items) and not broadcast.done:
+                    changed.wait()
+                pending = broadcast.items[position:]
+                finished = broadcast.done
+            yield from pending
+            position += len(pending)
+            if finished and position >= len(broadcast.items):
+                if isinstance(broadcast.error, Exception):
+                    raise broadcast.error
+                if broadcast.error is not None:
+                    raise RuntimeError("Shared upstream stream was abandoned by its first subscriber")
+                return
+
+class AsyncStreamFanout:
+    """Async generators subscribing to the same key share one upstream stream.
+
+    The upstream generator runs in its own task, so it completes (and logs usage,
+    fills caches) even if every subscriber disconnects.
+    """
+
+    def __init__(self):
+        self._streams = {}
+        self.leaders = 0
+        self.followers = 0
+
+    def _start(self, key: str, agen_fn):
+        broadcast = _Broadcast()
+        broadcast.changed = asyncio.Event()
+
+        def publish():
+            event, broadcast.changed = broadcast.changed, asyncio.Event()
+            event.set()
+
+        async def produce():
+            try:
+                async for item in agen_fn():
+                    broadcast.items.append(item)
+                    publish()
+            except Exception as e:
+                broadcast.error = e
+            finally:
+                self._streams.pop(key, None)
+                broadcast.done = True
+                publish()
+
+        broadcast.task = asyncio.ensure_future(produce())
+        return broadcast
+
+    async def subscribe(self, key: str, agen_fn):
+        broadcast = self._streams.get(key)
+        if broadcast is None:
+            broadcast = self._streams[key] = self._start(key, agen_fn)
+            self.leaders += 1
+        else:
+            self.followers += 1
+
+        position = 0
+        while True:
+            while position < len(broadcast.items):
+                yield broadcast.items[position]
+                position += 1
+            if broadcast.done:
+                if broadcast.error is not None:
+                    raise broadcast.error
+                return
+            await broadcast.changed.wait()
+
+def flight_stats(*flights) -> dict:
+    leaders = sum(f.leaders for f in flights)
+    followers = sum(f.followers for f in flights)
+    total = leaders + followers
+    return {
+        "upstream_calls": leaders,
+        "coalesced": followers,
+        "coalesced_ratio": round(followers / total, 4) if total else 0.0
+    }
@@ -0,0 +1,52 @@
+# sse.py - Server-sent events parsing shared by every streaming call
+class SSEParser:
+    """Incremental SSE decoder: feed it lines, get back complete event payloads.
+
+    Follows the event-stream format: consecutive `data:` lines form one event
+    (joined with newlines) that ends at a blank line; `:` comment lines are
+    keep-alives and are ignored, as are `event:`, `id:` and `retry:` fields.
+    """
+
+    def __init__(self):
+        self._data = []
+
+    def feed(self, line: str):
+        """Consume one line (without its newline); returns the event payload it completes, or None"""
+        line = line.rstrip("\r\n")
+        if not line:
+            return self.flush()
+        if line.startswith(":"):
+            return None
+        field, _, value = line.partition(":")
+        if field == "data":
+            self._data.append(value[1:] if value.startswith(" ") else value)
+        return None
+
+    def flush(self):
+        """Payload of a pending event (streams may end without a trailing blank line)"""
+        if not self._data:
+            return None
+        data, self._data = "\n".join(self._data), []
+        return data
+
+def iter_sse_events(lines):
+    """Event payloads from an iterable of text lines"""
+    parser = SSEParser()
+    for line in lines:
+        data = parser.feed(line)
+        if data is not None:
+            yield data
+    data = parser.flush()
+    if data is not None:
+        yield data
+
+async def aiter_sse_events(lines):
+    """Event payloads from an async iterable of text lines"""
+    parser = SSEParser()
+    async for line in lines:
+        data = parser.feed(line)
+        if data is not None:
+            yield data
+    data = parser.flush()
+    if data is not None:
+        yield data
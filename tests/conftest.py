@@ -0,0 +1,6 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The modules live at the top level and the mock server under bench/, neither is a package
+sys.path[:0] = [ROOT, os.path.join(ROOT, "bench")]
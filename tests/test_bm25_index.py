@@ -0,0 +1,16 @@
+from bm25_index import BM25Index, tokenize
+
+def test_tokenize_keeps_non_ascii_words():
+    assert tokenize("café naïve Größe 東京") == ["café", "naïve", "größe", "東京"]
+
+def test_tokenize_splits_identifiers():
+    terms = tokenize("getUserName snake_case obj.attr")
+    assert terms == ["getusername", "get", "user", "name", "snake_case", "snake", "case", "obj", "attr"]
+
+def test_mixed_script_identifier_is_split_on_underscores_only():
+    assert tokenize("Größe_Wert") == ["größe_wert", "größe", "wert"]
+
+def test_search_finds_unicode_terms():
+    index = BM25Index(["Tokyo is 東京 in Japanese", "Die Größe der Datei", "plain english text"])
+    assert index.search("Größe", 1)[0][1] == 1
+    assert index.search("東京", 1)[0][1] == 0
@@ -0,0 +1,21 @@
+import pytest
+import token_utils
+from chunker import iter_chunks
+
+def _sentence_split(text):
+    return [s + "." for s in text.split(".") if s.strip()]
+
+@pytest.mark.skipif(token_utils._encoding is None, reason="tiktoken cl100k_base encoding not available")
+def test_chunks_fit_the_real_tokenizer():
+    # Identifiers and digits take far more than one token per 4 chars, so the length estimate would overshoot
+    text = "\n\n".join(
+        f"Call retry_payment_{i}(0x{i:08x}) with backoff={i * 37 % 97}ms. Otherwise escalate ticket #{i * 7919}."
+        for i in range(200)
+    )
+
+    chunks = list(iter_chunks(text, max_tokens=50, overlap_tokens=10, sent_tokenize=_sentence_split))
+
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert len(token_utils._encoding.encode(chunk.text, disallowed_special=())) <= 50
+        assert text[chunk.start:chunk.end] == chunk.text
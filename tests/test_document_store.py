@@ -0,0 +1,24 @@
+import threading
+import numpy as np
+import document_store
+
+def test_concurrent_saves_of_the_same_file(tmp_path):
+    path = str(tmp_path / "same.npy")
+    matrix = np.arange(200000, dtype=np.float32)
+    errors = []
+
+    def save():
+        try:
+            document_store._atomic_write(path, lambda f: np.save(f, matrix))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=save) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert np.array_equal(np.load(path), matrix)
+    assert [p.name for p in tmp_path.iterdir()] == ["same.npy"]
@@ -0,0 +1,52 @@
+import time
+import asyncio
+import threading
+from embedding_batcher import EmbeddingBatcher
+
+def _slow_encode(started: threading.Event):
+    def encode(texts):
+        started.set()
+        time.sleep(0.1)
+        return [len(text) for text in texts]
+    return encode
+
+def test_cancelled_async_caller_does_not_kill_the_thread():
+    started = threading.Event()
+    batcher = EmbeddingBatcher(_slow_encode(started), max_wait_ms=50, result_timeout=2)
+
+    async def scenario():
+        # Cancelled while still queued, then while its batch is encoding
+        queued = asyncio.create_task(batcher.embed_async("queued"))
+        await asyncio.sleep(0.01)
+        queued.cancel()
+        encoding = asyncio.create_task(batcher.embed_async("encoding"))
+        while not started.is_set():
+            await asyncio.sleep(0.005)
+        encoding.cancel()
+        await asyncio.gather(queued, encoding, return_exceptions=True)
+
+    try:
+        asyncio.run(scenario())
+        assert batcher.embed("still alive") == len("still alive")
+        assert batcher._thread.is_alive()
+    finally:
+        batcher.close()
+
+def test_failed_batch_keeps_the_thread_running():
+    calls = []
+
+    def encode(texts):
+        calls.append(texts)
+        if len(calls) == 1:
+            raise ValueError("model not loaded")
+        return [len(text) for text in texts]
+
+    batcher = EmbeddingBatcher(encode, max_wait_ms=1, result_timeout=2)
+    try:
+        try:
+            batcher.embed("first")
+        except ValueError:
+            pass
+        assert batcher.embed("second") == len("second")
+    finally:
+        batcher.close()
@@ -0,0 +1,45 @@
+import queue
+from concurrent.futures import Future
+import pytest
+import job_store
+import ingestion
+import rag_engine
+
+def _must_not_build(*args):
+    raise AssertionError("a cancelled job was indexed")
+
+def test_job_cancelled_while_queued_is_never_indexed(tmp_path, monkeypatch):
+    monkeypatch.setattr(job_store, "JOB_DB_PATH", str(tmp_path / "jobs.db"))
+    monkeypatch.setattr(job_store._local, "conn", None, raising=False)
+    monkeypatch.setattr(ingestion, "_build_in_pool", _must_not_build)
+
+    job_id = job_store.create_job(ingestion.JOB_KIND)
+    assert ingestion.cancel(job_id)
+    ingestion._run(job_id, "Some text to index.", "notes.md")
+
+    job = job_store.get_job(job_id)
+    assert job["status"] == "cancelled"
+    assert job["result"] is None
+
+def test_chunker_hands_over_shards_in_document_order():
+    text = "\n\n".join(f"Paragraph {i}. Failed payments are retried {i % 5} times." for i in range(300))
+    shards = queue.Queue()
+
+    total = ingestion._chunk_shards(text, "text", shards, 8)
+
+    received = []
+    while (shard := shards.get_nowait()) is not None:
+        assert len(shard[0]) <= 8
+        received.append(shard)
+    chunks, offsets, _ = rag_engine.chunk_document(text, "text")
+    assert total == len(chunks) > 8
+    assert [c for shard in received for c in shard[0]] == chunks
+    assert [o for shard in received for o in shard[1]] == offsets
+
+def test_failed_chunking_surfaces_instead_of_waiting(monkeypatch):
+    monkeypatch.setattr(ingestion, "INGEST_POLL_INTERVAL", 0.01)
+    chunking = Future()
+    chunking.set_exception(ValueError("bad document"))
+
+    with pytest.raises(ValueError):
+        ingestion._next_shard(queue.Queue(), chunking)
@@ -0,0 +1,32 @@
+import asyncio
+import job_store
+import job_queue
+
+def test_cancel_from_another_worker_is_not_overwritten(tmp_path, monkeypatch):
+    monkeypatch.setattr(job_store, "JOB_DB_PATH", str(tmp_path / "jobs.db"))
+    monkeypatch.setattr(job_store._local, "conn", None, raising=False)
+    calls = []
+
+    async def document(code):
+        calls.append(code)
+        return "documented"
+
+    monkeypatch.setitem(job_queue.ACTIONS, "document", document)
+
+    async def scenario():
+        queue = job_queue.JobQueue(workers=1)
+        await queue.start()
+        try:
+            cancelled = queue.submit("document", "x = 1")
+            # Cancelled through the store, as another uvicorn worker would
+            assert job_store.finish_if_active(cancelled, "cancelled")
+            done = queue.submit("document", "y = 2")
+            await asyncio.wait_for(queue._queue.join(), 5)
+            return cancelled, done
+        finally:
+            await queue.stop()
+
+    cancelled, done = asyncio.run(scenario())
+    assert job_store.get_job(cancelled)["status"] == "cancelled"
+    assert job_store.get_job(done)["status"] == "done"
+    assert calls == ["y = 2"]
@@ -0,0 +1,33 @@
+import os
+import socket
+import job_store
+
+def test_jobs_from_an_earlier_run_with_the_same_pid_are_failed(tmp_path, monkeypatch):
+    monkeypatch.setattr(job_store, "JOB_DB_PATH", str(tmp_path / "jobs.db"))
+    monkeypatch.setattr(job_store._local, "conn", None, raising=False)
+
+    owner = job_store.OWNER
+    # Same hostname and PID as this process, as after a container restart
+    monkeypatch.setattr(job_store, "OWNER", f"{socket.gethostname()}:{os.getpid()}:earlier")
+    stale = job_store.create_job("test")
+    job_store.update_job(stale, status="running")
+    monkeypatch.setattr(job_store, "OWNER", owner)
+    current = job_store.create_job("test")
+
+    assert job_store.fail_orphaned() == 1
+    assert job_store.get_job(stale)["status"] == "failed"
+    assert job_store.get_job(current)["status"] == "queued"
+
+def test_cancelled_job_is_not_started(tmp_path, monkeypatch):
+    monkeypatch.setattr(job_store, "JOB_DB_PATH", str(tmp_path / "jobs.db"))
+    monkeypatch.setattr(job_store._local, "conn", None, raising=False)
+
+    job_id = job_store.create_job("test")
+    assert job_store.finish_if_active(job_id, "cancelled")
+    assert not job_store.start_if_queued(job_id)
+    assert job_store.get_job(job_id)["status"] == "cancelled"
+
+    queued = job_store.create_job("test")
+    assert job_store.start_if_queued(queued)
+    assert not job_store.start_if_queued(queued)
+    assert job_store.get_job(queued)["status"] == "running"
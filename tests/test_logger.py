@@ -0,0 +1,57 @@
+import glob
+import time
+import queue
+import logging
+import multiprocessing
+import pytest
+import logger
+
+pytestmark = pytest.mark.skipif(logger.fcntl is None, reason="shared rotation needs fcntl")
+
+RECORDS = 400
+
+def _write(path: str, worker: int):
+    handler = logger._SharedRotatingFileHandler(path, maxBytes=4096, backupCount=1000, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    for i in range(RECORDS):
+        handler.handle(logging.makeLogRecord({"msg": f"worker{worker} record{i:04d}"}))
+    handler.close()
+
+def test_processes_share_a_rotating_file(tmp_path):
+    path = str(tmp_path / "backend.log")
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=_write, args=(path, n)) for n in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(30)
+
+    lines = []
+    for name in glob.glob(f"{path}*"):
+        if not name.endswith(".lock"):
+            with open(name, encoding="utf-8") as f:
+                lines += f.read().splitlines()
+    assert len(glob.glob(f"{path}.*")) > 2
+    assert sorted(lines) == sorted(f"worker{w} record{i:04d}" for w in range(4) for i in range(RECORDS))
+
+class _SlowList(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        time.sleep(0.05)
+        self.messages.append(record.getMessage())
+
+def test_stop_flushes_a_full_queue():
+    handler = logger._DroppingQueueHandler(queue.Queue(maxsize=2))
+    sink = _SlowList()
+    listener = logger._Listener(handler.queue, sink)
+    listener.start()
+    for i in range(3):
+        handler.handle(logging.makeLogRecord({"msg": f"record{i}"}))
+        time.sleep(0.01)
+    # The queue is full while the sink is busy; stop() must still get its sentinel in
+    assert handler.queue.full()
+    listener.stop()
+    assert sink.messages == ["record0", "record1", "record2"]
@@ -0,0 +1,118 @@
+import asyncio
+import httpx
+import pytest
+import mock_euriai
+from resilience import AdaptiveLimiter, CircuitBreaker, CircuitOpenError, UpstreamError, UpstreamGuard
+
+PAYLOAD = {"model": "mock", "messages": [{"role": "user", "content": "hi"}]}
+
+@pytest.fixture(autouse=True)
+def mock_config():
+    saved = dict(mock_euriai.CONFIG)
+    mock_euriai.CONFIG.update(latency_ms=0, jitter_ms=0, tokens_per_sec=0, completion_tokens=5)
+    yield mock_euriai.CONFIG
+    mock_euriai.CONFIG.clear()
+    mock_euriai.CONFIG.update(saved)
+
+def _guard(**breaker):
+    limiter = AdaptiveLimiter(initial=4, minimum=1, maximum=8, latency_target=5)
+    return UpstreamGuard(limiter, CircuitBreaker(**breaker), (httpx.TransportError,), max_retries=0)
+
+async def _call(guard, client):
+    return await guard.call_async(lambda: client.post("/v1/chat/completions", json=PAYLOAD),
+                                  lambda r: r.aclose())
+
+def _client():
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=mock_euriai.app), base_url="http://mock")
+
+def test_breaker_opens_half_opens_and_closes(mock_config):
+    guard = _guard(failure_threshold=2, reset_timeout=0.1)
+
+    async def scenario():
+        async with _client() as client:
+            mock_config["error_rate"] = 1.0
+            for _ in range(2):
+                with pytest.raises(UpstreamError):
+                    await _call(guard, client)
+            assert guard.breaker.state == "open"
+            with pytest.raises(CircuitOpenError):
+                await _call(guard, client)
+
+            await asyncio.sleep(0.15)
+            mock_config["error_rate"] = 0.0
+            response = await _call(guard, client)
+            assert response.status_code == 200
+            assert guard.breaker.state == "closed"
+
+    asyncio.run(scenario())
+    assert guard.breaker.transitions == {"open": 1, "half_open": 1, "closed": 1}
+
+@pytest.mark.parametrize("knob, status, state", [("bad_request_rate", 400, "closed"),
+                                                 ("rate_limit_rate", 429, "open")])
+def test_probe_ends_on_client_errors(mock_config, knob, status, state):
+    guard = _guard(failure_threshold=1, reset_timeout=0.05)
+
+    async def scenario():
+        async with _client() as client:
+            mock_config["error_rate"] = 1.0
+            with pytest.raises(UpstreamError):
+                await _call(guard, client)
+            await asyncio.sleep(0.08)
+
+            mock_config.update(error_rate=0.0, **{knob: 1.0})
+            with pytest.raises(UpstreamError) as failure:
+                await _call(guard, client)
+            assert failure.value.status == status
+            assert guard.breaker.state == state
+
+            # Once upstream recovers the breaker lets requests through again
+            mock_config[knob] = 0.0
+            await asyncio.sleep(0.08)
+            assert (await _call(guard, client)).status_code == 200
+
+    asyncio.run(scenario())
+
+def test_cancelled_call_releases_slot_and_probe(mock_config):
+    guard = _guard(failure_threshold=1, reset_timeout=0.05)
+
+    async def scenario():
+        async with _client() as client:
+            mock_config["error_rate"] = 1.0
+            with pytest.raises(UpstreamError):
+                await _call(guard, client)
+            await asyncio.sleep(0.08)
+
+            # The half-open probe is cancelled while upstream is still thinking
+            mock_config.update(error_rate=0.0, latency_ms=5000)
+            limit = guard.limiter.limit
+            task = asyncio.create_task(_call(guard, client))
+            await asyncio.sleep(0.05)
+            assert guard.limiter.in_flight == 1
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            assert guard.limiter.in_flight == 0
+            assert guard.limiter.limit == limit
+
+            mock_config["latency_ms"] = 0
+            assert (await _call(guard, client)).status_code == 200
+            assert guard.breaker.state == "closed"
+
+    asyncio.run(scenario())
+
+def test_slow_completion_does_not_shrink_limit(mock_config):
+    guard = _guard()
+    guard.limiter.latency_target = 0.05
+    mock_config["latency_ms"] = 100
+
+    async def scenario():
+        async with _client() as client:
+            for _ in range(3):
+                await guard.call_async(lambda: client.post("/v1/chat/completions", json=PAYLOAD),
+                                       lambda r: r.aclose(), latency_signal=False)
+            assert guard.limiter.decreases == 0
+            # Timed to headers, as streams are, the same wait is congestion
+            await _call(guard, client)
+            assert guard.limiter.decreases == 1
+
+    asyncio.run(scenario())
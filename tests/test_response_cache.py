@@ -0,0 +1,24 @@
+import asyncio
+import threading
+from response_cache import ResponseCache
+
+def test_async_disk_tier_runs_off_the_event_loop(tmp_path, monkeypatch):
+    cache = ResponseCache(db_path=str(tmp_path / "cache.db"))
+    loop_thread = threading.get_ident()
+    disk_threads = []
+    connect = cache._connect
+    monkeypatch.setattr(cache, "_connect", lambda: disk_threads.append(threading.get_ident()) or connect())
+
+    async def scenario():
+        await cache.set_async("k", "v")
+        cache._entries.clear()
+        assert await cache.get_async("k") == "v"
+        assert await cache.get_async("k") == "v"
+        assert await cache.get_async("missing") is None
+
+    asyncio.run(scenario())
+
+    assert disk_threads and loop_thread not in disk_threads
+    assert cache.stats()["disk_hits"] == 1
+    assert cache.stats()["hits"] == 2
+    assert cache.stats()["misses"] == 1
@@ -0,0 +1,42 @@
+import csv
+import threading
+import token_utils
+import usage_store
+
+def test_old_csv_header_is_upgraded(tmp_path, monkeypatch):
+    path = tmp_path / "token_usage.csv"
+    path.write_text("Timestamp,Model,Tokens,Cost\n2024-01-01T00:00:00,gpt-4,10,0.0003\n")
+    monkeypatch.setattr(token_utils, "TOKEN_LOG_PATH", str(path))
+    monkeypatch.setattr(token_utils, "_header_checked", False)
+
+    token_utils._write_csv_rows([{"timestamp": "2024-01-02T00:00:00", "model": "gpt-4.1-nano", "tokens": 30,
+                                  "cost": 0.0001, "prompt_tokens": 20, "completion_tokens": 10,
+                                  "endpoint": "ask"}])
+
+    with open(path, newline="") as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == token_utils.CSV_HEADER
+    assert rows[1] == ["2024-01-01T00:00:00", "gpt-4", "10", "0.0003", "", "", ""]
+    assert rows[2][-1] == "ask"
+    assert all(len(row) == len(token_utils.CSV_HEADER) for row in rows)
+
+def test_rows_written_before_a_failed_migration_are_counted_once(tmp_path, monkeypatch):
+    path = tmp_path / "token_usage.csv"
+    monkeypatch.setattr(token_utils, "TOKEN_LOG_PATH", str(path))
+    monkeypatch.setattr(token_utils, "_header_checked", False)
+    monkeypatch.setattr(token_utils, "_migrated", False)
+    monkeypatch.setattr(usage_store, "USAGE_DB_PATH", str(tmp_path / "usage.db"))
+    monkeypatch.setattr(usage_store, "_local", threading.local())
+    row = {"ts": 1700000000.0, "timestamp": "2023-11-14T22:13:20", "model": "gpt-4.1-nano", "tokens": 30,
+           "cost": 0.0001, "prompt_tokens": 20, "completion_tokens": 10, "endpoint": "ask"}
+
+    migrate_csv = usage_store.migrate_csv
+    def failing_migration(csv_path):
+        raise OSError("disk busy")
+    monkeypatch.setattr(usage_store, "migrate_csv", failing_migration)
+    token_utils._write_usage([row])
+
+    monkeypatch.setattr(usage_store, "migrate_csv", migrate_csv)
+    token_utils._write_usage([row])
+
+    assert usage_store.summarize()["gpt-4.1-nano"]["calls"] == 2
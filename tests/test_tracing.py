@@ -0,0 +1,46 @@
+import glob
+import json
+import multiprocessing
+import pytest
+import tracing
+
+pytestmark = pytest.mark.skipif(tracing.fcntl is None, reason="shared trace file needs fcntl")
+
+def _write(worker: int):
+    for i in range(200):
+        tracing._write_events([{"ph": "X", "name": f"worker{worker}", "args": {"i": i}}])
+
+def _run_writers():
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=_write, args=(n,)) for n in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(30)
+
+def test_processes_share_the_trace_file(tmp_path, monkeypatch):
+    path = str(tmp_path / "traces.json")
+    monkeypatch.setattr(tracing, "TRACE_PATH", path)
+
+    _run_writers()
+
+    with open(path, encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    assert lines[0] == "["
+    events = [json.loads(line.rstrip(",")) for line in lines[1:]]
+    assert len(events) == 800
+
+def test_rotated_trace_files_each_get_one_header(tmp_path, monkeypatch):
+    path = str(tmp_path / "traces.json")
+    monkeypatch.setattr(tracing, "TRACE_PATH", path)
+    monkeypatch.setattr(tracing, "TRACE_MAX_BYTES", 2048)
+
+    _run_writers()
+
+    for name in (path, f"{path}.1"):
+        with open(name, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        assert lines[0] == "["
+        assert "[" not in lines[1:]
+        for line in lines[1:]:
+            json.loads(line.rstrip(","))
@@ -0,0 +1,36 @@
+import base64
+import traffic_recorder
+
+BOUNDARY = "bench"
+CONTENT_TYPE = f"multipart/form-data; boundary={BOUNDARY}"
+
+def _upload(code: str) -> bytes:
+    return (
+        f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="action"\r\n\r\ndebug\r\n'
+        f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="file"; filename="app.py"\r\n'
+        f'Content-Type: text/x-python\r\n\r\n{code}\r\n--{BOUNDARY}--\r\n'
+    ).encode("utf-8")
+
+def test_uploads_are_recorded_by_shape_only(monkeypatch):
+    monkeypatch.setattr(traffic_recorder, "RECORD_RAW_UPLOADS", False)
+    code = 'API_KEY = "sk-abcdefghijklmnopqrstuvwx"\n'
+    body = _upload(code)
+
+    fields = traffic_recorder._body_fields(body, CONTENT_TYPE)
+
+    assert "body_b64" not in fields
+    assert fields["form"] == {"action": "debug"}
+    assert fields["files"] == [{"field": "file", "filename": "app.py", "bytes": len(code)}]
+
+def test_raw_uploads_are_opt_in(monkeypatch):
+    monkeypatch.setattr(traffic_recorder, "RECORD_RAW_UPLOADS", True)
+    body = _upload("print('hi')\n")
+
+    fields = traffic_recorder._body_fields(body, CONTENT_TYPE)
+
+    assert base64.b64decode(fields["body_b64"]) == body
+
+def test_plain_text_bodies_are_scrubbed():
+    fields = traffic_recorder._body_fields(b"token=Bearer abc.def mail me@example.com", "text/plain")
+
+    assert base64.b64decode(fields["body_b64"]) == b"token=Bearer [REDACTED] mail [REDACTED_EMAIL]"
@@ -1,13 +1,22 @@
 import os
 import csv
+import time
+import atexit
 from datetime import datetime
 from collections import defaultdict
 from dotenv import load_dotenv
-import logging
+import usage_store
+from logger import get_logger
+from batch_writer import BatchWriter
+from metrics import LLM_TOKENS, LLM_COST
 
 load_dotenv()
 
 TOKEN_LOG_PATH = os.getenv("TOKEN_LOG_PATH", "logs/token_usage.csv")
+USAGE_FLUSH_INTERVAL = float(os.getenv("USAGE_FLUSH_INTERVAL", "2"))
+USAGE_BATCH_SIZE = int(os.getenv("USAGE_BATCH_SIZE", "200"))
+USAGE_QUEUE_SIZE = int(os.getenv("USAGE_QUEUE_SIZE", "10000"))
+CSV_HEADER = ["Timestamp", "Model", "Tokens", "Cost", "PromptTokens", "CompletionTokens", "Endpoint"]
 MODEL_COSTS = {
     "gpt-4": 0.03,
     "gpt-3.5": 0.0015,
@@ -15,51 +24,140 @@ MODEL_COSTS = {
 }
 
 def get_token_logger():
+    # A queued logger of its own: basicConfig on the root logger would copy every
+    # other logger's records into this file, synchronously
     os.makedirs(os.path.dirname(TOKEN_LOG_PATH), exist_ok=True)
-    logging.basicConfig(
-        filename=TOKEN_LOG_PATH.replace(".csv", ".log"),
-        level=logging.INFO,
-        format="[%(asctime)s] %(levelname)s - %(message)s"
-    )
-    return logging.getLogger("token_utils")
+    return get_logger("token_utils", TOKEN_LOG_PATH.replace(".csv", ".log"))
 
 logger = get_token_logger()
 
-# CSV Logging Function
-def log_token_usage(model: str, tokens: int = 300):
-    try:
-        cost_per_1k = MODEL_COSTS.get(model, 0.0025)
-        cost = round((tokens / 1000) * cost_per_1k, 6)
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception as e:
+    # Chunk sizes and usage estimates drift noticeably on the ~4 chars/token fallback
+    logger.warning(f"⚠️ tiktoken unavailable, estimating tokens from length: {e}")
+    _encoding = None
 
-        os.makedirs(os.path.dirname(TOKEN_LOG_PATH), exist_ok=True)
-        file_exists = os.path.isfile(TOKEN_LOG_PATH)
+def count_tokens(text: str) -> int:
+    """Token count for text; tiktoken when installed, otherwise ~4 characters per token"""
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return max(1, round(len(text) / 4))
 
-        with open(TOKEN_LOG_PATH, mode="a", newline="") as csvfile:
-            writer = csv.writer(csvfile)
-            if not file_exists:
-                writer.writerow(["Timestamp", "Model", "Tokens", "Cost"])
-            writer.writerow([datetime.now().isoformat(), model, tokens, cost])
+def usage_from_response(data: dict, prompt_text: str = "", completion_text: str = ""):
+    """(prompt_tokens, completion_tokens) from an API usage block, estimated when absent"""
+    usage = (data or {}).get("usage") or {}
+    prompt_tokens = usage.get("prompt_tokens")
+    completion_tokens = usage.get("completion_tokens")
+    if prompt_tokens is None:
+        prompt_tokens = count_tokens(prompt_text)
+    if completion_tokens is None:
+        completion_tokens = count_tokens(completion_text)
+    return int(prompt_tokens), int(completion_tokens)
 
-        logger.info(f"Logged token usage: {model}, Tokens: {tokens}, Cost: ${cost}")
-    except Exception as e:
-        logger.exception(f"❌ Failed to log token usage: {e}")
-        print(f"✅ Logged token usage for model: {model}")
+def _upgrade_csv_header():
+    """Rewrite a CSV started with an older header, padding its rows, so new rows line up"""
+    with open(TOKEN_LOG_PATH, mode="r", newline="") as csvfile:
+        header = next(csv.reader(csvfile), None)
+        if header is None or header == CSV_HEADER:
+            return
+        temp_path = f"{TOKEN_LOG_PATH}.upgrade"
+        with open(temp_path, mode="w", newline="") as upgraded:
+            writer = csv.writer(upgraded)
+            writer.writerow(CSV_HEADER)
+            for row in csv.DictReader(csvfile, fieldnames=header):
+                writer.writerow([row.get(column) or "" for column in CSV_HEADER])
+    os.replace(temp_path, TOKEN_LOG_PATH)
+    logger.info(f"🧾 Upgraded {TOKEN_LOG_PATH} header from {len(header)} to {len(CSV_HEADER)} columns")
+
+_header_checked = False
+
+def _write_csv_rows(rows: list):
+    global _header_checked
+    os.makedirs(os.path.dirname(TOKEN_LOG_PATH), exist_ok=True)
+    file_exists = os.path.isfile(TOKEN_LOG_PATH)
+    if file_exists and not _header_checked:
+        _upgrade_csv_header()
+    _header_checked = True
+
+    with open(TOKEN_LOG_PATH, mode="a", newline="") as csvfile:
+        writer = csv.writer(csvfile)
+        if not file_exists:
+            writer.writerow(CSV_HEADER)
+        writer.writerows(
+            [r["timestamp"], r["model"], r["tokens"], r["cost"], r["prompt_tokens"], r["completion_tokens"], r["endpoint"]]
+            for r in rows
+        )
+
+class UsageWriter(BatchWriter):
+    """BatchWriter with the usage flush settings, logging to the token log"""
 
-# Optional: Summarize costs for dashboard use
+    def __init__(self, sink, flush_interval: float = USAGE_FLUSH_INTERVAL, batch_size: int = USAGE_BATCH_SIZE,
+                 max_queue: int = USAGE_QUEUE_SIZE, name: str = "usage"):
+        super().__init__(sink, flush_interval, batch_size, max_queue, name, log=logger)
+
+_migrated = False
+
+def _ensure_migrated() -> bool:
+    """Import the pre-rollup CSV history into the usage store once per process"""
+    global _migrated
+    if not _migrated:
+        try:
+            usage_store.migrate_csv(TOKEN_LOG_PATH)
+            _migrated = True
+        except Exception:
+            logger.exception("❌ Token usage CSV migration failed")
+    return _migrated
+
+def _write_usage(rows: list):
+    migrated = _ensure_migrated()
+    _write_csv_rows(rows)
+    # Until the CSV has been imported its rows reach the store through that import, not twice
+    if migrated:
+        usage_store.record_usage(rows)
+
+usage_writer = UsageWriter(_write_usage)
+atexit.register(usage_writer.close)
+
+def log_token_usage(model: str, prompt_tokens: int = 0, completion_tokens: int = 0, endpoint: str = ""):
+    """Queue one usage record; never blocks the request on file I/O"""
+    tokens = prompt_tokens + completion_tokens
+    cost_per_1k = MODEL_COSTS.get(model, 0.0025)
+    cost = round((tokens / 1000) * cost_per_1k, 6)
+    LLM_TOKENS.inc(prompt_tokens, model=model, endpoint=endpoint, kind="prompt")
+    LLM_TOKENS.inc(completion_tokens, model=model, endpoint=endpoint, kind="completion")
+    LLM_COST.inc(cost, model=model, endpoint=endpoint)
+    usage_writer.submit({
+        "ts": time.time(),
+        "timestamp": datetime.now().isoformat(),
+        "model": model,
+        "endpoint": endpoint,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "tokens": tokens,
+        "cost": cost
+    })
+
+# Summaries for dashboard use, served from the rollup store
 def summarize_token_usage():
-    summary = defaultdict(lambda: {"tokens": 0, "cost": 0.0})
     try:
-        with open(TOKEN_LOG_PATH, mode="r") as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                model = row["Model"]
-                summary[model]["tokens"] += int(row["Tokens"])
-                summary[model]["cost"] += float(row["Cost"])
-        return dict(summary)
+        _ensure_migrated()
+        return {
+            model: {"tokens": data["tokens"], "cost": data["cost"]}
+            for model, data in usage_store.summarize().items()
+        }
     except Exception as e:
         logger.exception("❌ Error summarizing token usage")
         return {}
 
+def query_token_usage(start: float, end: float, bucket: str = "hour", model: str = None, endpoint: str = None):
+    """Per-bucket usage between two epoch timestamps"""
+    _ensure_migrated()
+    return usage_store.query(start, end, bucket, model, endpoint)
+
 # Future: send to monitoring dashboard
 # summary = summarize_token_usage()
 # for model, data in summary.items():
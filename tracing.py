@@ -0,0 +1,194 @@
+# tracing.py - Lightweight request tracing exported as a Chrome trace file
+#
+# Open logs/traces.json in chrome://tracing or https://ui.perfetto.dev: each process
+# (frontend, backend) is a row group and each trace id gets its own row of nested spans.
+import os
+import json
+import atexit
+import time
+import uuid
+import re
+import random
+import logging
+import threading
+from contextvars import ContextVar
+from contextlib import ContextDecorator
+from batch_writer import BatchWriter
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+TRACING = os.getenv("TRACING", "true").lower() in ("1", "true", "yes")
+TRACE_PATH = os.getenv("TRACE_PATH", "logs/traces.json")
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+TRACE_MAX_BYTES = int(os.getenv("TRACE_MAX_BYTES", str(50 * 1024 * 1024)))
+TRACE_HEADER = "X-Trace-Id"
+_VALID_TRACE_ID = re.compile(r"^[0-9a-f]{16,64}$")
+
+# (trace_id, span_id) of the innermost open span, or None outside a trace
+_current = ContextVar("trace_span", default=None)
+_announced = set()
+_announce_lock = threading.Lock()
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex
+
+def current_trace_id():
+    context = _current.get()
+    return context[0] if context else None
+
+def propagation_headers() -> dict:
+    """Headers carrying the active trace id to the next hop"""
+    trace_id = current_trace_id()
+    return {TRACE_HEADER: trace_id} if trace_id else {}
+
+def _row(trace_id: str) -> int:
+    # Chrome trace rows (tids) are integers; one row per trace keeps concurrent requests apart
+    return int(trace_id[:7], 16)
+
+def _append_events(path: str, events: list):
+    if os.path.exists(path) and os.path.getsize(path) >= TRACE_MAX_BYTES:
+        os.replace(path, f"{path}.1")
+    # The JSON array format allows the closing bracket to be missing, so the file stays appendable
+    new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(("[\n" if new_file else "") + "".join(json.dumps(e, default=str) + ",\n" for e in events))
+
+def _write_events(events: list):
+    directory = os.path.dirname(TRACE_PATH)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    if fcntl is None:
+        # No inter-process lock: each process writes a trace file of its own
+        root, ext = os.path.splitext(TRACE_PATH)
+        _append_events(f"{root}.{os.getpid()}{ext}", events)
+        return
+    # Frontend, backend and ingestion workers share the file; rotation and the "[" header happen under the lock
+    with open(f"{TRACE_PATH}.lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            _append_events(TRACE_PATH, events)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+trace_writer = BatchWriter(_write_events, name="trace")
+atexit.register(trace_writer.close)
+
+def _announce(service: str, trace_id: str, root_name: str):
+    """Name this process and the trace's row the first time they appear"""
+    pid = os.getpid()
+    with _announce_lock:
+        if pid not in _announced:
+            _announced.add(pid)
+            trace_writer.submit({"ph": "M", "name": "process_name", "pid": pid, "tid": 0,
+                                 "args": {"name": f"{service} ({pid})"}})
+    trace_writer.submit({"ph": "M", "name": "thread_name", "pid": pid, "tid": _row(trace_id),
+                         "args": {"name": f"{root_name} {trace_id[:12]}"}})
+
+class span(ContextDecorator):
+    """Time a block or function as a child of the active span; a no-op outside a trace.
+
+    Attributes passed as keywords (or added to .attrs while open) land in the event's args.
+    """
+
+    def __init__(self, name: str, **attrs):
+        self.name = name
+        self.attrs = attrs
+        self._parent = None
+        self._span_id = None
+        self._started = None
+
+    def _recreate_cm(self):
+        return span(self.name, **self.attrs)
+
+    def __enter__(self):
+        self._parent = _current.get()
+        if self._parent is not None:
+            self._span_id = uuid.uuid4().hex[:16]
+            self._started = time.time()
+            _current.set((self._parent[0], self._span_id))
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._parent is None:
+            return False
+        finished = time.time()
+        # Restore by value, not by token: streaming generators may resume in a copied context
+        _current.set(self._parent)
+        trace_id, parent_id = self._parent
+        args = {"trace_id": trace_id, "span_id": self._span_id, "parent_id": parent_id, **self.attrs}
+        if exc_type is not None:
+            args["error"] = f"{exc_type.__name__}: {exc}"
+        trace_writer.submit({
+            "name": self.name, "cat": "span", "ph": "X",
+            "ts": round(self._started * 1e6), "dur": round((finished - self._started) * 1e6),
+            "pid": os.getpid(), "tid": _row(trace_id), "args": args
+        })
+        return False
+
+class trace(span):
+    """Root span of a trace: reuses an incoming trace id or starts a new one, subject to sampling"""
+
+    def __init__(self, name: str, trace_id: str = None, service: str = "backend", **attrs):
+        super().__init__(name, **attrs)
+        # Incoming ids come from request headers: accept only the hex ids we generate ourselves
+        self.trace_id = trace_id if trace_id and _VALID_TRACE_ID.match(trace_id) else new_trace_id()
+        self.service = service
+        self._token = None
+
+    def _recreate_cm(self):
+        return trace(self.name, None, self.service, **self.attrs)
+
+    def __enter__(self):
+        if not TRACING or random.random() >= TRACE_SAMPLE_RATE:
+            return self
+        _announce(self.service, self.trace_id, self.name)
+        # A virtual parent so the root span reports the caller's trace id and no parent span
+        self._token = _current.set((self.trace_id, None))
+        return super().__enter__()
+
+    def __exit__(self, exc_type, exc, tb):
+        super().__exit__(exc_type, exc, tb)
+        if self._token is not None:
+            _current.reset(self._token)
+            self._token = None
+        return False
+
+class TracingMiddleware:
+    """ASGI middleware: one root span per request, continuing the caller's X-Trace-Id and echoing it back"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        header = TRACE_HEADER.lower().encode("latin-1")
+        incoming = next((v.decode("latin-1") for k, v in scope.get("headers", []) if k == header), None)
+        root = trace(f"{scope['method']} {scope['path']}", incoming)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(header, root.trace_id.encode("latin-1"))]
+                root.attrs["status"] = message["status"]
+            await send(message)
+
+        with root:
+            await self.app(scope, receive, send_wrapper)
+
+_record_factory = logging.getLogRecordFactory()
+
+def _record_with_trace(*args, **kwargs):
+    # Log records made inside a trace carry its id, so JSON logs can be joined to spans
+    record = _record_factory(*args, **kwargs)
+    trace_id = current_trace_id()
+    if trace_id:
+        record.trace_id = trace_id
+    return record
+
+logging.setLogRecordFactory(_record_with_trace)
@@ -0,0 +1,207 @@
+# traffic_recorder.py - Opt-in capture of live API traffic for replay load tests
+import os
+import re
+import json
+import time
+import base64
+import random
+import hashlib
+from contextvars import ContextVar
+from urllib.parse import parse_qsl, urlencode
+from logger import get_logger
+from batch_writer import BatchWriter
+
+logger = get_logger("traffic_recorder", "logs/backend.log")
+
+RECORD_TRAFFIC = os.getenv("RECORD_TRAFFIC", "false").lower() in ("1", "true", "yes")
+# Never the repo-root requests.jsonl: captures belong with the other runtime output
+RECORD_PATH = os.getenv("RECORD_PATH", "logs/requests.jsonl")
+RECORD_SAMPLE_RATE = float(os.getenv("RECORD_SAMPLE_RATE", "1.0"))
+RECORD_MAX_BYTES = int(os.getenv("RECORD_MAX_BYTES", str(50 * 1024 * 1024)))
+RECORD_BACKUPS = int(os.getenv("RECORD_BACKUPS", "5"))
+# Bodies above this are stored as size + hash only (plus form fields and file sizes for uploads)
+RECORD_MAX_BODY_BYTES = int(os.getenv("RECORD_MAX_BODY_BYTES", str(1024 * 1024)))
+# Replace every string in JSON bodies with same-length filler (keeps load shape, drops content)
+RECORD_MASK_TEXT = os.getenv("RECORD_MASK_TEXT", "false").lower() in ("1", "true", "yes")
+# Multipart form fields up to this long (e.g. action) are kept with size-only uploads; they pick the code path
+RECORD_FORM_VALUE_CHARS = int(os.getenv("RECORD_FORM_VALUE_CHARS", "64"))
+# Keep uploaded files byte for byte; off by default because uploads can carry secrets the scrubber cannot see
+RECORD_RAW_UPLOADS = os.getenv("RECORD_RAW_UPLOADS", "false").lower() in ("1", "true", "yes")
+RECORD_EXCLUDE = tuple(p for p in os.getenv(
+    "RECORD_EXCLUDE", "/ready,/usage,/cache_stats,/upstream_stats,/docs,/openapi.json,/metrics"
+).split(",") if p)
+
+SENSITIVE_KEYS = re.compile(r"(authorization|api[_-]?key|token|secret|password|cookie)", re.IGNORECASE)
+SENSITIVE_TEXT = [
+    (re.compile(r"Bearer\s+[A-Za-z0-9._\-]+"), "Bearer [REDACTED]"),
+    (re.compile(r"\b(sk|pk|euri)-[A-Za-z0-9_\-]{16,}\b"), "[REDACTED_KEY]"),
+    (re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+"), "[REDACTED_EMAIL]")
+]
+
+# Upstream attempts (latency, status) made on behalf of the current request
+_upstream_calls = ContextVar("upstream_calls", default=None)
+
+def note_upstream(latency: float, status):
+    """UpstreamGuard observer: attribute one upstream attempt to the request being recorded"""
+    calls = _upstream_calls.get()
+    if calls is not None:
+        calls.append((latency, status))
+
+def _scrub_text(value: str) -> str:
+    for pattern, replacement in SENSITIVE_TEXT:
+        value = pattern.sub(replacement, value)
+    return value
+
+def sanitize(value, key: str = ""):
+    """Redact secrets from a decoded JSON body, masking all text when RECORD_MASK_TEXT is on"""
+    if key and SENSITIVE_KEYS.search(key):
+        return "[REDACTED]"
+    if isinstance(value, dict):
+        return {k: sanitize(v, k) for k, v in value.items()}
+    if isinstance(value, list):
+        return [sanitize(v) for v in value]
+    if isinstance(value, str):
+        return "x" * len(value) if RECORD_MASK_TEXT else _scrub_text(value)
+    return value
+
+def _sanitize_query(query: str) -> str:
+    pairs = parse_qsl(query, keep_blank_values=True)
+    return urlencode([(k, "[REDACTED]" if SENSITIVE_KEYS.search(k) else v) for k, v in pairs])
+
+def _upload_name(filename: str) -> str:
+    # The extension decides how a file is chunked, so it survives masking
+    return "upload" + os.path.splitext(filename)[1] if RECORD_MASK_TEXT else _scrub_text(filename)
+
+def _multipart_fields(body: bytes, content_type: str) -> dict:
+    """Form fields and file sizes of a multipart body, enough for replay to rebuild one of the same shape"""
+    boundary = re.search(r'boundary="?([^";]+)"?', content_type)
+    if not content_type.startswith("multipart/form-data") or boundary is None:
+        return {}
+    form, files = {}, []
+    for part in body.split(b"--" + boundary.group(1).encode("latin-1"))[1:]:
+        head, separator, content = part.partition(b"\r\n\r\n")
+        disposition = head.decode("latin-1")
+        name = re.search(r'\bname="([^"]*)"', disposition)
+        if not separator or name is None:
+            continue
+        content = content[:-2] if content.endswith(b"\r\n") else content
+        filename = re.search(r'\bfilename="([^"]*)"', disposition)
+        if filename is not None:
+            files.append({"field": name.group(1), "filename": _upload_name(filename.group(1)), "bytes": len(content)})
+        else:
+            value = content.decode("utf-8", "replace")
+            form[name.group(1)] = _scrub_text(value) if len(value) <= RECORD_FORM_VALUE_CHARS else "x" * len(value)
+    return {"form": form, "files": files} if form or files else {}
+
+def _body_fields(body: bytes, content_type: str) -> dict:
+    """How the request body is stored: sanitized JSON, size + hash + form shape (uploads) or scrubbed base64"""
+    fields = {"body_bytes": len(body)}
+    if not body:
+        return fields
+    if content_type.startswith("application/json") and len(body) <= RECORD_MAX_BODY_BYTES:
+        try:
+            fields["body"] = sanitize(json.loads(body))
+            return fields
+        except ValueError:
+            pass
+    multipart = content_type.startswith("multipart/form-data")
+    if len(body) > RECORD_MAX_BODY_BYTES or RECORD_MASK_TEXT or (multipart and not RECORD_RAW_UPLOADS):
+        # Replay rebuilds uploads of the same shape from the form fields and file sizes
+        fields["body_sha256"] = hashlib.sha256(body).hexdigest()
+        fields.update(_multipart_fields(body, content_type))
+        return fields
+    if not multipart:
+        try:
+            body = _scrub_text(body.decode("utf-8")).encode("utf-8")
+        except UnicodeDecodeError:
+            pass
+    fields["body_b64"] = base64.b64encode(body).decode("ascii")
+    return fields
+
+def _rotate(path: str):
+    for i in range(RECORD_BACKUPS - 1, 0, -1):
+        if os.path.exists(f"{path}.{i}"):
+            os.replace(f"{path}.{i}", f"{path}.{i + 1}")
+    if RECORD_BACKUPS > 0:
+        os.replace(path, f"{path}.1")
+    else:
+        os.remove(path)
+
+def _write_records(records: list):
+    directory = os.path.dirname(RECORD_PATH)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    if os.path.exists(RECORD_PATH) and os.path.getsize(RECORD_PATH) >= RECORD_MAX_BYTES:
+        _rotate(RECORD_PATH)
+    with open(RECORD_PATH, "a", encoding="utf-8") as f:
+        f.writelines(json.dumps(r, ensure_ascii=False) + "\n" for r in records)
+
+traffic_writer = BatchWriter(_write_records, name="traffic")
+
+class TrafficRecorder:
+    """ASGI middleware that appends sampled requests to RECORD_PATH as JSONL.
+
+    Captures the request body as it is read (so the app still streams it), the
+    status, time to first byte and total time including streamed bodies, and the
+    upstream calls made while serving it (via note_upstream).
+    """
+
+    def __init__(self, app, writer: BatchWriter = traffic_writer, sample_rate: float = RECORD_SAMPLE_RATE):
+        self.app = app
+        self.writer = writer
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(RECORD_EXCLUDE) or random.random() >= self.sample_rate:
+            await self.app(scope, receive, send)
+            return
+
+        started_at = time.time()
+        started = time.perf_counter()
+        body, response = [], {"status": None, "ttfb": None, "bytes": 0}
+
+        async def receive_wrapper():
+            message = await receive()
+            if message["type"] == "http.request":
+                body.append(message.get("body", b""))
+            return message
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                if response["ttfb"] is None:
+                    response["ttfb"] = time.perf_counter() - started
+                response["bytes"] += len(message.get("body", b""))
+            await send(message)
+
+        calls = []
+        token = _upstream_calls.set(calls)
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            _upstream_calls.reset(token)
+            self._record(scope, b"".join(body), response, started_at, time.perf_counter() - started, calls)
+
+    def _record(self, scope, body: bytes, response: dict, started_at: float, duration: float, calls: list):
+        try:
+            headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers", [])}
+            content_type = headers.get("content-type", "")
+            record = {
+                "ts": round(started_at, 6),
+                "method": scope["method"],
+                "path": scope["path"],
+                "query": _sanitize_query(scope.get("query_string", b"").decode("latin-1")),
+                "content_type": content_type,
+                **_body_fields(body, content_type),
+                "status": response["status"],
+                "duration_ms": round(duration * 1000, 2),
+                "ttfb_ms": round(response["ttfb"] * 1000, 2) if response["ttfb"] is not None else None,
+                "response_bytes": response["bytes"],
+                "upstream_calls": len(calls),
+                "upstream_ms": round(sum(latency for latency, _ in calls) * 1000, 2),
+                "upstream_statuses": [status for _, status in calls]
+            }
+            self.writer.submit(record)
+        except Exception:
+            logger.exception("❌ Failed to record request")
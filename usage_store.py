@@ -0,0 +1,177 @@
+# usage_store.py - Time-bucketed token usage rollups in SQLite
+import os
+import csv
+import sqlite3
+import threading
+from datetime import datetime
+from collections import defaultdict
+import logging
+
+USAGE_DB_PATH = os.getenv("USAGE_DB_PATH", "data/usage.db")
+
+# Bucket name -> width in seconds
+BUCKETS = {"minute": 60, "hour": 3600, "day": 86400}
+
+logger = logging.getLogger("token_utils")
+
+_local = threading.local()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage_rollups (
+    bucket TEXT NOT NULL,
+    bucket_start INTEGER NOT NULL,
+    model TEXT NOT NULL,
+    endpoint TEXT NOT NULL,
+    calls INTEGER NOT NULL DEFAULT 0,
+    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+    completion_tokens INTEGER NOT NULL DEFAULT 0,
+    tokens INTEGER NOT NULL DEFAULT 0,
+    cost REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (bucket, bucket_start, model, endpoint)
+);
+CREATE TABLE IF NOT EXISTS usage_totals (
+    model TEXT NOT NULL,
+    endpoint TEXT NOT NULL,
+    calls INTEGER NOT NULL DEFAULT 0,
+    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+    completion_tokens INTEGER NOT NULL DEFAULT 0,
+    tokens INTEGER NOT NULL DEFAULT 0,
+    cost REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (model, endpoint)
+);
+CREATE TABLE IF NOT EXISTS usage_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+_COUNTERS = ("calls", "prompt_tokens", "completion_tokens", "tokens", "cost")
+_ADD = ", ".join(f"{c} = {c} + excluded.{c}" for c in _COUNTERS)
+
+def _connect() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(USAGE_DB_PATH) or ".", exist_ok=True)
+        conn = sqlite3.connect(USAGE_DB_PATH, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        _local.conn = conn
+    return conn
+
+def _aggregate(records: list):
+    """Collapse records into per-bucket and per-(model, endpoint) counter sums"""
+    rollups = defaultdict(lambda: [0, 0, 0, 0, 0.0])
+    totals = defaultdict(lambda: [0, 0, 0, 0, 0.0])
+    for r in records:
+        values = (1, r["prompt_tokens"], r["completion_tokens"], r["tokens"], r["cost"])
+        key = (r["model"], r["endpoint"] or "")
+        targets = [totals[key]]
+        for bucket, width in BUCKETS.items():
+            targets.append(rollups[(bucket, int(r["ts"] // width * width)) + key])
+        for target in targets:
+            for i, value in enumerate(values):
+                target[i] += value
+    return rollups, totals
+
+def _apply(conn: sqlite3.Connection, records: list):
+    rollups, totals = _aggregate(records)
+    conn.executemany(
+        f"INSERT INTO usage_rollups (bucket, bucket_start, model, endpoint, {', '.join(_COUNTERS)}) "
+        f"VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+        f"ON CONFLICT(bucket, bucket_start, model, endpoint) DO UPDATE SET {_ADD}",
+        [key + tuple(values) for key, values in rollups.items()]
+    )
+    conn.executemany(
+        f"INSERT INTO usage_totals (model, endpoint, {', '.join(_COUNTERS)}) "
+        f"VALUES (?, ?, ?, ?, ?, ?, ?) "
+        f"ON CONFLICT(model, endpoint) DO UPDATE SET {_ADD}",
+        [key + tuple(values) for key, values in totals.items()]
+    )
+
+def record_usage(records: list):
+    """Add a batch of usage records to every rollup in one transaction"""
+    if not records:
+        return
+    conn = _connect()
+    with conn:
+        _apply(conn, records)
+
+def migrate_csv(csv_path: str) -> int:
+    """One-time import of a legacy token_usage.csv; returns the number of rows imported"""
+    if not os.path.isfile(csv_path):
+        return 0
+    marker = f"csv_migrated:{os.path.abspath(csv_path)}"
+    conn = _connect()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if conn.execute("SELECT 1 FROM usage_meta WHERE key = ?", (marker,)).fetchone():
+            conn.rollback()
+            return 0
+
+        records, imported = [], 0
+        with open(csv_path, mode="r", newline="") as csvfile:
+            for row in csv.DictReader(csvfile):
+                try:
+                    tokens = int(row["Tokens"])
+                    records.append({
+                        "ts": datetime.fromisoformat(row["Timestamp"]).timestamp(),
+                        "model": row["Model"],
+                        "endpoint": row.get("Endpoint") or "",
+                        "prompt_tokens": int(row.get("PromptTokens") or 0),
+                        "completion_tokens": int(row.get("CompletionTokens") or 0),
+                        "tokens": tokens,
+                        "cost": float(row["Cost"])
+                    })
+                except (KeyError, TypeError, ValueError):
+                    continue
+                imported += 1
+                if len(records) >= 10000:
+                    _apply(conn, records)
+                    records = []
+        _apply(conn, records)
+        conn.execute(
+            "INSERT INTO usage_meta (key, value) VALUES (?, ?)", (marker, datetime.now().isoformat())
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    logger.info(f"Migrated {imported} rows from token usage CSV {csv_path}")
+    return imported
+
+def summarize(by_endpoint: bool = False) -> dict:
+    """Totals per model (or per (model, endpoint)); reads only the small totals table"""
+    rows = _connect().execute(
+        "SELECT model, endpoint, calls, prompt_tokens, completion_tokens, tokens, cost FROM usage_totals"
+    ).fetchall()
+    summary = defaultdict(lambda: {c: 0 for c in _COUNTERS})
+    for row in rows:
+        key = (row["model"], row["endpoint"]) if by_endpoint else row["model"]
+        for c in _COUNTERS:
+            summary[key][c] += row[c]
+    return dict(summary)
+
+def query(start: float, end: float, bucket: str = "hour", model: str = None, endpoint: str = None) -> list:
+    """Rollup rows with start <= bucket_start < end, served from the primary key index"""
+    if bucket not in BUCKETS:
+        raise ValueError(f"Unknown bucket '{bucket}', expected one of {list(BUCKETS)}")
+    sql = (
+        "SELECT bucket_start, model, endpoint, calls, prompt_tokens, completion_tokens, tokens, cost "
+        "FROM usage_rollups WHERE bucket = ? AND bucket_start >= ? AND bucket_start < ?"
+    )
+    params = [bucket, int(start), int(end)]
+    if model:
+        sql += " AND model = ?"
+        params.append(model)
+    if endpoint:
+        sql += " AND endpoint = ?"
+        params.append(endpoint)
+    sql += " ORDER BY bucket_start"
+    return [dict(row) for row in _connect().execute(sql, params)]
+
+if __name__ == "__main__":
+    import sys
+    from token_utils import TOKEN_LOG_PATH
+    path = sys.argv[1] if len(sys.argv) > 1 else TOKEN_LOG_PATH
+    print(f"Imported {migrate_csv(path)} rows from {path}")
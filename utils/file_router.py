@@ -26,6 +26,11 @@ def handle_uploaded_file(file_path: str, action: str) -> str:
                 return document_code(content)
             elif action == "modularize":
                 return modularize_code(content)
+            elif action == "rag":
+                # Chunked along module/class/function boundaries so whole functions are retrieved
+                default_question = "What does this module do? Summarize its main classes and functions."
+                return get_rag_context(document_text=content, question=default_question,
+                                       filename=os.path.basename(file_path))
             else:
                 return f"❌ Unknown action for Python file: {action}"
 